@@ -7,6 +7,12 @@ from urllib.parse import urljoin
 # region constants
 
 DISCORD_ID = 1039038199881810040
+# Discord allows a rich presence update every DISCORD_UPDATE_INTERVAL secs;
+# connecting to Discord is retried after DISCORD_RECONNECT_DELAY secs, doubling
+# up to DISCORD_MAX_RECONNECT_DELAY
+DISCORD_UPDATE_INTERVAL = 15  # secs
+DISCORD_RECONNECT_DELAY = 1  # secs
+DISCORD_MAX_RECONNECT_DELAY = 60  # secs
 
 PROMPT_MODES_LIST = ["insert", "append", "tag", "find"]
 PROMPT_MODES = {mode: i for i, mode in enumerate(PROMPT_MODES_LIST)}
@@ -41,6 +47,15 @@ METADATA_KEYS = (
     "#bitspersample",
     "#samplerate",
 )
+# cached in config.METADATA_INDEX_PATH so reading them doesn't open the file
+INDEXED_METADATA_KEYS = (
+    "artist",
+    "album",
+    "albumartist",
+    "#length",
+    "genre",
+    "year",
+)
 INDIC_SCRIPTS = (
     "bengali",
     "assamese",
@@ -81,11 +96,47 @@ DEFAULT_SETTINGS = {
 
 OLD_SONGS_INFO_PATH = os.path.join(MAESTRO_DIR, "songs.txt")
 SONGS_INFO_PATH = os.path.join(MAESTRO_DIR, "songs.json")
+SONGS_JOURNAL_PATH = os.path.join(MAESTRO_DIR, "songs.journal")
+# where the journal is moved while it's being compacted
+SONGS_COMPACTING_JOURNAL_PATH = SONGS_JOURNAL_PATH + ".compacting"
+# used instead of SONGS_INFO_PATH if it exists, see 'maestro convert-data'
+SONGS_DB_PATH = os.path.join(MAESTRO_DIR, "songs.db")
+METADATA_INDEX_PATH = os.path.join(MAESTRO_DIR, "metadata-index.json")
+FINGERPRINT_INDEX_PATH = os.path.join(MAESTRO_DIR, "fingerprints.json")
+SPECTROGRAM_CACHE_DIR = os.path.join(MAESTRO_DIR, "spectrograms/")
+ARTWORK_CACHE_DIR = os.path.join(MAESTRO_DIR, "artwork/")
 OLD_STATS_DIR = os.path.join(MAESTRO_DIR, "stats/")
 OVERRIDE_LYRICS_DIR = os.path.join(MAESTRO_DIR, "override-lyrics/")
 TRANSLATED_LYRICS_DIR = os.path.join(MAESTRO_DIR, "translated-lyrics/")
 # endregion
 
+# compact the journal into config.SONGS_INFO_PATH once it's bigger than this
+# fraction of the latter (or of JOURNAL_MIN_COMPACT_SIZE, for small libraries)
+JOURNAL_COMPACT_RATIO = 0.5
+JOURNAL_MIN_COMPACT_SIZE = 64 * 1024  # bytes
+
+# threads used to write changed song metadata (tags) back to the audio files
+METADATA_SAVE_WORKERS = 8
+# threads used to copy/move files when adding multiple songs at once
+IMPORT_WORKERS = 8
+IMPORT_WRITE_BATCH = 50  # imported songs whose tags are saved at once
+# processes used to fingerprint audio for duplicate detection (None: one per
+# CPU)
+FINGERPRINT_WORKERS = None
+# processes used to build the artwork cache ('maestro artwork --build-cache';
+# None: one per CPU)
+ARTWORK_WORKERS = None
+
+# lyrics are searched for on LYRICS_WORKERS threads, trying each provider in
+# order; requests to each provider are limited to LYRICS_PROVIDER_RATE/sec and
+# retried LYRICS_RETRIES times, waiting LYRICS_RETRY_BACKOFF secs (doubling)
+LYRICS_PROVIDERS = ("Musixmatch", "Lrclib", "NetEase", "Megalobiz")
+LYRICS_WORKERS = 8
+LYRICS_PROVIDER_RATE = 4
+LYRICS_RETRIES = 2
+LYRICS_RETRY_BACKOFF = 1
+LYRICS_WRITE_BATCH = 50  # songs whose lyrics are saved to their files at once
+
 # region player
 HORIZONTAL_BLOCKS = {
     1: "▏",
@@ -100,6 +151,13 @@ HORIZONTAL_BLOCKS = {
 SCRUB_TIME = 5  # in seconds
 VOLUME_STEP = 1
 MIN_PROGRESS_BAR_WIDTH = 20
+
+# the next song is opened in the background this long before the current one
+# ends, so the player can switch to it without a gap; songs are faded into the
+# next over CROSSFADE secs (0: no crossfade), e.g. `maestro play --crossfade 5`
+PRELOAD_TIME = 10  # secs
+CROSSFADE = 0  # secs
+
 MIN_VOLUME_BAR_WIDTH, MAX_VOLUME_BAR_WIDTH = 10, 40
 LYRIC_PADDING = 3
 
@@ -202,11 +260,68 @@ WAVEFORM_HEIGHT = 6  # should also divide 80
 
 VIS_FLATTEN_FACTOR = 3  # higher = more flattening; 1 = no flattening
 WAVEFORM_FLATTEN_FACTOR = 20
+
+# least recently used spectrograms are evicted from
+# config.SPECTROGRAM_CACHE_DIR past this size; a 4-minute song is ~30 MiB
+SPECTROGRAM_CACHE_MAX_SIZE = 2 * 2**30  # bytes
+
+# song artwork is cached in config.ARTWORK_CACHE_DIR as JPEGs resized to fit in
+# each of these (px); the player shows and uploads the first
+ARTWORK_SIZES = (1024, 512, 256)
+ARTWORK_QUALITY = 95  # JPEG quality, 1-95
+
+# the visualizer spectrograms and streaming audio of the current song and the
+# next AUDIO_LOOKAHEAD songs are prepared in the background on AUDIO_WORKERS
+# threads, the current song first
+AUDIO_LOOKAHEAD = 4
+AUDIO_WORKERS = 2
+
+# spectrograms are computed VIS_BLOCK_SIZE frames at a time, starting with the
+# VIS_LOOKAHEAD seconds after the position being visualized
+VIS_BLOCK_SIZE = FPS
+VIS_LOOKAHEAD = 5  # secs
+
+# each bar of the visualizer is the loudest frequency in one of a bank of
+# bands spaced evenly on VIS_FREQ_SCALE ("log" or "mel") between these
+VIS_FREQ_SCALE = "log"
+VIS_MIN_FREQ = 40  # Hz
+VIS_MAX_FREQ = 15000  # Hz; at most VIS_SAMPLE_RATE / 2
+
+# redraws just for playback progress (e.g. the visualizer) are slowed down so
+# that drawing takes at most this fraction of the player's time, leaving the
+# rest for handling input
+RENDER_BUDGET = 0.5
+# otherwise only the parts of the screen that playback progress changes (the
+# progress bar, visualizer, and lyrics) are redrawn
+FULL_REDRAW_INTERVAL = 1  # secs
+# the player sleeps until there's input or something to do, but wakes up at
+# least this often while paused, e.g. to notice the terminal being resized
+IDLE_WAKE_INTERVAL = 1  # secs
+# on Windows, where the terminal can't be waited on, it's polled this often
+INPUT_POLL_INTERVAL = 0.01  # secs
 # endregion
 
 # region stream
 STREAM_SAMPLE_RATE = 44100
-STREAM_CHUNK_SIZE = 256
+# PCM is sent to FFmpeg STREAM_CHUNK_SIZE frames (~93 ms) at a time, paced in
+# real time STREAM_LEAD secs ahead, with up to STREAM_QUEUE_SIZE chunks queued
+STREAM_CHUNK_SIZE = 4096
+STREAM_QUEUE_SIZE = 8
+STREAM_LEAD = 0.25  # secs
+# songs are decoded for streaming STREAM_BLOCK_SIZE frames (~1.5 s) at a time,
+# resampling STREAM_RESAMPLE_MARGIN more frames on both sides so the blocks
+# join up seamlessly
+STREAM_BLOCK_SIZE = 16 * STREAM_CHUNK_SIZE
+STREAM_RESAMPLE_MARGIN = 1024
+
+# requests to maestro's servers reuse up to HTTP_POOL_SIZE keep-alive
+# connections per host, and time out after HTTP_TIMEOUT secs; failed stream
+# metadata/artwork updates are retried after UPLINK_RETRY_BACKOFF secs,
+# doubling up to UPLINK_MAX_BACKOFF, unless a newer update replaces them
+HTTP_POOL_SIZE = 4
+HTTP_TIMEOUT = 5  # secs
+UPLINK_RETRY_BACKOFF = 1  # secs
+UPLINK_MAX_BACKOFF = 60  # secs
 
 ICECAST_SERVER = (
     "maestro-icecast.eastus2.cloudapp.azure.com"  # Azure-hosted Icecast server
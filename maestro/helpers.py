@@ -5,17 +5,23 @@ import curses
 import logging
 import os
 import subprocess
+import sys
 import threading
+import weakref
 
 logging.disable(logging.CRITICAL)
 
 import click
 import msgspec
 
+from collections import deque
+from functools import partial
 from getpass import getpass
-from random import randint
-from time import sleep, time
-from typing import Iterable
+from math import gcd
+from random import randint, random
+from time import monotonic, sleep, time
+from types import MappingProxyType
+from typing import Iterable, Mapping
 from urllib.parse import quote, quote_plus
 
 from maestro import config
@@ -24,8 +30,47 @@ from maestro.config import print_to_logfile
 # endregion
 
 
+class ListenTimes(Mapping):
+    """
+    Read-only view of a song's stats, which are stored with string keys (JSON
+    object keys), that accepts/returns years as ints.
+    """
+
+    def __init__(self, stats: dict[str, float]):
+        self._stats = stats
+
+    def __getitem__(self, key):
+        return self._stats[str(key)]
+
+    def __iter__(self):
+        for key in self._stats:
+            yield int(key) if key.isdigit() else key
+
+    def __len__(self):
+        return len(self._stats)
+
+
 class Song:
+    """
+    Instances are interned: `Song(song_id)` returns the existing instance for
+    `song_id` if there is one, so unsaved changes are never split across
+    copies.
+    """
+
+    _instances = weakref.WeakValueDictionary()
+    _instances_lock = threading.Lock()
+
+    def __new__(cls, song_id: int):
+        with cls._instances_lock:
+            song = cls._instances.get(song_id)
+            if song is None:
+                song = super().__new__(cls)
+                cls._instances[song_id] = song
+            return song
+
     def __init__(self, song_id: int):
+        if hasattr(self, "_song_id"):  # interned instance, already set up
+            return
         if song_id < 1:
             raise ValueError("Song ID must be greater than 0.")
         self._song_id = song_id
@@ -37,9 +82,10 @@ class Song:
         self._parsed_override_lyrics = False
         self._parsed_translated_lyrics = False
 
-        atexit.register(self._save)
-
     def reset(self):
+        METADATA_INDEX.invalidate(self._song_id)
+        DIRTY_SONGS.discard(self)
+
         self._metadata = None
         self._metadata_changed = False
 
@@ -77,7 +123,7 @@ class Song:
     @property
     def song_file(self):
         """e.g. song.mp3"""
-        return SONG_DATA[self._song_id]["filename"]
+        return SONG_DATA[self._song_id].filename
 
     @property
     def song_path(self):
@@ -95,44 +141,71 @@ class Song:
         old_override_lyrics_path = self.override_lyrics_path
         old_translated_lyrics_path = self.translated_lyrics_path
 
-        SONG_DATA[self._song_id]["filename"] = (
-            v + os.path.splitext(self.song_file)[1]
+        SONG_DATA.set_filename(
+            self._song_id, v + os.path.splitext(self.song_file)[1]
         )
 
-        if os.path.exists(old_path):
+        renamed = self.song_path != old_path
+        if renamed and os.path.exists(old_path):
             os.rename(old_path, self.song_path)
         if os.path.exists(old_override_lyrics_path):
             os.rename(old_override_lyrics_path, self.override_lyrics_path)
         if os.path.exists(old_translated_lyrics_path):
             os.rename(old_translated_lyrics_path, self.translated_lyrics_path)
 
-        self._load_metadata()
+        # loaded tags (e.g. passed to `SongData.add_song`) are kept unless
+        # they belong to the old path
+        if self._metadata is None or renamed:
+            self._load_metadata()
         self._metadata["tracktitle"] = v
-        self._metadata_changed = True
+        self._mark_metadata_changed()
 
     @property
-    def tags(self) -> set[str]:
-        return SONG_DATA[self._song_id]["tags"]
+    def tags(self) -> frozenset[str]:
+        """Read-only view; assign to change (keeps the tag index in sync)."""
+        return frozenset(SONG_DATA[self._song_id].tags)
 
     @tags.setter
     def tags(self, v: set[str]):
-        SONG_DATA[self._song_id]["tags"] = v
+        SONG_DATA.set_tags(self._song_id, v)
 
     @property
-    def clips(self) -> dict[str, list[int, int]]:
-        return SONG_DATA[self._song_id]["clips"]
+    def clips(self) -> Mapping[str, tuple[float, float]]:
+        """Read-only view; use `add_clip`/`remove_clip` to edit."""
+        return MappingProxyType(SONG_DATA[self._song_id].clips)
+
+    def add_clip(self, name, start, end):
+        SONG_DATA[self._song_id].clips[name] = (start, end)
+        SONG_DATA.mark_dirty(self._song_id)
+
+    def remove_clip(self, name):
+        del SONG_DATA[self._song_id].clips[name]
+        SONG_DATA.mark_dirty(self._song_id)
+
+    def clear_clips(self):
+        SONG_DATA[self._song_id].clips.clear()
+        SONG_DATA.mark_dirty(self._song_id)
 
     @property
     def set_clip(self) -> str:
-        return SONG_DATA[self._song_id]["set-clip"]
+        return SONG_DATA[self._song_id].set_clip
 
     @set_clip.setter
     def set_clip(self, v: str):
-        SONG_DATA[self._song_id]["set-clip"] = v
+        SONG_DATA[self._song_id].set_clip = v
+        SONG_DATA.mark_dirty(self._song_id)
 
     @property
-    def listen_times(self) -> dict[int | str, float]:
-        return SONG_DATA[self._song_id]["stats"]
+    def listen_times(self) -> Mapping[int | str, float]:
+        """Read-only view, keyed by year (int) or 'total'; use
+        `add_listen_time` to edit."""
+        return ListenTimes(SONG_DATA[self._song_id].stats)
+
+    def add_listen_time(self, secs):
+        stats = SONG_DATA[self._song_id].stats
+        for key in (str(config.CUR_YEAR), "total"):
+            stats[key] = stats.get(key, 0) + secs
+        SONG_DATA.mark_dirty(self._song_id)
 
     def _load_metadata(self):
         import music_tag
@@ -141,7 +214,7 @@ class Song:
 
     @property
     def artist(self):
-        return self.get_metadata("artist") or "No Artist"
+        return self.get_indexed_metadata("artist") or "No Artist"
 
     @artist.setter
     def artist(self, v):
@@ -149,7 +222,7 @@ class Song:
 
     @property
     def album(self):
-        return self.get_metadata("album") or "No Album"
+        return self.get_indexed_metadata("album") or "No Album"
 
     @album.setter
     def album(self, v):
@@ -157,7 +230,7 @@ class Song:
 
     @property
     def album_artist(self):
-        return self.get_metadata("albumartist") or "No Album Artist"
+        return self.get_indexed_metadata("albumartist") or "No Album Artist"
 
     @album_artist.setter
     def album_artist(self, v):
@@ -165,7 +238,7 @@ class Song:
 
     @property
     def duration(self):
-        return self.get_metadata("#length")
+        return self.get_indexed_metadata("#length")
 
     @property
     def artwork(self):
@@ -191,7 +264,7 @@ class Song:
         else:
             self._metadata["lyrics"] = v
         self._parsed_lyrics = False
-        self._metadata_changed = True
+        self._mark_metadata_changed()
 
     @property
     def raw_override_lyrics(self) -> str | None:
@@ -288,6 +361,16 @@ class Song:
             return self._metadata[key].first
         return self._metadata[key]
 
+    def get_indexed_metadata(self, key):
+        """
+        Like `get_metadata`, but reads `key` (one of
+        `config.INDEXED_METADATA_KEYS`) from `METADATA_INDEX` instead of
+        loading the file if the metadata hasn't already been loaded.
+        """
+        if self._metadata is not None:  # may have unsaved changes
+            return self.get_metadata(key)
+        return METADATA_INDEX.get(self, key)
+
     def set_metadata(self, key, value):
         if self._metadata is None:
             self._load_metadata()
@@ -307,282 +390,2777 @@ class Song:
         else:
             self._metadata[key] = value
 
-        self._metadata_changed = True
+        self._mark_metadata_changed()
 
     def remove_from_data(self):
         del SONG_DATA[self.song_id]
 
+    def _mark_metadata_changed(self):
+        self._metadata_changed = True
+        DIRTY_SONGS.add(self)
+
     def _save(self):
+        """Write changed metadata to the file. Called by `DIRTY_SONGS`."""
         if self._metadata_changed:
             self._metadata.save()
+            self._metadata_changed = False
 
 
-class SongData:
+class MetadataIndex:
+    """
+    Persistent cache of `config.INDEXED_METADATA_KEYS` for every song, keyed by
+    song ID. Each entry is invalidated by the song file's mtime/size, so
+    filtering/listing doesn't have to open (and parse) every audio file.
+    """
+
     def __init__(self):
-        self.songs = None
+        self.entries = None
+        self._changed = False
+        self._validated = set()  # song IDs stat-checked in this process
         atexit.register(self._save)
 
     def load(self):
-        self.songs = {}
-        with open(config.SONGS_INFO_PATH, "r", encoding="utf-8") as f:
+        self.entries = {}
+        self._validated.clear()
+        if not os.path.exists(config.METADATA_INDEX_PATH):
+            return
+        with open(config.METADATA_INDEX_PATH, "rb") as f:
             s = f.read()
             if not s:
                 return
-            d = msgspec.json.decode(s)
+            try:
+                d = msgspec.json.decode(s)
+            except msgspec.DecodeError as e:
+                print_to_logfile("Corrupted metadata index, rebuilding:", e)
+                self._changed = True
+                return
             for k, v in d.items():
-                self.songs[int(k)] = v
+                self.entries[int(k)] = v
 
-                if "tags" not in v:
-                    v["tags"] = set()
-                else:
-                    v["tags"] = set(v["tags"])
-
-                v["stats_"] = {}
-                for year in v["stats"]:
-                    if year.isdigit():
-                        v["stats_"][int(year)] = v["stats"][year]
-                    else:
-                        v["stats_"][year] = v["stats"][year]
-                v["stats"] = v.pop("stats_")
-                if "set-clip" not in v:
-                    v["set-clip"] = "default"
-
-    def __getitem__(self, key):
-        if self.songs is None:
-            self.load()
-        return self.songs[key]
-
-    def __setitem__(self, key, value):
-        if self.songs is None:
+    def get(self, song: Song, key):
+        if self.entries is None:
             self.load()
-        self.songs[key] = value
 
-    def __delitem__(self, key):
-        if self.songs is None:
-            self.load()
-        del self.songs[key]
+        song_id = song.song_id
+        if song_id not in self._validated:
+            entry = self.entries.get(song_id)
+            try:
+                st = os.stat(song.song_path)
+            except OSError:  # let music_tag raise the appropriate error
+                return song.get_metadata(key)
+            if (
+                entry is None
+                or entry["mtime"] != st.st_mtime_ns
+                or entry["size"] != st.st_size
+            ):
+                self.update(song, st)
+            self._validated.add(song_id)
 
-    def __iter__(self):
-        if self.songs is None:
-            self.load()
-        return iter(self.songs)
+        return self.entries[song_id]["metadata"].get(key)
 
-    def items(self):
-        if self.songs is None:
+    def update(self, song: Song, st=None):
+        """(Re)index `song`, loading its metadata from the file."""
+        if self.entries is None:
             self.load()
-        return self.songs.items()
+        if st is None:
+            st = os.stat(song.song_path)
+
+        was_loaded = song._metadata is not None  # pylint: disable=protected-access
+        song_metadata = {}
+        for key in config.INDEXED_METADATA_KEYS:
+            value = song.get_metadata(key)
+            # music_tag returns e.g. `year` as int and `#length` as float
+            if not isinstance(value, (str, int, float)):
+                value = None if value is None else str(value)
+            song_metadata[key] = value
+        if not was_loaded:  # don't keep every indexed file's tags in memory
+            song._metadata = None  # pylint: disable=protected-access
+
+        self.entries[song.song_id] = {
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "metadata": song_metadata,
+        }
+        self._validated.add(song.song_id)
+        self._changed = True
 
-    def values(self):
-        if self.songs is None:
-            self.load()
-        return self.songs.values()
+    def invalidate(self, song_id):
+        self._validated.discard(song_id)
 
     def _save(self):
         import safer
 
-        if self.songs is not None:
-            with safer.open(config.SONGS_INFO_PATH, "wb") as f:
-                f.write(msgspec.json.encode(self.songs))
-
-    def add_song(self, filename, tags=None):
-        if tags is None:
-            tags = set()
-
-        if self.songs is None:
-            self.load()
-        if not self.songs:
-            song_id = 1
-        else:
-            song_id = max(self) + 1
-        self.songs[song_id] = {
-            "filename": os.path.split(filename)[1],
-            "tags": set(tags),
-            "clips": {},
-            "stats": {
-                config.CUR_YEAR: 0.0,
-                "total": 0.0,
-            },
-            "set-clip": "default",
-        }
+        if self.entries is None or not self._changed:
+            return
 
-        song = Song(song_id)
-        song.set_metadata("tracktitle", song.song_title)
+        if SONG_DATA.is_loaded:  # prune removed songs
+            for song_id in list(self.entries):
+                if song_id not in SONG_DATA:
+                    del self.entries[song_id]
 
-        return song
+        with safer.open(config.METADATA_INDEX_PATH, "wb") as f:
+            f.write(msgspec.json.encode(self.entries))
+        self._changed = False
 
 
-SONG_DATA = SongData()
+METADATA_INDEX = MetadataIndex()
 
 
-class Songs:
+class DirtySongs:
     """
-    Wrapper around dict of all `Song` objects.
+    Songs with unsaved metadata changes. `flush` saves them all at once, on up
+    to `config.METADATA_SAVE_WORKERS` threads since tag writes are I/O-bound.
+    Songs that fail to save stay dirty, and are returned so the caller can
+    report them. Anything left at exit is saved serially, since new threads
+    can't be started during interpreter shutdown.
     """
 
     def __init__(self):
-        self._songs = None
-        self._song_data = SONG_DATA
-
-    def load(self):
-        self._songs = {Song(k) for k in self._song_data}
+        self._songs = {}  # used as an ordered set
+        self._lock = threading.Lock()
+        # registered after METADATA_INDEX's, so runs before it saves
+        atexit.register(self.flush, parallel=False)
 
-    def __contains__(self, value: Song):
-        if self._songs is None:
-            self.load()
-        return value in self._songs
+    def add(self, song: Song):
+        with self._lock:
+            self._songs[song] = None
 
-    def __iter__(self) -> Iterable[Song]:
-        if self._songs is None:
-            self.load()
-        return iter(self._songs)
+    def discard(self, song: Song):
+        with self._lock:
+            self._songs.pop(song, None)
 
     def __len__(self):
-        if self._songs is None:
-            self.load()
         return len(self._songs)
 
+    def flush(self, parallel=True) -> list[tuple[Song, Exception]]:
+        """Save every dirty song. Returns (song, error) for each song that
+        failed to save."""
+        with self._lock:
+            songs, self._songs = list(self._songs), {}
+        if not songs:
+            return []
 
-SONGS = Songs()
+        def save(song):
+            try:
+                song._save()  # pylint: disable=protected-access
+                return None
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile(f"Failed to save metadata for {song}:", e)
+                return e
+
+        if not parallel or len(songs) == 1:
+            errors = [save(song) for song in songs]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(
+                min(config.METADATA_SAVE_WORKERS, len(songs))
+            ) as executor:
+                errors = list(executor.map(save, songs))
+
+        failed = []
+        # on this thread, since METADATA_INDEX isn't thread-safe
+        for song, error in zip(songs, errors):
+            if error is None:
+                METADATA_INDEX.update(song)
+            else:
+                self.add(song)  # so the change isn't lost
+                failed.append((song, error))
+        return failed
+
+
+DIRTY_SONGS = DirtySongs()
+
+
+def _id3v2_size(header: bytes) -> int:
+    """Total size of the ID3v2 tag starting with the 10-byte `header`."""
+    size = 0
+    for b in header[6:10]:  # syncsafe integer
+        size = (size << 7) | (b & 0x7F)
+    return 10 + size + (10 if header[5] & 0x10 else 0)  # footer
+
+
+def _skip_id3v2(f) -> int:
+    pos = 0
+    f.seek(0)
+    header = f.read(10)
+    while len(header) == 10 and header[:3] == b"ID3":
+        pos += _id3v2_size(header)
+        f.seek(pos)
+        header = f.read(10)
+    return pos
+
+
+def _mp3_audio_ranges(f, size):
+    start, end = _skip_id3v2(f), size
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b"TAG":  # ID3v1
+            end -= 128
+    if end - start >= 32:
+        f.seek(end - 32)
+        footer = f.read(32)
+        if footer[:8] == b"APETAGEX":
+            end -= int.from_bytes(footer[12:16], "little")
+            if int.from_bytes(footer[20:24], "little") & 0x80000000:
+                end -= 32  # header
+    return [(start, end)]
+
+
+def _flac_audio_ranges(f, size):
+    pos = _skip_id3v2(f)
+    f.seek(pos)
+    if f.read(4) != b"fLaC":
+        return [(0, size)]
+    pos += 4
+    while True:  # metadata blocks, incl. Vorbis comments and pictures
+        header = f.read(4)
+        if len(header) < 4:
+            return [(0, size)]
+        pos += 4 + int.from_bytes(header[1:4], "big")
+        if header[0] & 0x80:  # last metadata block
+            return [(pos, size)]
+        f.seek(pos)
+
+
+def _wav_audio_ranges(f, size):
+    f.seek(0)
+    if f.read(4) != b"RIFF":
+        return [(0, size)]
+    ranges = []
+    pos = 12
+    while pos + 8 <= size:  # only the format and the samples, not LIST etc.
+        f.seek(pos)
+        chunk_id = f.read(4)
+        chunk_size = int.from_bytes(f.read(4), "little")
+        if chunk_id in (b"fmt ", b"data"):
+            ranges.append((pos + 8, min(pos + 8 + chunk_size, size)))
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return ranges or [(0, size)]
+
+
+def _ogg_audio_ranges(f, size):
+    # the header packets (incl. comments) can span a different number of pages
+    # depending on the tags, so hash the payloads of the audio pages, which
+    # start on the first page with a positive granule position
+    ranges = []
+    pos = 0
+    while pos + 27 <= size:
+        f.seek(pos)
+        header = f.read(27)
+        if header[:4] != b"OggS":
+            return [(0, size)]
+        lacing = f.read(header[26])
+        payload_start = pos + 27 + len(lacing)
+        pos = payload_start + sum(lacing)
+        if ranges or int.from_bytes(header[6:14], "little", signed=True) > 0:
+            ranges.append((payload_start, min(pos, size)))
+    return ranges or [(0, size)]
+
+
+def audio_fingerprint(path) -> str:
+    """
+    Hash of the audio in the file at `path`, excluding tags (ID3/APE, FLAC
+    metadata blocks, RIFF chunks other than the format and samples, Ogg header
+    pages), so copies of the same audio match regardless of name or tags.
+    """
+    import hashlib
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        ranges = {
+            ".mp3": _mp3_audio_ranges,
+            ".flac": _flac_audio_ranges,
+            ".wav": _wav_audio_ranges,
+            ".ogg": _ogg_audio_ranges,
+        }.get(os.path.splitext(path)[1].lower(), lambda f, size: [(0, size)])(
+            f, size
+        )
+        for start, end in ranges:
+            f.seek(start)
+            while start < end:
+                chunk = f.read(min(1 << 20, end - start))
+                if not chunk:
+                    break
+                h.update(chunk)
+                start += len(chunk)
+    return h.hexdigest()
 
 
-def is_safe_username(url):
-    return quote(url, safe="") == url if url else False
+def _try_audio_fingerprint(path) -> str | None:
+    try:
+        return audio_fingerprint(path)
+    except OSError:
+        return None
 
 
-def bounded_shuffle(lst, radius=-1):
+def process_map(fn, items, workers=None) -> list:
+    """`[fn(item) for item in items]`, computed on up to `workers` processes
+    (None: one per CPU)."""
+    if len(items) < 2:
+        return [fn(item) for item in items]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = min(workers or os.cpu_count(), len(items))
+    with ProcessPoolExecutor(workers) as executor:
+        return list(
+            executor.map(
+                fn, items, chunksize=max(1, len(items) // (workers * 4))
+            )
+        )
+
+
+def fingerprint_files(paths) -> list[str | None]:
     """
-    Randomly shuffle `lst`, but with the constraint that each element can only
-    move at most `radius` positions away from its original position.
+    `audio_fingerprint` for each of `paths` (None for unreadable files),
+    computed on up to `config.FINGERPRINT_WORKERS` processes.
+    """
+    return process_map(
+        _try_audio_fingerprint, paths, config.FINGERPRINT_WORKERS
+    )
 
-    To shuffle with no bounds, set `radius = -1`.
+
+class FingerprintIndex:
+    """
+    Persistent index of every song's `audio_fingerprint`, keyed by song ID.
+    Like `MetadataIndex`, each entry is invalidated by the song file's
+    mtime/size. Used to find songs with the same audio in O(1).
     """
-    n = len(lst)
-    if radius == -1:
-        radius = n
-    elif radius == 0:
-        return
 
-    index_at = list(range(n))
-    for i in range(n - 1, 0, -1):
-        j = randint(max(0, index_at[i] - radius), i)
-        index_at[j], index_at[i] = index_at[i], index_at[j]
-        lst[j], lst[i] = lst[i], lst[j]
+    def __init__(self):
+        self.entries = None
+        self._by_fingerprint = None  # fingerprint: set of song IDs
+        self._changed = False
+        # used from the player's audio workers (see `SpectrogramCache`)
+        self._lock = threading.RLock()
+        atexit.register(self._save)
+
+    def load(self):
+        with self._lock:
+            self.entries = {}
+            self._by_fingerprint = {}
+            if not os.path.exists(config.FINGERPRINT_INDEX_PATH):
+                return
+            with open(config.FINGERPRINT_INDEX_PATH, "rb") as f:
+                s = f.read()
+            if not s:
+                return
+            try:
+                d = msgspec.json.decode(s)
+            except msgspec.DecodeError as e:
+                print_to_logfile("Corrupted fingerprint index, rebuilding:", e)
+                self._changed = True
+                return
+            for k, v in d.items():
+                self._set(int(k), v)
 
+    def _set(self, song_id, entry):
+        self._unset(song_id)
+        self.entries[song_id] = entry
+        self._by_fingerprint.setdefault(entry["fingerprint"], set()).add(
+            song_id
+        )
 
-def set_timeout(func, timeout, *args, **kwargs):
-    def wrapper():
-        sleep(timeout)
-        func()
+    def _unset(self, song_id):
+        entry = self.entries.pop(song_id, None)
+        if entry is not None:
+            same = self._by_fingerprint[entry["fingerprint"]]
+            same.discard(song_id)
+            if not same:
+                del self._by_fingerprint[entry["fingerprint"]]
+
+    def add(self, song: Song, fingerprint, st=None):
+        if st is None:
+            st = os.stat(song.song_path)
+        with self._lock:
+            if self.entries is None:
+                self.load()
+            self._set(
+                song.song_id,
+                {
+                    "mtime": st.st_mtime_ns,
+                    "size": st.st_size,
+                    "fingerprint": fingerprint,
+                },
+            )
+            self._changed = True
 
-    threading.Thread(
-        target=wrapper, daemon=True, args=args, kwargs=kwargs
-    ).start()
+    def refresh(self):
+        """
+        Fingerprint every song that isn't indexed or whose file changed since
+        it was, in parallel. Returns the number of songs fingerprinted.
+        """
+        with self._lock:
+            if self.entries is None:
+                self.load()
 
+            for song_id in list(self.entries):
+                if song_id not in SONG_DATA:
+                    self._unset(song_id)
+                    self._changed = True
 
-class Scroller:
-    def __init__(self, num_lines, win_size):
-        self.num_lines = num_lines
-        self.win_size = win_size
-        self.pos = 0
-        self.top = 0
+            stale = []
+            for song in SONGS:
+                try:
+                    st = os.stat(song.song_path)
+                except OSError:
+                    continue
+                entry = self.entries.get(song.song_id)
+                if (
+                    entry is None
+                    or entry["mtime"] != st.st_mtime_ns
+                    or entry["size"] != st.st_size
+                ):
+                    stale.append((song, st))
 
-    def scroll_forward(self):
-        if self.pos < self.num_lines - 1:
+        fingerprints = fingerprint_files([song.song_path for song, _ in stale])
+        for (song, st), fingerprint in zip(stale, fingerprints):
+            if fingerprint is None:
+                print_to_logfile(f"Failed to fingerprint {song}.")
+            else:
+                self.add(song, fingerprint, st)
+        return len(stale)
+
+    def get(self, song: Song) -> str:
+        """`song`'s fingerprint, computing it if it isn't indexed or is
+        stale."""
+        st = os.stat(song.song_path)
+        with self._lock:
+            if self.entries is None:
+                self.load()
+            entry = self.entries.get(song.song_id)
             if (
-                self.pos == self.halfway
-                and self.top < self.num_lines - self.win_size
+                entry is not None
+                and entry["mtime"] == st.st_mtime_ns
+                and entry["size"] == st.st_size
             ):
-                self.top += 1
-            self.pos += 1
+                return entry["fingerprint"]
+
+        # hashed without the lock, so other songs can be looked up meanwhile
+        fingerprint = audio_fingerprint(song.song_path)
+        self.add(song, fingerprint, st)
+        return fingerprint
+
+    def find(self, fingerprint) -> set[int]:
+        """IDs of songs with `fingerprint` (call `refresh` first)."""
+        with self._lock:
+            if self.entries is None:
+                self.load()
+            return set(self._by_fingerprint.get(fingerprint, ()))
+
+    def duplicates(self) -> list[list[int]]:
+        """Sorted clusters of IDs of songs with the same audio."""
+        with self._lock:
+            if self.entries is None:
+                self.load()
+            return sorted(
+                sorted(same)
+                for same in self._by_fingerprint.values()
+                if len(same) > 1
+            )
 
-    def scroll_backward(self):
-        if self.pos > 0:
-            if self.pos == self.halfway and self.top > 0:
-                self.top -= 1
-            self.pos -= 1
+    def _save(self):
+        import safer
 
-    @property
-    def halfway(self):
-        return self.top + (self.win_size - 1) // 2
+        with self._lock:
+            if self.entries is None or not self._changed:
+                return
 
-    def resize(self, win_size=None):
-        if win_size is not None:
-            self.win_size = win_size
-        self.top = max(0, self.pos - (self.win_size - 1) // 2)
-        self.top = max(0, min(self.num_lines - self.win_size, self.top))
+            with safer.open(config.FINGERPRINT_INDEX_PATH, "wb") as f:
+                f.write(msgspec.json.encode(self.entries))
+            self._changed = False
 
-    def refresh(self):
-        self.resize()
 
+FINGERPRINT_INDEX = FingerprintIndex()
 
-def fit_string_to_width(s, width, length_so_far):
-    if length_so_far + len(s) > width:
-        remaining_width = width - length_so_far
-        if remaining_width >= 3:
-            s = s[: (remaining_width - 3)] + "..."
-        else:
-            s = "." * remaining_width
-    length_so_far += len(s)
-    return s, length_so_far
 
+def artwork_thumbnails(path) -> list[bytes]:
+    """
+    The artwork embedded in the file at `path`, resized to fit in each of
+    `config.ARTWORK_SIZES` and encoded as JPEG (empty if it has no artwork).
+    """
+    import music_tag
 
-def addstr_fit_to_width(stdscr, s, width, length_so_far, *args, **kwargs):
-    s, length_so_far = fit_string_to_width(s, width, length_so_far)
-    if s:
-        if length_so_far <= width:
-            stdscr.addstr(s, *args, **kwargs)
-        else:
-            stdscr.addstr(s[:-1], *args, **kwargs)
-            stdscr.insstr(s[-1], *args, **kwargs)
-    return length_so_far
+    m = music_tag.load_file(path)
+    if "artwork" not in m or m["artwork"].first is None:
+        return [b"" for _ in config.ARTWORK_SIZES]
 
+    from io import BytesIO
+    from PIL import Image
 
-class FFmpegProcessHandler:
-    def __init__(self, username, password):
-        self.process = None
-        self.username = username
-        self.password = password
+    image = Image.open(BytesIO(m["artwork"].first.raw)).convert("RGB")
+    thumbnails = {}
+    for size in sorted(config.ARTWORK_SIZES, reverse=True):
+        image.thumbnail((size, size), Image.BICUBIC)  # no-op if smaller
+        with BytesIO() as f:
+            image.save(f, format="JPEG", quality=config.ARTWORK_QUALITY)
+            thumbnails[size] = f.getvalue()
+    return [thumbnails[size] for size in config.ARTWORK_SIZES]
 
-    def start(self):
-        threading.Thread(target=self._start, daemon=True).start()
 
-    def _start(self):
-        from spotdl.utils.ffmpeg import get_ffmpeg_path
+def _try_artwork_thumbnails(path) -> list[bytes] | None:
+    try:
+        return artwork_thumbnails(path)
+    except Exception as e:  # unreadable file or image
+        print_to_logfile(f"Failed to read artwork of {path}:", e)
+        return None
 
-        self.process = subprocess.Popen(
-            # fmt: off
-            [
-                str(get_ffmpeg_path()),
-                "-re",  # Read input at native frame rate
-                "-f", "s16le",  # Raw PCM 16-bit little-endian audio
-                "-ar", str(config.STREAM_SAMPLE_RATE),  # Set the audio sample rate
-                "-ac", "2",  # Set the number of audio channels to 2 (stereo)
-                '-i', 'pipe:',  # Input from stdin
-                "-f", "mp3",  # Output format
-                # "-report",  # DEBUG
-                f"icecast://{self.username}:{self.password}@{config.ICECAST_SERVER}:8000/{self.username}",  # Azure-hosted maestro Icecast URL
-            ],
-            # fmt: on
-            stdin=subprocess.PIPE,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
 
-    def terminate(self):
-        if self.process is not None:
-            self.process.terminate()
-            self.process = None
+class ArtworkCache:
+    """
+    On-disk cache of song artwork in `config.ARTWORK_CACHE_DIR`, as JPEGs
+    resized to each of `config.ARTWORK_SIZES`, so getting a song's artwork is
+    a single file read instead of decoding and resizing the embedded image.
+    Keyed by song ID and the song file's mtime, so it's invalidated when the
+    song is retagged. Filled in lazily by `get`, or in bulk by `build`
+    ('maestro artwork --build-cache').
+    """
+
+    def _name(self, song_id, mtime, size):
+        # songs without artwork are cached as empty files
+        return f"{song_id}-{mtime}-{size}.jpg"
+
+    def get(self, song: Song, size=None) -> bytes | None:
+        """`song`'s artwork resized to fit in `size` (one of
+        `config.ARTWORK_SIZES`, default: the first), or None if it has
+        none."""
+        if size is None:
+            size = config.ARTWORK_SIZES[0]
+        mtime = os.stat(song.song_path).st_mtime_ns
+        try:
+            with open(
+                os.path.join(
+                    config.ARTWORK_CACHE_DIR,
+                    self._name(song.song_id, mtime, size),
+                ),
+                "rb",
+            ) as f:
+                return f.read() or None
+        except FileNotFoundError:
+            pass
+
+        thumbnails = artwork_thumbnails(song.song_path)
+        self._store(song.song_id, mtime, thumbnails)
+        self._prune({song.song_id: mtime})
+        return thumbnails[config.ARTWORK_SIZES.index(size)] or None
+
+    def _store(self, song_id, mtime, thumbnails):
+        try:
+            os.makedirs(config.ARTWORK_CACHE_DIR, exist_ok=True)
+            for size, thumbnail in zip(config.ARTWORK_SIZES, thumbnails):
+                path = os.path.join(
+                    config.ARTWORK_CACHE_DIR, self._name(song_id, mtime, size)
+                )
+                tmp_path = (
+                    f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+                )
+                with open(tmp_path, "wb") as f:
+                    f.write(thumbnail)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            print_to_logfile("Failed to cache artwork:", e)
+
+    def _prune(self, mtimes, everything=False):
+        """Remove entries for the songs in `mtimes` (song ID: current mtime)
+        that are for other mtimes, and if `everything`, entries for songs
+        that aren't in the library anymore."""
+        try:
+            with os.scandir(config.ARTWORK_CACHE_DIR) as it:
+                for entry in it:
+                    if not entry.name.endswith(".jpg"):
+                        continue
+                    song_id, mtime = map(int, entry.name.split("-", 2)[:2])
+                    if (
+                        song_id in mtimes
+                        and mtimes[song_id] != mtime
+                        or everything
+                        and song_id not in SONG_DATA
+                    ):
+                        os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print_to_logfile("Failed to prune artwork cache:", e)
+
+    def build(self, songs=None) -> tuple[int, int]:
+        """
+        Cache the artwork of each of `songs` (default: every song) that isn't
+        cached yet, on up to `config.ARTWORK_WORKERS` processes, and remove
+        stale entries. Returns (songs cached, songs that failed).
+        """
+        try:
+            cached = set(os.listdir(config.ARTWORK_CACHE_DIR))
+        except FileNotFoundError:
+            cached = set()
+
+        mtimes = {}
+        missing = []
+        for song in SONGS if songs is None else songs:
+            try:
+                mtime = os.stat(song.song_path).st_mtime_ns
+            except OSError:
+                continue
+            mtimes[song.song_id] = mtime
+            if any(
+                self._name(song.song_id, mtime, size) not in cached
+                for size in config.ARTWORK_SIZES
+            ):
+                missing.append(song)
+
+        failed = 0
+        for song, thumbnails in zip(
+            missing,
+            process_map(
+                _try_artwork_thumbnails,
+                [song.song_path for song in missing],
+                config.ARTWORK_WORKERS,
+            ),
+        ):
+            if thumbnails is None:
+                failed += 1
+            else:
+                self._store(song.song_id, mtimes[song.song_id], thumbnails)
+        self._prune(mtimes, everything=songs is None)
+        return len(missing) - failed, failed
+
+    def size(self) -> tuple[int, int]:
+        """(number of songs cached, total size in bytes)."""
+        song_ids = set()
+        total = 0
+        try:
+            with os.scandir(config.ARTWORK_CACHE_DIR) as it:
+                for entry in it:
+                    if entry.name.endswith(".jpg"):
+                        song_ids.add(entry.name.split("-", 1)[0])
+                        total += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        return len(song_ids), total
+
+    def clear(self):
+        from shutil import rmtree
+
+        rmtree(config.ARTWORK_CACHE_DIR, ignore_errors=True)
+
+
+ARTWORK_CACHE = ArtworkCache()
+
+
+class TitleIndex:
+    """
+    Case-insensitive song title index for `search_song`: a sorted array of
+    titles for exact/prefix matches (binary search) and a trigram index for
+    substring matches.
+
+    The first search is a linear scan, since a single search is cheaper than
+    building the index; the index is built on the second search.
+    """
+
+    def __init__(self, titles: dict[int, str]):
+        self._titles = {  # song ID: lowercase title
+            song_id: title.lower() for song_id, title in titles.items()
+        }
+        self._trigrams = None  # trigram: set of song IDs
+        self._sorted = None  # sorted list of (lowercase title, song ID)
+        self._searched = False
+
+    @property
+    def built(self):
+        return self._trigrams is not None
+
+    @staticmethod
+    def _get_trigrams(title):
+        return {title[i : i + 3] for i in range(len(title) - 2)}
+
+    def _index_trigrams(self, song_id, title):
+        for trigram in self._get_trigrams(title):
+            if trigram in self._trigrams:
+                self._trigrams[trigram].add(song_id)
+            else:
+                self._trigrams[trigram] = {song_id}
+
+    def build(self):
+        self._trigrams = {}
+        for song_id, title in self._titles.items():
+            self._index_trigrams(song_id, title)
+        self._sorted = sorted(
+            (title, song_id) for song_id, title in self._titles.items()
+        )
+
+    def add(self, song_id, title):
+        from bisect import insort
+
+        if song_id in self._titles:
+            self.remove(song_id)
+        title = title.lower()
+        self._titles[song_id] = title
+        if self.built:
+            self._index_trigrams(song_id, title)
+            insort(self._sorted, (title, song_id))
+
+    def remove(self, song_id):
+        from bisect import bisect_left
+
+        title = self._titles.pop(song_id)
+        if self.built:
+            for trigram in self._get_trigrams(title):
+                trigram_set = self._trigrams[trigram]
+                trigram_set.discard(song_id)
+                if not trigram_set:
+                    del self._trigrams[trigram]
+            del self._sorted[bisect_left(self._sorted, (title, song_id))]
+
+    def search(self, phrase) -> tuple[list[int], list[int], list[int]]:
+        """
+        Returns song IDs (sorted) whose title is, starts with, or contains (but
+        does not start with) `phrase`, respectively.
+        """
+        from bisect import bisect_left
+
+        phrase = phrase.lower()
+        results = [], [], []
+
+        if not self.built:
+            if self._searched:
+                self.build()
+            else:
+                self._searched = True
+                for song_id, title in self._titles.items():
+                    if title == phrase:
+                        results[0].append(song_id)
+                    elif title.startswith(phrase):
+                        results[1].append(song_id)
+                    elif phrase in title:
+                        results[2].append(song_id)
+                for result in results:
+                    result.sort()
+                return results
+
+        i = bisect_left(self._sorted, (phrase,))
+        while i < len(self._sorted) and self._sorted[i][0].startswith(phrase):
+            title, song_id = self._sorted[i]
+            results[0 if title == phrase else 1].append(song_id)
+            i += 1
+
+        if len(phrase) < 3:  # too short for trigrams, scan all titles
+            candidates = self._titles
+        else:  # only titles containing every trigram of the phrase
+            trigram_sets = sorted(
+                (
+                    self._trigrams.get(trigram, set())
+                    for trigram in self._get_trigrams(phrase)
+                ),
+                key=len,
+            )
+            candidates = trigram_sets[0].intersection(*trigram_sets[1:])
+        for song_id in candidates:
+            title = self._titles[song_id]
+            if phrase in title and not title.startswith(phrase):
+                results[2].append(song_id)
+
+        for result in results:
+            result.sort()
+        return results
+
+
+class SongRecord(msgspec.Struct, gc=False):
+    """
+    Schema of each song's entry in `config.SONGS_INFO_PATH`. Stats are keyed by
+    year (as a string) or 'total'.
+    """
+
+    filename: str
+    tags: set[str] = msgspec.field(default_factory=set)
+    clips: dict[str, tuple[float, float]] = msgspec.field(default_factory=dict)
+    stats: dict[str, float] = msgspec.field(default_factory=dict)
+    set_clip: str = msgspec.field(default="default", name="set-clip")
+
+
+class PutRecord(msgspec.Struct, tag="put", tag_field="op"):
+    id: int
+    song: SongRecord
+
+
+class DeleteRecord(msgspec.Struct, tag="del", tag_field="op"):
+    id: int
+
+
+SONGS_DECODER = msgspec.json.Decoder(dict[int, SongRecord])
+JOURNAL_DECODER = msgspec.json.Decoder(PutRecord | DeleteRecord)
+
+
+class JSONSongStore:
+    """
+    Song data in `config.SONGS_INFO_PATH`, the default store.
+
+    Changes are recorded as small put/delete records appended to
+    `config.SONGS_JOURNAL_PATH` instead of rewriting the whole file; the
+    journal is replayed on load and compacted into the main file once it
+    grows past `config.JOURNAL_COMPACT_RATIO` of the main file's size.
+    """
+
+    lazy = False  # records can only be read all at once
+    path = config.SONGS_INFO_PATH
+
+    def read(self) -> dict[int, SongRecord]:
+        """Read song data from disk, replaying the journal."""
+        with open(config.SONGS_INFO_PATH, "rb") as f:
+            s = f.read()
+        songs = SONGS_DECODER.decode(s) if s else {}
+
+        # a journal left mid-compaction (e.g. by a crash) comes first
+        for path in (
+            config.SONGS_COMPACTING_JOURNAL_PATH,
+            config.SONGS_JOURNAL_PATH,
+        ):
+            if os.path.exists(path):
+                self._replay(path, songs)
+
+        return songs
+
+    @staticmethod
+    def _replay(path, songs: dict[int, SongRecord]):
+        """Apply the journal records in `path` to `songs`."""
+        with open(path, "rb+") as f:
+            valid_length = 0
+            for line in f:
+                try:
+                    record = JOURNAL_DECODER.decode(line)
+                except msgspec.DecodeError:  # torn write, e.g. crash
+                    print_to_logfile(
+                        "Discarding corrupt song data journal record(s)."
+                    )
+                    # so that new records aren't appended to garbage
+                    f.truncate(valid_length)
+                    break
+                valid_length += len(line)
+                if isinstance(record, PutRecord):
+                    songs[record.id] = record.song
+                else:
+                    songs.pop(record.id, None)
+
+    def write(self, records: dict[int, SongRecord], deleted: Iterable[int]):
+        with open(config.SONGS_JOURNAL_PATH, "ab") as f:
+            for song_id, song in records.items():
+                f.write(msgspec.json.encode(PutRecord(song_id, song)) + b"\n")
+            for song_id in deleted:
+                f.write(msgspec.json.encode(DeleteRecord(song_id)) + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+            # not the path's size, which another process may be compacting
+            journal_size = f.tell()
+
+        if journal_size > config.JOURNAL_COMPACT_RATIO * max(
+            os.path.getsize(config.SONGS_INFO_PATH),
+            config.JOURNAL_MIN_COMPACT_SIZE,
+        ):
+            self.compact()
+
+    def compact(self):
+        """
+        Fold the journal into the main song data file.
+
+        The journal is moved aside first and only that file is removed
+        afterwards, so records appended in the meantime (e.g. by another
+        maestro process) go to a new journal instead of being lost. They're
+        also folded in if they made it into `read`, which is harmless since
+        replaying a record twice doesn't change the result.
+        """
+        import safer
+
+        if not os.path.exists(config.SONGS_COMPACTING_JOURNAL_PATH):
+            try:
+                os.replace(
+                    config.SONGS_JOURNAL_PATH,
+                    config.SONGS_COMPACTING_JOURNAL_PATH,
+                )
+            except FileNotFoundError:  # nothing to compact
+                return
+        # re-read instead of using loaded data in case another maestro process
+        # has appended to the journal since we loaded
+        songs = self.read()
+        with safer.open(config.SONGS_INFO_PATH, "wb") as f:
+            f.write(msgspec.json.encode(songs))
+        try:
+            os.remove(config.SONGS_COMPACTING_JOURNAL_PATH)
+        except FileNotFoundError:  # another process compacted it too
+            pass
+
+    def write_all(self, songs: dict[int, SongRecord]):
+        import safer
+
+        with safer.open(config.SONGS_INFO_PATH, "wb") as f:
+            f.write(msgspec.json.encode(songs))
+        for path in (
+            config.SONGS_JOURNAL_PATH,
+            config.SONGS_COMPACTING_JOURNAL_PATH,
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self):
+        pass
+
+
+class SQLiteSongStore:
+    """
+    Song data in the SQLite database `config.SONGS_DB_PATH`, used instead of
+    `JSONSongStore` if it exists (see 'maestro convert-data'). Each record is
+    stored msgpack-encoded in its own row, so single songs can be read without
+    decoding the whole library; filenames and tags get their own columns/table
+    so the title and tag indices can be built without decoding any records.
+    """
+
+    lazy = True
+    path = config.SONGS_DB_PATH
+
+    _decoder = msgspec.msgpack.Decoder(SongRecord)
+    _encoder = msgspec.msgpack.Encoder()
+
+    def __init__(self, path=None):
+        if path is not None:
+            self.path = path
+        self._connection = None
+
+    @property
+    def connection(self):
+        import sqlite3
+
+        if self._connection is None:
+            # used from several threads (e.g. stats are flushed from another
+            # thread), each call serialized by SongData's lock
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS songs (
+                    id INTEGER PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    record BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS song_tags (
+                    tag TEXT NOT NULL,
+                    song_id INTEGER NOT NULL,
+                    PRIMARY KEY (tag, song_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS song_tags_song_id
+                    ON song_tags (song_id);
+                """
+            )
+        return self._connection
+
+    def get(self, song_id) -> SongRecord | None:
+        row = self.connection.execute(
+            "SELECT record FROM songs WHERE id = ?", (song_id,)
+        ).fetchone()
+        return None if row is None else self._decoder.decode(row[0])
+
+    def ids(self) -> list[int]:
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT id FROM songs ORDER BY id"
+            )
+        ]
+
+    def filenames(self) -> dict[int, str]:
+        return dict(self.connection.execute("SELECT id, filename FROM songs"))
+
+    def tag_index(self) -> dict[str, set[int]]:
+        tag_index = {}
+        for tag, song_id in self.connection.execute(
+            "SELECT tag, song_id FROM song_tags"
+        ):
+            if tag in tag_index:
+                tag_index[tag].add(song_id)
+            else:
+                tag_index[tag] = {song_id}
+        return tag_index
+
+    def read(self) -> dict[int, SongRecord]:
+        decode = self._decoder.decode
+        return {
+            song_id: decode(record)
+            for song_id, record in self.connection.execute(
+                "SELECT id, record FROM songs ORDER BY id"
+            )
+        }
+
+    def write(self, records: dict[int, SongRecord], deleted: Iterable[int]):
+        changed = [*records, *deleted]
+        with self.connection as c:  # one transaction
+            c.executemany(
+                "DELETE FROM song_tags WHERE song_id = ?",
+                ((song_id,) for song_id in changed),
+            )
+            c.executemany(
+                "DELETE FROM songs WHERE id = ?",
+                ((song_id,) for song_id in deleted),
+            )
+            c.executemany(
+                "INSERT OR REPLACE INTO songs VALUES (?, ?, ?)",
+                (
+                    (song_id, song.filename, self._encoder.encode(song))
+                    for song_id, song in records.items()
+                ),
+            )
+            c.executemany(
+                "INSERT INTO song_tags VALUES (?, ?)",
+                (
+                    (tag, song_id)
+                    for song_id, song in records.items()
+                    for tag in song.tags
+                ),
+            )
+
+    def compact(self):
+        self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.connection.execute("VACUUM")
+
+    def write_all(self, songs: dict[int, SongRecord]):
+        with self.connection as c:
+            c.execute("DELETE FROM song_tags")
+            c.execute("DELETE FROM songs")
+        self.write(songs, ())
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class SongData:
+    """
+    All song data, keyed by song ID, read from and written to a
+    `JSONSongStore` or `SQLiteSongStore`.
+
+    Records are loaded on first access: all at once from a JSON store, or one
+    at a time (and cached) from an SQLite store. Changes are written to the
+    store on `flush` (and at exit).
+    """
+
+    def __init__(self):
+        self._store = None
+        self._records = {}  # loaded records (all of them, if not store.lazy)
+        self._ids = None  # all song IDs (as an ordered dict), once loaded
+        self.tag_index = None  # dict(tag: set of song IDs), built when needed
+        self._title_index = None  # built on first search
+        self._dirty = set()  # song IDs changed since the last flush
+        self._deleted = set()  # song IDs deleted since the last flush
+        self._lock = threading.Lock()
+        atexit.register(self._save)
+
+    @property
+    def store(self):
+        if self._store is None:
+            if os.path.exists(config.SONGS_DB_PATH):
+                self._store = SQLiteSongStore()
+            else:
+                self._store = JSONSongStore()
+        return self._store
+
+    @property
+    def is_loaded(self):
+        """Whether the set of song IDs has been read."""
+        return self._ids is not None
+
+    def load(self):
+        if self._dirty or self._deleted:  # don't lose unsaved changes
+            self.flush()
+
+        self.tag_index = None
+        self._title_index = None
+        with self._lock:
+            if self.store.lazy:
+                self._records = {}
+                self._ids = dict.fromkeys(self.store.ids())
+            else:
+                self._records = self.store.read()
+                self._ids = dict.fromkeys(self._records)
+
+    def close(self):
+        """Flush, then forget the store (e.g. after converting it)."""
+        self.flush()
+        with self._lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+        self._records = {}
+        self._ids = None
+        self.tag_index = None
+        self._title_index = None
+
+    def __getitem__(self, key) -> SongRecord:
+        if key in self._records:
+            return self._records[key]
+        if not self.store.lazy:
+            if self._ids is None:
+                self.load()
+            return self._records[key]
+        if self._ids is not None and key not in self._ids:
+            raise KeyError(key)
+
+        with self._lock:  # e.g. the stats thread reads too
+            record = self.store.get(key)
+        if record is None:
+            raise KeyError(key)
+        self._records[key] = record
+        return record
+
+    def __contains__(self, key):
+        if self._ids is not None:
+            return key in self._ids
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value: SongRecord):
+        if self._ids is None:
+            self.load()
+        if self.tag_index is not None:
+            if key in self._ids:
+                self._unindex_tags(key, self[key].tags)
+            self._index_tags(key, value.tags)
+        self._records[key] = value
+        self._ids[key] = None
+        self.mark_dirty(key)
+        if self._title_index is not None:
+            self._title_index.add(key, os.path.splitext(value.filename)[0])
+
+    def __delitem__(self, key):
+        if self._ids is None:
+            self.load()
+        if self.tag_index is not None:
+            self._unindex_tags(key, self[key].tags)
+        del self._ids[key]
+        self._records.pop(key, None)
+        self._dirty.discard(key)
+        self._deleted.add(key)
+        if self._title_index is not None:
+            self._title_index.remove(key)
+
+    def __iter__(self):
+        if self._ids is None:
+            self.load()
+        return iter(self._ids)
+
+    def __len__(self):
+        if self._ids is None:
+            self.load()
+        return len(self._ids)
+
+    def _load_all(self):
+        if self._ids is None:
+            self.load()
+        if len(self._records) < len(self._ids):  # lazy store
+            with self._lock:
+                records = self.store.read()
+            for song_id, record in records.items():
+                self._records.setdefault(song_id, record)
+
+    def items(self):
+        self._load_all()
+        return ((song_id, self._records[song_id]) for song_id in self._ids)
+
+    def values(self):
+        self._load_all()
+        return (self._records[song_id] for song_id in self._ids)
+
+    def filenames(self) -> dict[int, str]:
+        """Every song's filename, without loading every record if possible."""
+        if not self.store.lazy:
+            return {song_id: record.filename for song_id, record in self.items()}
+
+        if self._ids is None:
+            self.load()
+        with self._lock:
+            filenames = self.store.filenames()
+        # include unflushed changes
+        for song_id, record in self._records.items():
+            filenames[song_id] = record.filename
+        for song_id in self._deleted:
+            filenames.pop(song_id, None)
+        return filenames
+
+    @property
+    def title_index(self) -> TitleIndex:
+        if self._title_index is None:
+            self._title_index = TitleIndex(
+                {
+                    song_id: os.path.splitext(filename)[0]
+                    for song_id, filename in self.filenames().items()
+                }
+            )
+        return self._title_index
+
+    def set_filename(self, song_id, filename):
+        self[song_id].filename = filename
+        self.mark_dirty(song_id)
+        if self._title_index is not None:
+            self._title_index.add(song_id, os.path.splitext(filename)[0])
+
+    # region tags
+
+    def _build_tag_index(self):
+        if self._ids is None:
+            self.load()
+        if self.store.lazy:
+            with self._lock:
+                self.tag_index = self.store.tag_index()
+            # include unflushed changes
+            for song_id in self._deleted:
+                for tagged in self.tag_index.values():
+                    tagged.discard(song_id)
+            for song_id in self._dirty:
+                for tagged in self.tag_index.values():
+                    tagged.discard(song_id)
+                self._index_tags(song_id, self._records[song_id].tags)
+            for tag in [t for t, tagged in self.tag_index.items() if not tagged]:
+                del self.tag_index[tag]
+        else:
+            self.tag_index = {}
+            for song_id, v in self._records.items():
+                self._index_tags(song_id, v.tags)
+
+    def _index_tags(self, song_id, tags):
+        for tag in tags:
+            if tag in self.tag_index:
+                self.tag_index[tag].add(song_id)
+            else:
+                self.tag_index[tag] = {song_id}
+
+    def _unindex_tags(self, song_id, tags):
+        for tag in tags:
+            tagged = self.tag_index[tag]
+            tagged.discard(song_id)
+            if not tagged:
+                del self.tag_index[tag]
+
+    def tags(self):
+        """All tags that at least one song has."""
+        if self.tag_index is None:
+            self._build_tag_index()
+        return self.tag_index.keys()
+
+    def set_tags(self, song_id, tags):
+        record = self[song_id]
+        tags = set(tags)
+        if self.tag_index is not None:
+            self._unindex_tags(song_id, record.tags - tags)
+            self._index_tags(song_id, tags - record.tags)
+        record.tags = tags
+        self.mark_dirty(song_id)
+
+    def songs_with_any_tag(self, tags) -> set[int]:
+        if self.tag_index is None:
+            self._build_tag_index()
+        return set().union(*(self.tag_index.get(tag, ()) for tag in tags))
+
+    def songs_with_all_tags(self, tags) -> set[int]:
+        if not tags:
+            return set(self)
+        if self.tag_index is None:
+            self._build_tag_index()
+        tagged = sorted(
+            (self.tag_index.get(tag, set()) for tag in tags), key=len
+        )
+        return tagged[0].intersection(*tagged[1:])
+
+    def rename_tag(self, old_tag, new_tag):
+        """Returns the number of songs affected."""
+        if self.tag_index is None:
+            self._build_tag_index()
+        if old_tag == new_tag or old_tag not in self.tag_index:
+            return 0
+        tagged = self.tag_index.pop(old_tag)
+        for song_id in tagged:
+            song_tags = self[song_id].tags
+            song_tags.remove(old_tag)
+            song_tags.add(new_tag)
+        self.tag_index.setdefault(new_tag, set()).update(tagged)
+        self._dirty |= tagged
+        return len(tagged)
+
+    def remove_tags(self, tags):
+        """Remove every occurrence of each of `tags`. Returns the number of
+        songs affected."""
+        if self.tag_index is None:
+            self._build_tag_index()
+        affected = set()
+        for tag in tags:
+            tagged = self.tag_index.pop(tag, set())
+            for song_id in tagged:
+                self[song_id].tags.discard(tag)
+            affected |= tagged
+        self._dirty |= affected
+        return len(affected)
+
+    # endregion
+
+    def mark_dirty(self, song_id):
+        """Record that the data for `song_id` changed (saved on flush)."""
+        self._dirty.add(song_id)
+
+    def flush(self):
+        """Write changes since the last flush to the store."""
+        with self._lock:
+            if not (self._dirty or self._deleted):
+                return
+            dirty, self._dirty = self._dirty, set()
+            deleted, self._deleted = self._deleted, set()
+
+            self.store.write(
+                {
+                    song_id: self._records[song_id]
+                    for song_id in dirty
+                    if song_id in self._records
+                },
+                deleted,
+            )
+
+    def compact(self):
+        """Flush, then compact the store (e.g. fold the JSON journal into the
+        main song data file)."""
+        self.flush()
+        with self._lock:
+            self.store.compact()
+
+    def _save(self):
+        self.flush()
+
+    def add_song(self, filename, tags=None, song_id=None, metadata=None):
+        """
+        Add the song file `filename` (already in the song directory). Bulk
+        imports should pass `song_id` from a counter instead of having each
+        call compute the next ID, and can pass the file's already loaded
+        `music_tag` `metadata`.
+        """
+        if tags is None:
+            tags = set()
+
+        if song_id is None:
+            song_id = max(self, default=0) + 1
+        self[song_id] = SongRecord(
+            filename=os.path.split(filename)[1],
+            tags=set(tags),
+            stats={str(config.CUR_YEAR): 0.0, "total": 0.0},
+        )
+
+        song = Song(song_id)
+        if metadata is not None:
+            song._metadata = metadata  # pylint: disable=protected-access
+        song.set_metadata("tracktitle", song.song_title)
+
+        return song
+
+
+SONG_DATA = SongData()
+
+
+class Songs:
+    """
+    Wrapper around dict of all `Song` objects.
+    """
+
+    def __init__(self):
+        self._songs = None
+        self._song_data = SONG_DATA
+
+    def load(self):
+        self._songs = {k: Song(k) for k in self._song_data}
+
+    def __contains__(self, value: Song):
+        if self._songs is not None and value.song_id in self._songs:
+            return True
+        # doesn't need every song's data to be loaded
+        return value.song_id in self._song_data
+
+    def __getitem__(self, song_id) -> Song:
+        if self._songs is not None and song_id in self._songs:
+            return self._songs[song_id]
+        if song_id not in self._song_data:
+            raise KeyError(song_id)
+        song = Song(song_id)
+        if self._songs is not None:  # added after load
+            self._songs[song_id] = song
+        return song
+
+    def __iter__(self) -> Iterable[Song]:
+        if self._songs is None:
+            self.load()
+        return iter(self._songs.values())
+
+    def __len__(self):
+        if self._songs is None:
+            self.load()
+        return len(self._songs)
+
+
+SONGS = Songs()
+
+
+def is_safe_username(url):
+    return quote(url, safe="") == url if url else False
+
+
+def bounded_shuffle(lst, radius=-1):
+    """
+    Randomly shuffle `lst`, but with the constraint that each element can only
+    move at most `radius` positions away from its original position.
+
+    To shuffle with no bounds, set `radius = -1`.
+    """
+    n = len(lst)
+    if radius == -1:
+        radius = n
+    elif radius == 0:
+        return
+
+    index_at = list(range(n))
+    for i in range(n - 1, 0, -1):
+        j = randint(max(0, index_at[i] - radius), i)
+        index_at[j], index_at[i] = index_at[i], index_at[j]
+        lst[j], lst[i] = lst[i], lst[j]
+
+
+def set_timeout(func, timeout, *args, **kwargs):
+    def wrapper():
+        sleep(timeout)
+        func()
+
+    threading.Thread(
+        target=wrapper, daemon=True, args=args, kwargs=kwargs
+    ).start()
+
+
+class Scroller:
+    def __init__(self, num_lines, win_size):
+        self.num_lines = num_lines
+        self.win_size = win_size
+        self.pos = 0
+        self.top = 0
+
+    def scroll_forward(self):
+        if self.pos < self.num_lines - 1:
+            if (
+                self.pos == self.halfway
+                and self.top < self.num_lines - self.win_size
+            ):
+                self.top += 1
+            self.pos += 1
+
+    def scroll_backward(self):
+        if self.pos > 0:
+            if self.pos == self.halfway and self.top > 0:
+                self.top -= 1
+            self.pos -= 1
+
+    @property
+    def halfway(self):
+        return self.top + (self.win_size - 1) // 2
+
+    def resize(self, win_size=None):
+        if win_size is not None:
+            self.win_size = win_size
+        self.top = max(0, self.pos - (self.win_size - 1) // 2)
+        self.top = max(0, min(self.num_lines - self.win_size, self.top))
+
+    def refresh(self):
+        self.resize()
+
+
+def fit_string_to_width(s, width, length_so_far):
+    if length_so_far + len(s) > width:
+        remaining_width = width - length_so_far
+        if remaining_width >= 3:
+            s = s[: (remaining_width - 3)] + "..."
+        else:
+            s = "." * remaining_width
+    length_so_far += len(s)
+    return s, length_so_far
+
+
+def addstr_fit_to_width(stdscr, s, width, length_so_far, *args, **kwargs):
+    s, length_so_far = fit_string_to_width(s, width, length_so_far)
+    if s:
+        if length_so_far <= width:
+            stdscr.addstr(s, *args, **kwargs)
+        else:
+            stdscr.addstr(s[:-1], *args, **kwargs)
+            stdscr.insstr(s[-1], *args, **kwargs)
+    return length_so_far
+
+
+def addstr_to_line_end(stdscr, s, *args):
+    """
+    Write `s` at the cursor, up to the end of a pane. The last character is
+    written with `insstr` if it's in the screen's last column, since `addstr`
+    raises an error for the bottom right corner; elsewhere `insstr` would
+    shift the rest of the line (i.e. the pane to the right) over.
+    """
+    if stdscr.getyx()[1] + len(s) < stdscr.getmaxyx()[1]:
+        stdscr.addstr(s, *args)
+    else:
+        stdscr.addstr(s[:-1], *args)
+        stdscr.insstr(s[-1], *args)
+
+
+class FFmpegProcessHandler:
+    def __init__(self, username, password):
+        self.process = None
+        self.username = username
+        self.password = password
+
+    def start(self):
+        threading.Thread(target=self._start, daemon=True).start()
+
+    def _start(self):
+        from spotdl.utils.ffmpeg import get_ffmpeg_path
+
+        self.process = subprocess.Popen(
+            # fmt: off
+            [
+                str(get_ffmpeg_path()),
+                # no -re: PCMWriter paces the input in real time
+                "-f", "s16le",  # Raw PCM 16-bit little-endian audio
+                "-ar", str(config.STREAM_SAMPLE_RATE),  # Set the audio sample rate
+                "-ac", "2",  # Set the number of audio channels to 2 (stereo)
+                '-i', 'pipe:',  # Input from stdin
+                "-f", "mp3",  # Output format
+                # "-report",  # DEBUG
+                f"icecast://{self.username}:{self.password}@{config.ICECAST_SERVER}:8000/{self.username}",  # Azure-hosted maestro Icecast URL
+            ],
+            # fmt: on
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def terminate(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process = None
+
+    def restart(self):
+        self.terminate()
+        self.start()
+
+    def write(self, chunk):
+        if self.process is not None:
+            try:
+                self.process.stdin.write(chunk)
+                self.process.stdin.flush()
+            except BrokenPipeError as e:  # pylint: disable=unused-variable
+                print_to_logfile("FFmpeg processs error:", e)
+
+
+class PCMWriter:
+    """
+    Writes chunks of PCM (bytes-like, e.g. from `PCMStream.chunks`) with
+    `write` on its own thread, in real time: each chunk is written
+    `config.STREAM_LEAD` secs before the stream's clock reaches it. Chunks are
+    queued with `put`, which blocks while `config.STREAM_QUEUE_SIZE` chunks
+    are waiting, pacing the caller.
+
+    `underruns` counts the times the queue ran dry and the stream fell behind
+    (the clock restarts with the next chunk); `max_jitter` and `mean_jitter`
+    are how late writes were, in secs, after they were due (or the chunk
+    arrived, if later).
+    """
+
+    def __init__(self, write, sample_rate=config.STREAM_SAMPLE_RATE):
+        from queue import Queue
+
+        self._write = write
+        self._bytes_per_sec = sample_rate * 4  # 16-bit stereo
+        self._queue = Queue(config.STREAM_QUEUE_SIZE)
+        self._generation = 0  # incremented by clear
+        self.writes = 0
+        self.bytes_written = 0
+        self.underruns = 0
+        self.max_jitter = 0
+        self._total_jitter = 0
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    @property
+    def mean_jitter(self):
+        return self._total_jitter / self.writes if self.writes else 0
+
+    def put(self, chunk):
+        self._queue.put((self._generation, chunk))
+
+    def clear(self):
+        """Drop queued chunks, e.g. after seeking."""
+        from queue import Empty
+
+        self._generation += 1
+        try:
+            while True:
+                self._queue.get_nowait()
+        except Empty:
+            pass
+
+    def _write_loop(self):
+        due = None  # when the stream's clock reaches the next chunk
+        while True:
+            generation, chunk = self._queue.get()
+            now = monotonic()
+            if due is None or now > due:
+                if due is not None:
+                    self.underruns += 1
+                due = now
+            target = max(due - config.STREAM_LEAD, now)
+            sleep(target - now)
+            if generation != self._generation:  # cleared while sleeping
+                continue
+            jitter = monotonic() - target
+            self._total_jitter += jitter
+            self.max_jitter = max(self.max_jitter, jitter)
+
+            try:
+                self._write(chunk)
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile("PCM writer error:", e)
+            self.writes += 1
+            self.bytes_written += len(chunk)
+            due += len(chunk) / self._bytes_per_sec
+
+
+PCM16_SCALE = (2**15 - 1) * 0.5  # reduce volume (avoid clipping)
+
+
+def decode_audio(path):
+    """
+    Decode the audio file at `path` at its native sample rate. Returns
+    (audio, sample rate), where audio has shape (2, # frames).
+    """
+    import numpy as np
+
+    from librosa import load
+
+    audio, sr = load(path, mono=False, sr=None)
+
+    if len(audio.shape) == 1:  # mono -> stereo
+        audio = np.repeat([audio], 2, axis=0)
+    elif audio.shape[0] == 1:  # mono -> stereo
+        audio = np.repeat(audio, 2, axis=0)
+    elif audio.shape[0] == 6:  # 5.1 -> stereo
+        audio = np.delete(audio, (1, 3, 4, 5), axis=0)
+
+    return audio, sr
+
+
+def resample_audio(audio, sr, target_sr):
+    if sr == target_sr:
+        return audio
+
+    from librosa import resample
+
+    return resample(audio, orig_sr=sr, target_sr=target_sr)
+
+
+def spectrogram_frames(read, sr, start, stop):
+    """
+    Frames `start` to `stop` (exclusive) of a song's visualizer spectrogram,
+    where `read(a, b)` returns samples `a` to `b` of the song at sample rate
+    `sr` with shape (2, b - a), zero outside of the song. Uses librosa's
+    default (centered) STFT at `config.VIS_SAMPLE_RATE`, and only decodes and
+    resamples the audio under those frames.
+
+    Returns uint8 dB relative to a full-scale sine, clipped to [0, 80], with
+    shape (stop - start, 2, # frequency bins).
+    """
+    import numpy as np
+
+    from librosa import stft
+
+    hop = config.STEP_SIZE
+    n_fft = 4 * hop  # librosa default
+    vis_sr = config.VIS_SAMPLE_RATE
+    # samples under the frames, at vis_sr (frame i is centered on i * hop)
+    a = start * hop - n_fft // 2
+    b = (stop - 1) * hop + n_fft // 2
+    audio = resampled_reader(read, sr, vis_sr, n_fft)(a, b)
+
+    spectrum = np.abs(stft(audio, n_fft=n_fft, hop_length=hop, center=False))
+    np.maximum(spectrum, 1e-5, out=spectrum)  # librosa's default amin
+    spectrum /= n_fft / 4  # magnitude of a full-scale sine
+    np.log10(spectrum, out=spectrum)
+    spectrum *= 20
+    spectrum += 80
+    np.clip(spectrum, 0, 80, out=spectrum)  # top_db = 80
+    return np.rint(spectrum).astype(np.uint8).transpose(2, 0, 1)
+
+
+def resampled_reader(read, sr, target_sr, margin):
+    """
+    `read` function (see `spectrogram_frames`) for the audio `read` reads at
+    sample rate `sr`, resampled to `target_sr`. Each read resamples `margin`
+    more samples (at `target_sr`) on both sides so the resampler's edge
+    effects get cut off, aligned to whole samples at both rates, so
+    consecutive reads line up with resampling the whole song at once.
+    """
+    if sr == target_sr:
+        return read
+
+    g = gcd(sr, target_sr)
+    step, target_step = sr // g, target_sr // g
+
+    def resampled_read(a, b):
+        a_ = (a - margin) // target_step
+        b_ = -((-b - margin) // target_step)
+        return resample_audio(read(a_ * step, b_ * step), sr, target_sr)[
+            :, a - a_ * target_step : b - a_ * target_step
+        ]
+
+    return resampled_read
+
+
+def spectrogram_bands(num_bands):
+    """
+    (first frequency bin of each of `num_bands` visualizer bands (see
+    `config.VIS_FREQ_SCALE`), bin past the last band) for
+    `spectrogram_frames`' frames, to fold them with `np.maximum.reduceat`.
+    Low bands narrower than a bin repeat it.
+    """
+    import numpy as np
+
+    if config.VIS_FREQ_SCALE == "mel":
+        from librosa import mel_frequencies
+
+        edges = mel_frequencies(
+            num_bands + 1, fmin=config.VIS_MIN_FREQ, fmax=config.VIS_MAX_FREQ
+        )
+    else:
+        edges = np.geomspace(
+            config.VIS_MIN_FREQ, config.VIS_MAX_FREQ, num_bands + 1
+        )
+    bin_width = config.VIS_SAMPLE_RATE / (4 * config.STEP_SIZE)  # sr / n_fft
+    edges = np.round(edges / bin_width).astype(np.intp)
+    return edges[:-1], max(edges[-1], edges[-2] + 1)
+
+
+def spectrogram_length(num_samples, sr):
+    """Number of visualizer spectrogram frames for `num_samples` samples at
+    sample rate `sr`."""
+    num_vis_samples = -(-num_samples * config.VIS_SAMPLE_RATE // sr)
+    return 1 + num_vis_samples // config.STEP_SIZE
+
+
+def array_reader(audio):
+    """`read` function (see `spectrogram_frames`) for audio in memory, e.g.
+    from `decode_audio`."""
+    import numpy as np
+
+    def read(a, b):
+        samples = np.zeros((2, b - a), dtype=np.float32)
+        lo, hi = max(a, 0), min(b, audio.shape[1])
+        if lo < hi:
+            samples[:, lo - a : hi - a] = audio[:, lo:hi]
+        return samples
+
+    return read
+
+
+def file_reader(path):
+    """
+    (`read` function (see `spectrogram_frames`) that decodes just the samples
+    it's asked for from the audio file at `path`, function that closes the
+    file, sample rate, # samples). Reading after closing gives silence.
+    Raises an error if the file can't be opened with soundfile.
+    """
+    import numpy as np
+    import soundfile as sf
+
+    f = sf.SoundFile(path)
+    channels = (0, 2) if f.channels == 6 else (0, -1)  # 5.1 or mono -> stereo
+    lock = threading.Lock()
+
+    def read(a, b):
+        samples = np.zeros((2, b - a), dtype=np.float32)
+        lo, hi = max(a, 0), min(b, f.frames)
+        if lo < hi:
+            with lock:
+                if f.closed:
+                    return samples
+                f.seek(lo)
+                data = f.read(hi - lo, dtype="float32", always_2d=True)
+            samples[:, lo - a : lo - a + len(data)] = data[:, channels].T
+        return samples
+
+    def close():
+        with lock:
+            f.close()
+
+    return read, close, f.samplerate, f.frames
+
+
+def audio_reader(path):
+    """
+    (`read` function (see `spectrogram_frames`), function that closes the
+    file, sample rate, # samples) for the audio file at `path`: `file_reader`
+    if soundfile supports the file, otherwise reading from the whole file
+    decoded at once.
+    """
+    try:
+        return file_reader(path)
+    except Exception as e:  # pylint: disable=broad-except
+        # not supported by soundfile, fall back on librosa/audioread
+        print_to_logfile(f"Decoding {path} all at once:", e)
+        audio, sr = decode_audio(path)
+        return array_reader(audio), lambda: None, sr, audio.shape[1]
+
+
+def audio_spectrogram(audio, sr):
+    """
+    The whole visualizer spectrogram of `audio` (from `decode_audio`) at
+    once; see `spectrogram_frames`.
+    """
+    return spectrogram_frames(
+        array_reader(audio), sr, 0, spectrogram_length(audio.shape[1], sr)
+    )
+
+
+def pcm16(audio):
+    """16-bit PCM of `audio` (with shape (2, # frames)) with shape
+    (# frames, 2): interleaved, as FFmpeg reads it, so it can be streamed
+    without copying."""
+    import numpy as np
+
+    audio = audio.T * PCM16_SCALE
+    return np.ascontiguousarray(audio, dtype=np.int16)
+
+
+def audio_pcm16(audio, sr):
+    """The whole 16-bit PCM (see `pcm16`) of `audio` (from `decode_audio`) at
+    once, at `config.STREAM_SAMPLE_RATE`; see `PCMStream`."""
+    return pcm16(resample_audio(audio, sr, config.STREAM_SAMPLE_RATE))
+
+
+class PCMStream:
+    """
+    A song's 16-bit PCM for streaming (see `pcm16`), at
+    `config.STREAM_SAMPLE_RATE`, decoded `config.STREAM_BLOCK_SIZE` frames at
+    a time as it's streamed instead of all at once, so memory use doesn't
+    depend on the song's length. The first block is decoded up front, so a
+    song queued ahead of time starts streaming without waiting for it.
+    `close` closes the song file once it's no longer needed.
+    """
+
+    def __init__(self, path):
+        read, self.close, sr, num_samples = audio_reader(path)
+        self._read = resampled_reader(
+            read, sr, config.STREAM_SAMPLE_RATE, config.STREAM_RESAMPLE_MARGIN
+        )
+        # rounded up, like resample_audio
+        self.num_frames = -(-num_samples * config.STREAM_SAMPLE_RATE // sr)
+        self._first_block = None
+        try:
+            self._first_block = self.block(0)
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.num_frames
+
+    def block(self, start):
+        """PCM for `config.STREAM_BLOCK_SIZE` frames from frame `start` (fewer
+        at the end of the song)."""
+        if start == 0 and self._first_block is not None:
+            return self._first_block
+        stop = min(start + config.STREAM_BLOCK_SIZE, self.num_frames)
+        return pcm16(self._read(start, stop))
+
+    def chunks(self, start):
+        """
+        Yields the song's PCM from frame `start` in chunks of
+        `config.STREAM_CHUNK_SIZE` frames, as `memoryview`s of bytes.
+        """
+        for block_start in range(
+            start // config.STREAM_BLOCK_SIZE * config.STREAM_BLOCK_SIZE,
+            self.num_frames,
+            config.STREAM_BLOCK_SIZE,
+        ):
+            block = self.block(block_start)
+            data = memoryview(block).cast("B")  # slices don't copy
+            frame_size = block.itemsize * block.shape[1]
+            chunk_size = config.STREAM_CHUNK_SIZE * frame_size
+            for i in range(
+                max(start - block_start, 0) * frame_size, len(data), chunk_size
+            ):
+                yield data[i : i + chunk_size]
+
+
+class SpectrogramCache:
+    """
+    On-disk cache of visualizer spectrograms in `config.SPECTROGRAM_CACHE_DIR`,
+    keyed by the song's audio fingerprint (so it's invalidated when the file
+    changes, but not when it's renamed or retagged). Spectrograms are stored
+    as uint8 (see `spectrogram_frames`) and memory-mapped. The least recently
+    used ones are evicted once the cache is bigger than
+    `config.SPECTROGRAM_CACHE_MAX_SIZE`.
+    """
+
+    def _path(self, song: Song):
+        return os.path.join(
+            config.SPECTROGRAM_CACHE_DIR,
+            f"{FINGERPRINT_INDEX.get(song)}-{config.VIS_SAMPLE_RATE}"
+            f"-{config.STEP_SIZE}.npy",
+        )
+
+    def load(self, song: Song):
+        """`song`'s cached spectrogram, or None if it isn't cached."""
+        import numpy as np
+
+        path = self._path(song)
+        try:
+            spectrogram = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # mark as recently used
+        return spectrogram
+
+    def create(self, song: Song, shape):
+        """
+        A new writable memory-mapped spectrogram with `shape` for `song`,
+        which is only cached once it's passed to `commit`. Returns
+        (spectrogram, path to pass to `commit` or `discard`).
+        """
+        import numpy as np
+
+        os.makedirs(config.SPECTROGRAM_CACHE_DIR, exist_ok=True)
+        tmp_path = (
+            f"{self._path(song)}.{os.getpid()}-{threading.get_ident()}.tmp"
+        )
+        spectrogram = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.uint8, shape=shape
+        )
+        return spectrogram, tmp_path
+
+    def commit(self, song: Song, spectrogram, tmp_path):
+        try:
+            spectrogram.flush()
+            os.replace(tmp_path, self._path(song))
+            self._evict()
+        except OSError as e:
+            print_to_logfile("Failed to cache spectrogram:", e)
+
+    def discard(self, tmp_path):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(config.SPECTROGRAM_CACHE_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(".npy"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+                elif entry.name.endswith(".tmp"):
+                    # left behind by a process that exited mid-song
+                    if entry.stat().st_mtime < time() - 24 * 60 * 60:
+                        os.remove(entry.path)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= config.SPECTROGRAM_CACHE_MAX_SIZE:
+                break
+            os.remove(path)
+            total -= size
+
+
+SPECTROGRAM_CACHE = SpectrogramCache()
+
+
+class WorkerPool:
+    """
+    Runs jobs on `workers` threads, lowest `priority` first (any comparable
+    value; ties in the order they were submitted). Pending jobs can be
+    cancelled by the `key` they were submitted with. Errors are logged
+    instead of killing the worker.
+    """
+
+    def __init__(self, workers):
+        from heapq import heappop, heappush
+
+        self._heappop, self._heappush = heappop, heappush
+        self._heap = []  # [priority, seq, key, fn, args], fn=None if cancelled
+        self._jobs = {}  # key: list of its pending jobs
+        self._seq = 0
+        self._cv = threading.Condition()
+        for _ in range(workers):
+            threading.Thread(target=self._work_loop, daemon=True).start()
+
+    def submit(self, priority, key, fn, *args):
+        with self._cv:
+            job = [priority, self._seq, key, fn, args]
+            self._seq += 1
+            self._heappush(self._heap, job)
+            self._jobs.setdefault(key, []).append(job)
+            self._cv.notify()
+
+    def cancel(self, key):
+        """Cancel `key`'s pending jobs (running ones finish). Returns whether
+        there were any."""
+        with self._cv:
+            jobs = self._jobs.pop(key, ())
+            for job in jobs:
+                job[3] = None
+            return bool(jobs)
+
+    def pending(self, key):
+        with self._cv:
+            return key in self._jobs
+
+    def _work_loop(self):
+        while True:
+            with self._cv:
+                while not self._heap:
+                    self._cv.wait()
+                job = self._heappop(self._heap)
+                _, _, key, fn, args = job
+                if fn is None:  # cancelled
+                    continue
+                jobs = self._jobs[key]
+                jobs.remove(job)
+                if not jobs:
+                    del self._jobs[key]
+            try:
+                fn(*args)
+            except Exception as e:  # pylint: disable=broad-except
+                name = getattr(fn, "__qualname__", fn)
+                print_to_logfile(f"Error in background job {name}:", e)
+
+
+class SpectrogramStream:
+    """
+    A song's visualizer spectrogram, computed in the background on `pool` (a
+    `WorkerPool`) `config.VIS_BLOCK_SIZE` frames at a time (decoding only
+    those blocks of the file) instead of all at once. Blocks in the
+    `config.VIS_LOOKAHEAD` seconds after the last frame asked for are computed
+    first, so seeking re-primes from the new position; the rest of the song
+    follows, and is then cached in `SPECTROGRAM_CACHE`. Frames are written
+    straight to the (memory-mapped) cache file, so memory use doesn't depend
+    on the song's length.
+
+    Each block is a job with priority (whether it's outside the look-ahead
+    window, `priority`), so set `priority` to e.g. the song's distance from
+    the current one to have songs' visible frames computed before the rest.
+    """
+
+    def __init__(self, song: Song, path, pool: WorkerPool, priority=0):
+        import numpy as np
+
+        self.song = song
+        self.priority = priority
+        self.mono = True
+        self._pool = pool
+        self._want = 0
+        self._closed = False
+        self._tmp_path = None
+        self._close_file = lambda: None
+        # (# bands, spectrogram_bands(# bands), folded frames, folded blocks)
+        self._bands = None
+
+        self.spectrogram = SPECTROGRAM_CACHE.load(song)
+        if self.spectrogram is not None:
+            self.mono = np.array_equal(
+                self.spectrogram[:, 0], self.spectrogram[:, 1]
+            )
+            self._done = np.ones(self._num_blocks(), dtype=bool)
+            return
+
+        self._read, self._close_file, self._sr, num_samples = audio_reader(
+            path
+        )
+
+        shape = (
+            spectrogram_length(num_samples, self._sr),
+            2,
+            2 * config.STEP_SIZE + 1,  # n_fft // 2 + 1
+        )
+        try:
+            self.spectrogram, self._tmp_path = SPECTROGRAM_CACHE.create(
+                song, shape
+            )
+        except OSError as e:
+            print_to_logfile("Failed to cache spectrogram:", e)
+            self.spectrogram = np.zeros(shape, dtype=np.uint8)
+        self._done = np.zeros(self._num_blocks(), dtype=bool)
+
+        self._submit()
+
+    def __len__(self):
+        return self.spectrogram.shape[0]
+
+    def _num_blocks(self):
+        return -(-len(self) // config.VIS_BLOCK_SIZE)
+
+    def frame(self, i):
+        """
+        Frame `i` (clamped to the song), with shape (2, # frequency bins), or
+        None if it hasn't been computed yet, in which case it's computed
+        next.
+        """
+        i = max(0, min(i, len(self) - 1))
+        self._want = i
+        if not self._done[i // config.VIS_BLOCK_SIZE]:
+            return None
+        return self.spectrogram[i]
+
+    def bands(self, i, num_bands):
+        """
+        Like `frame`, but folded into `num_bands` bands (see
+        `spectrogram_bands`), with shape (2, num_bands). Folded frames are
+        kept for the last `num_bands` asked for, so this is normally just a
+        lookup; a block is folded the first time one of its frames is asked
+        for.
+        """
+        import numpy as np
+
+        frame = self.frame(i)
+        if frame is None:
+            return None
+        i = max(0, min(i, len(self) - 1))
+
+        if self._bands is None or self._bands[0] != num_bands:
+            self._bands = (
+                num_bands,
+                spectrogram_bands(num_bands),
+                np.empty((len(self), 2, num_bands), dtype=np.uint8),
+                np.zeros(self._num_blocks(), dtype=bool),
+            )
+        _, (starts, stop), banded, folded = self._bands
+        block = i // config.VIS_BLOCK_SIZE
+        if not folded[block]:
+            start = block * config.VIS_BLOCK_SIZE
+            end = start + config.VIS_BLOCK_SIZE
+            banded[start:end] = np.maximum.reduceat(
+                self.spectrogram[start:end, :, :stop], starts, axis=2
+            )
+            folded[block] = True
+        return banded[i]
+
+    def close(self):
+        """Stop computing frames; the spectrogram isn't cached unless it was
+        finished."""
+        self._closed = True
+        if self._pool.cancel(self):  # otherwise the running job cleans up
+            self._discard()
+
+    def _next_block(self):
+        """(index of the next block to compute or None, whether it's in the
+        look-ahead window)."""
+        import numpy as np
+
+        want = self._want // config.VIS_BLOCK_SIZE
+        ahead = -(-config.VIS_LOOKAHEAD * config.FPS // config.VIS_BLOCK_SIZE)
+        for block in range(want, min(want + ahead + 1, len(self._done))):
+            if not self._done[block]:
+                return block, True
+        remaining = np.flatnonzero(~self._done)
+        if not len(remaining):
+            return None, False
+        later = remaining[remaining > want]
+        return int(later[0] if len(later) else remaining[0]), False
+
+    def _submit(self):
+        block, urgent = self._next_block()
+        if self._closed:
+            self._discard()
+        elif block is None:
+            self._close_file()
+            if self._tmp_path is not None:
+                SPECTROGRAM_CACHE.commit(
+                    self.song, self.spectrogram, self._tmp_path
+                )
+        else:
+            self._pool.submit(
+                (not urgent, self.priority), self, self._compute_next
+            )
+
+    def _compute_next(self):
+        if self._closed:
+            self._discard()
+            return
+        block, urgent = self._next_block()
+        if block is None:
+            self._submit()
+            return
+        if not urgent:
+            sleep(0.01)  # don't hog the CPU while the player is drawing
+        start = block * config.VIS_BLOCK_SIZE
+        stop = min(start + config.VIS_BLOCK_SIZE, len(self))
+        try:
+            frames = spectrogram_frames(self._read, self._sr, start, stop)
+        except Exception as e:  # pylint: disable=broad-except
+            print_to_logfile("Failed to compute spectrogram:", e)
+            self._closed = True
+            self._discard()
+            return
+        self.spectrogram[start:stop] = frames
+        if self.mono and (frames[:, 0] != frames[:, 1]).any():
+            self.mono = False
+        self._done[block] = True
+        self._submit()
+
+    def _discard(self):
+        self._close_file()
+        if self._tmp_path is not None:
+            SPECTROGRAM_CACHE.discard(self._tmp_path)
+            self._tmp_path = None
+
+
+class RenderScheduler:
+    """
+    Paces the player's redraws (calls to `draw`). Redraws are requested with
+    `request` and done on the next `tick`, so requests made while handling
+    several keys are coalesced into one redraw. Redraws just for playback
+    progress are limited to `target_fps`, which drops below `max_fps` when
+    frames take long to draw (e.g. over SSH) so that drawing takes at most
+    `config.RENDER_BUDGET` of the player's time; visualizer frames are
+    skipped instead of input lagging behind.
+    """
+
+    def __init__(self, draw, max_fps):
+        self._draw = draw
+        self.max_fps = max_fps
+        self._pending = False
+        self._last_frame = 0
+        self._recent_frames = deque()  # start times of the last second's
+        self._frame_times = deque(maxlen=31)
+
+    @property
+    def frame_time(self):
+        """Median time to draw one of the last few frames, in secs (robust to
+        one-off slow frames, e.g. the first one, which imports things)."""
+        if not self._frame_times:
+            return 0
+        return sorted(self._frame_times)[len(self._frame_times) // 2]
+
+    @property
+    def target_fps(self):
+        if not self.frame_time:
+            return self.max_fps
+        return min(self.max_fps, config.RENDER_BUDGET / self.frame_time)
+
+    @property
+    def fps(self):
+        """Frames drawn in the last second."""
+        cutoff = monotonic() - 1
+        while self._recent_frames and self._recent_frames[0] < cutoff:
+            self._recent_frames.popleft()
+        return len(self._recent_frames)
+
+    def request(self):
+        self._pending = True
+
+    def next_frame_in(self, progress_in):
+        """
+        Secs until `tick` will redraw, given that playback will have
+        progressed enough in `progress_in` secs.
+        """
+        if self._pending:
+            return 0
+        return max(
+            progress_in, self._last_frame + 1 / self.target_fps - monotonic()
+        )
+
+    def tick(self, progressed=False):
+        """
+        Redraw if a redraw was requested, or if `progressed` (playback has
+        moved enough to change what's drawn) and a frame is due. Returns
+        whether it redrew.
+        """
+        start = monotonic()
+        if not (
+            self._pending
+            or (
+                progressed
+                and start - self._last_frame >= 1 / self.target_fps
+            )
+        ):
+            return False
+
+        self._pending = False
+        self._draw()
+        self._frame_times.append(monotonic() - start)
+        self._last_frame = start
+        self._recent_frames.append(start)
+        return True
+
+
+class EventWaiter:
+    """
+    Lets the player sleep until there's input on the terminal, another thread
+    calls `wake`, or a timeout passes, instead of polling. Keys are read with
+    `next_key` one at a time, in the order they were pressed.
+
+    On Windows, where `select` only takes sockets, `wake` writes to a socket
+    pair instead of a pipe, and the terminal is polled every
+    `config.INPUT_POLL_INTERVAL` secs while waiting.
+    """
+
+    def __init__(self, stdscr: "curses._CursesWindow", fd=None):
+        import selectors
+
+        self.stdscr = stdscr
+        self._keys = deque()
+        self._selector = selectors.DefaultSelector()
+        self._poll_input = sys.platform == "win32"
+        if self._poll_input:
+            import socket
+
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+        else:
+            self._selector.register(
+                sys.stdin.fileno() if fd is None else fd, selectors.EVENT_READ
+            )
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            os.set_blocking(self._wake_w, False)
+        self._wake_lock = threading.Lock()  # so `close` can't race `wake`
+        self._closed = False
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+    @property
+    def pending(self):
+        """Whether there are keys read but not yet returned by `next_key`."""
+        return bool(self._keys)
+
+    def next_key(self):
+        """The next key pressed (see `curses.window.getch`), or -1."""
+        if not self._keys:
+            # curses buffers input itself, so read everything it has
+            c = self.stdscr.getch()
+            while c != -1:
+                self._keys.append(c)
+                c = self.stdscr.getch()
+        return self._keys.popleft() if self._keys else -1
+
+    def wait(self, timeout=None):
+        """
+        Sleep until there's input, `wake` is called, or `timeout` secs pass
+        (never if None). Returns immediately if keys are pending.
+        """
+        if self._keys:
+            return
+        if timeout is not None:
+            timeout = max(timeout, 0)
+        if not self._poll_input:
+            self._select(timeout)
+            return
+
+        end = None if timeout is None else monotonic() + timeout
+        while True:
+            c = self.stdscr.getch()  # doesn't block (see init_curses)
+            if c != -1:
+                self._keys.append(c)
+                return
+            left = config.INPUT_POLL_INTERVAL
+            if end is not None:
+                left = min(left, end - monotonic())
+                if left <= 0:
+                    return
+            if self._select(left):
+                return
+
+    def _select(self, timeout):
+        """Wait up to `timeout` secs for input or `wake`. Returns whether
+        `wake` was called."""
+        woken = False
+        for key, _ in self._selector.select(timeout):
+            if key.fd == self._wake_fd:
+                woken = True
+                try:
+                    while self._read_wake():
+                        pass
+                except BlockingIOError:
+                    pass
+        return woken
+
+    @property
+    def _wake_fd(self):
+        return self._wake_r.fileno() if self._poll_input else self._wake_r
+
+    def _read_wake(self):
+        if self._poll_input:
+            return self._wake_r.recv(4096)
+        return os.read(self._wake_r, 4096)
+
+    def wake(self):
+        """Wake up `wait`, e.g. from another thread that changed the screen.
+        Does nothing once closed."""
+        with self._wake_lock:
+            if self._closed:
+                return
+            try:
+                if self._poll_input:
+                    self._wake_w.send(b"\0")
+                else:
+                    os.write(self._wake_w, b"\0")
+            except BlockingIOError:  # pipe is full, so wait will wake up anyway
+                pass
+
+    def close(self):
+        with self._wake_lock:
+            self._closed = True
+            self._selector.close()
+            if self._poll_input:
+                self._wake_r.close()
+                self._wake_w.close()
+            else:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def http_session():
+    """
+    The `requests.Session` shared by maestro's HTTP requests, which keeps up
+    to `config.HTTP_POOL_SIZE` connections to each host alive so they (and
+    their TLS handshakes) are reused.
+    """
+    global _http_session  # pylint: disable=global-statement
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+
+            _http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=config.HTTP_POOL_SIZE
+            )
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+    return _http_session
+
+
+class MetadataUplink:
+    """
+    Sends updates (POST requests) to maestro's servers on one background
+    thread, over `session` (default: `http_session()`). Updates are coalesced
+    by `key`: only the latest one with each key is sent, so e.g. skipping
+    through several songs sends one update for the last. Failed updates are
+    retried after `backoff` secs, doubling up to `max_backoff`, until they
+    succeed or a newer update with the same key replaces them (unless the
+    server rejected them with a client error).
+    """
+
+    def __init__(
+        self,
+        session=None,
+        backoff=config.UPLINK_RETRY_BACKOFF,
+        max_backoff=config.UPLINK_MAX_BACKOFF,
+        timeout=config.HTTP_TIMEOUT,
+    ):
+        self.session = session
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.sent = 0  # successful requests
+        self.failed = 0  # failed attempts, including ones retried
+        self.coalesced = 0  # updates replaced before they were sent
+
+        self._pending = {}  # key: [url, kwargs, attempts, when it's due]
+        self._sending = None  # key of the update being sent
+        self._cv = threading.Condition()
+        self._thread = None
+
+    def put(self, key, url, **kwargs):
+        """Send a POST request to `url` with `kwargs` (see `requests.post`),
+        replacing any pending update with `key`."""
+        with self._cv:
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+            self._pending[key] = [url, kwargs, 0, 0]
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._send_loop, daemon=True
+                )
+                self._thread.start()
+            self._cv.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every pending update is sent (or `timeout` secs pass,
+        if not None). Returns whether they were."""
+        with self._cv:
+            return self._cv.wait_for(
+                lambda: not self._pending and self._sending is None, timeout
+            )
+
+    def _next(self):
+        """Wait for the first update that's due, and take it."""
+        with self._cv:
+            while True:
+                now = monotonic()
+                for key, (url, kwargs, attempts, due) in self._pending.items():
+                    if due <= now:
+                        del self._pending[key]
+                        self._sending = key
+                        return key, url, kwargs, attempts
+                self._cv.wait(
+                    min(update[3] for update in self._pending.values()) - now
+                    if self._pending
+                    else None
+                )
+
+    def _send_loop(self):
+        if self.session is None:
+            self.session = http_session()
+        while True:
+            key, url, kwargs, attempts = self._next()
+            ok = retry = False
+            try:
+                response = self.session.post(
+                    url, timeout=self.timeout, **kwargs
+                )
+                ok = response.ok
+                if not ok:
+                    print_to_logfile(
+                        f"Failed to send update {key}: server error "
+                        f"{response.status_code}: {response.text}"
+                    )
+                    # client errors (e.g. 401) would just fail again
+                    retry = (
+                        response.status_code >= 500
+                        or response.status_code in (408, 429)
+                    )
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile(f"Failed to send update {key}:", e)
+                retry = True
+
+            with self._cv:
+                self._sending = None
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                    if retry and key not in self._pending:  # not replaced
+                        delay = min(
+                            self.backoff * 2**attempts, self.max_backoff
+                        )
+                        self._pending[key] = [
+                            url,
+                            kwargs,
+                            attempts + 1,
+                            monotonic() + delay * (1 + random()),
+                        ]
+                self._cv.notify_all()
+
+
+def _pypresence_client():
+    from pypresence import Client
+
+    return Client(client_id=config.DISCORD_ID)
+
+
+class DiscordPresence:
+    """
+    Shows the latest activity passed to `update` as the Discord rich presence,
+    from one background thread. Discord allows one update every `interval`
+    secs, so activities in between are coalesced and only the latest is sent
+    once it's allowed, without blocking the caller. Connects when `start` is
+    called, and reconnects after errors, waiting `reconnect_delay` secs
+    (doubling up to `max_reconnect_delay`) between attempts.
+
+    `client_factory` makes the RPC client (default: pypresence's `Client`);
+    anything with `start`, `set_activity(**activity)` and `close` will do, so
+    a fake client can stand in for Discord. `on_change` is called when
+    `status` changes.
+    """
+
+    DISCONNECTED, CONNECTED, CONNECTING = 0, 1, 2
+
+    def __init__(
+        self,
+        client_factory=_pypresence_client,
+        interval=config.DISCORD_UPDATE_INTERVAL,
+        reconnect_delay=config.DISCORD_RECONNECT_DELAY,
+        max_reconnect_delay=config.DISCORD_MAX_RECONNECT_DELAY,
+        on_change=None,
+    ):
+        self.client_factory = client_factory
+        self.interval = interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_change = on_change
+        self.status = self.DISCONNECTED
+
+        self.sent = 0  # activities shown
+        self.coalesced = 0  # activities replaced by a newer one before sending
+        self.dropped = 0  # activities discarded by `stop` before sending
+        self.errors = 0  # failed connection attempts and updates
+
+        self._activity = None  # latest activity not shown yet
+        self._sending = False
+        self._last_attempt = None  # monotonic time
+        self._running = False
+        self._closed = False
+        self._cv = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._cv:
+            self._running = True
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._dispatch_loop, daemon=True
+                )
+                self._thread.start()
+            self._cv.notify_all()
+
+    def stop(self):
+        """Disconnect (in the background), discarding any activity not
+        shown yet."""
+        with self._cv:
+            self._running = False
+            if self._activity is not None:
+                self.dropped += 1
+                self._activity = None
+            self._cv.notify_all()
+
+    def close(self, timeout=1):
+        """`stop`, and wait up to `timeout` secs for the client to disconnect
+        and the background thread to exit. `on_change` isn't called once
+        this returns."""
+        self.on_change = None
+        with self._cv:
+            self._closed = True
+        self.stop()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def update(self, activity: dict):
+        """Show `activity` (keyword arguments for `set_activity`) as soon as
+        Discord allows, unless a newer one replaces it first."""
+        with self._cv:
+            if self._activity is not None:
+                self.coalesced += 1
+            self._activity = activity
+            self._cv.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until the latest activity is shown (or `timeout` secs pass,
+        if not None). Returns whether it was."""
+        with self._cv:
+            return self._cv.wait_for(
+                lambda: not self._running
+                or self._activity is None
+                and not self._sending,
+                timeout,
+            )
+
+    def _set_status(self, status):
+        if status != self.status:
+            self.status = status
+            on_change = self.on_change  # `close` may clear it meanwhile
+            if on_change is not None:
+                on_change()
+
+    def _wait_until(self, predicate, deadline=None):
+        """Wait on `_cv` (held) until `predicate()`, `stop` is called, or
+        the monotonic `deadline` passes. Returns whether still running."""
+        while self._running and not predicate():
+            if deadline is None:
+                self._cv.wait()
+            elif deadline <= monotonic():
+                break
+            else:
+                self._cv.wait(deadline - monotonic())
+        return self._running
 
-    def restart(self):
-        self.terminate()
-        self.start()
+    def _dispatch_loop(self):
+        client = None
+        delay = self.reconnect_delay
+        while True:
+            with self._cv:
+                if not self._running and client is None:
+                    self._set_status(self.DISCONNECTED)
+                    self._cv.wait_for(lambda: self._running or self._closed)
+                    if self._closed:
+                        return
+            if not self._running:  # stopped while connected
+                self._close(client)
+                client = None
+                continue
+
+            if client is None:
+                self._set_status(self.CONNECTING)
+                try:
+                    client = self.client_factory()
+                    client.start()
+                except ImportError:
+                    print_to_logfile(
+                        "pypresence not installed. Discord presence will be "
+                        "disabled."
+                    )
+                    self.stop()
+                    continue
+                except Exception as e:  # pylint: disable=broad-except
+                    print_to_logfile("Discord connection error:", e)
+                    self.errors += 1
+                    client = None
+                    self._set_status(self.DISCONNECTED)
+                    with self._cv:
+                        self._wait_until(
+                            lambda: False, monotonic() + delay * (1 + random())
+                        )
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+                delay = self.reconnect_delay
+                self._set_status(self.CONNECTED)
+
+            with self._cv:
+                if not self._wait_until(lambda: self._activity is not None):
+                    continue
+                if self._last_attempt is not None and not self._wait_until(
+                    lambda: False, self._last_attempt + self.interval
+                ):
+                    continue
+                activity, self._activity = self._activity, None
+                self._sending = True
 
-    def write(self, chunk):
-        if self.process is not None:
+            self._last_attempt = monotonic()
             try:
-                self.process.stdin.write(chunk)
-            except BrokenPipeError as e:  # pylint: disable=unused-variable
-                print_to_logfile("FFmpeg processs error:", e)
+                client.set_activity(**activity)
+                self.sent += 1
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile("Discord update error:", e)
+                self.errors += 1
+                self._close(client)
+                client = None
+            with self._cv:
+                self._sending = False
+                if (
+                    client is None
+                    and self._running
+                    and self._activity is None
+                ):
+                    self._activity = activity  # retry once reconnected
+                self._cv.notify_all()
+
+    def _close(self, client):
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile("Discord disconnection error:", e)
 
 
 class PlaybackHandler:
@@ -596,6 +3174,7 @@ class PlaybackHandler:
         creds,
         want_lyrics,
         want_translated_lyrics,
+        show_render_stats=False,
     ):
         from just_playback import Playback
 
@@ -604,7 +3183,7 @@ class PlaybackHandler:
             len(playlist), stdscr.getmaxyx()[0] - 2  # -2 for status bar
         )
         self.playlist = playlist
-        self.i = 0
+        self._i = 0
         self._volume = 0
         self.clip_mode = clip_mode
         self.want_discord = False
@@ -615,6 +3194,10 @@ class PlaybackHandler:
         self.want_translated_lyrics = want_translated_lyrics and want_lyrics
 
         self.playback = Playback()
+        self._preload = None  # (song, thread, [Playback]); see preload
+        self._fading_out = None  # Playback; see fade_out
+        self._fade_thread = None
+        self._artwork = None  # (song, JPEG or None); see artwork
         self._paused = False
         self.last_timestamp = 0
         self.looping_current_song = config.LOOP_MODES["none"]
@@ -630,11 +3213,7 @@ class PlaybackHandler:
         self.mac_now_playing = None
         self.update_now_playing = False
 
-        self.discord_connected = 2
-        self.discord_rpc = None
-        self.discord_last_update = 0
-        self.can_update_discord = True  # pypresence installed
-        self.discord_updating = False  # lock
+        self.discord = DiscordPresence(on_change=self.update_screen)
 
         self._librosa = None
         self.can_visualize = True
@@ -646,17 +3225,22 @@ class PlaybackHandler:
 
         self.audio_data = None
         self.audio_data = {}  # dict(song_id: (vis data, stream data))
+        self.audio_workers = WorkerPool(config.AUDIO_WORKERS)
+        self._audio_lock = threading.Lock()
+        self._loading = set()  # songs with a `_load_audio` queued or running
+        self._audio_wakeup = threading.Event()  # set when the song changes
         self.audio_processing_thread = threading.Thread(
             target=self._audio_processing_loop,
             daemon=True,
         )
         self.audio_processing_thread.start()
-        self.compiled = None
 
+        self.uplink = MetadataUplink()  # stream metadata and artwork
         self.ffmpeg_process = FFmpegProcessHandler(self.username, self.password)
         if self.want_stream:
             self.ffmpeg_process.start()
         self.break_stream_loop = False
+        self.pcm_writer = PCMWriter(self.ffmpeg_process.write)
         self.streaming_thread = threading.Thread(
             target=self._streaming_loop,
             daemon=True,
@@ -674,36 +3258,42 @@ class PlaybackHandler:
 
         self._focus = 0  # 0: queue, 1: lyrics
 
-    def _load_audio(self, path, sr):
-        import numpy as np
-
-        # shape = (# channels, # frames)
-        audio_data = self._librosa.load(path, mono=False, sr=sr)[0]
-
-        if len(audio_data.shape) == 1:  # mono -> stereo
-            audio_data = np.repeat([audio_data], 2, axis=0)
-        elif audio_data.shape[0] == 1:  # mono -> stereo
-            audio_data = np.repeat(audio_data, 2, axis=0)
-        elif audio_data.shape[0] == 6:  # 5.1 -> stereo
-            audio_data = np.delete(audio_data, (1, 3, 4, 5), axis=0)
-
-        return audio_data
+        self.render_scheduler = RenderScheduler(
+            lambda: self.output(self.playback.curr_pos), config.FPS
+        )
+        # see output
+        self._full_redraw = True
+        self._last_full_redraw = 0
+        self._last_pane_keys = None
+        self.show_render_stats = show_render_stats
+        self.events = EventWaiter(stdscr)
+
+    def _process_audio(self, song, path, vis, stream, priority=0):
+        """
+        Returns (`SpectrogramStream` (computed on `audio_workers` with
+        `priority`) if `vis` else None, `PCMStream` if `stream` else None) for
+        `song`.
+        """
+        vis_data = (
+            SpectrogramStream(song, path, self.audio_workers, priority)
+            if vis
+            else None
+        )
+        stream_data = PCMStream(path) if stream else None
+        return vis_data, stream_data
 
     def _audio_processing_loop(self):
-        import numpy as np
-
+        """
+        Keeps `audio_data` prepared for the current song and the next
+        `config.AUDIO_LOOKAHEAD` on `audio_workers`, the current song first,
+        then by distance from it. Songs that leave that window are dropped,
+        cancelling their pending jobs. Rechecks when the song changes, and
+        every second (e.g. for toggling visualization or streaming).
+        """
         try:
-            from librosa import load, stft, amplitude_to_db
+            import librosa
 
-            self._librosa = type(
-                "librosa",
-                (),
-                {
-                    "load": staticmethod(load),
-                    "stft": staticmethod(stft),
-                    "amplitude_to_db": staticmethod(amplitude_to_db),
-                },
-            )
+            self._librosa = librosa
         except ImportError:
             self.can_visualize = False
             self.can_show_visualization = False
@@ -713,117 +3303,81 @@ class PlaybackHandler:
 
         while True:
             try:
-                keys_to_delete = []
-                for k in self.audio_data:
-                    if k not in self.playlist[self.i : self.i + 5]:
-                        keys_to_delete.append(k)
-                for k in keys_to_delete:
-                    del self.audio_data[k]
-
-                for i in range(self.i, min(self.i + 5, len(self.playlist))):
-                    processing_song = self.playlist[i]
-
-                    if self.song != processing_song and (
-                        self.song not in self.audio_data
-                        or (
-                            self.want_vis
-                            and self.audio_data[self.song][0] is None
-                        )
-                        or (
-                            self.want_stream
-                            and self.audio_data[self.song][1] is None
-                        )
-                    ):
-                        break
-                    if processing_song in self.audio_data and (
-                        (
-                            self.audio_data[processing_song][0] is not None
-                            or not self.want_vis
-                        )
-                        and (
-                            self.audio_data[processing_song][1] is not None
-                            or not self.want_stream
-                        )
-                        or self._librosa is None
-                    ):
-                        continue
-
-                    processing_song_path = (
-                        os.path.join(  # NOTE: NOT SAME AS self.song_path
-                            config.settings["song_directory"],
-                            self.playlist[i].song_file,
-                        )
+                self._schedule_audio()
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile("Error scheduling audio processing:", e)
+
+            self._audio_wakeup.wait(1)
+            self._audio_wakeup.clear()
+
+    def _audio_window(self):
+        """dict(song: distance from the current song) for the songs whose
+        audio should be prepared."""
+        window = {}
+        for distance, song in enumerate(
+            self.playlist[self.i : self.i + config.AUDIO_LOOKAHEAD + 1]
+        ):
+            window.setdefault(song, distance)
+        return window
+
+    def _schedule_audio(self):
+        window = self._audio_window()
+        with self._audio_lock:
+            for song in list(self.audio_data):
+                if song not in window:
+                    if self.audio_workers.cancel(song):
+                        self._loading.discard(song)
+                    for data in self.audio_data.pop(song):
+                        if data is not None:
+                            data.close()
+
+            if self._librosa is None:
+                return
+            for song, distance in window.items():
+                data = self.audio_data.setdefault(song, [None, None])
+                if data[0] is not None:
+                    data[0].priority = distance
+                vis = data[0] is None and self.want_vis and self.can_visualize
+                stream = data[1] is None and self.want_stream
+                # a running load finishes before the song is loaded again
+                if (vis or stream) and song not in self._loading:
+                    self._loading.add(song)
+                    self.audio_workers.submit(
+                        (False, distance),  # see SpectrogramStream
+                        song,
+                        self._load_audio,
+                        song,
+                        distance,
+                        vis,
+                        stream,
                     )
 
-                    if processing_song not in self.audio_data:
-                        self.audio_data[processing_song] = [
-                            (
-                                self._librosa.amplitude_to_db(
-                                    np.abs(
-                                        self._librosa.stft(
-                                            self._load_audio(
-                                                processing_song_path,
-                                                sr=config.VIS_SAMPLE_RATE,
-                                            )
-                                        )
-                                    ),
-                                    ref=np.max,
-                                )
-                                + 80
-                                if self.want_vis and self.can_visualize
-                                else None
-                            ),
-                            (
-                                np.int16(
-                                    self._load_audio(
-                                        processing_song_path,
-                                        sr=config.STREAM_SAMPLE_RATE,
-                                    )
-                                    * (2**15 - 1)
-                                    * 0.5  # reduce volume (avoid clipping)
-                                )  # convert to 16-bit PCM
-                                if self.want_stream
-                                else None
-                            ),
-                        ]
+    def _load_audio(self, song, distance, vis, stream):
+        path = os.path.join(  # NOTE: NOT SAME AS self.song_path
+            config.settings["song_directory"], song.song_file
+        )
+        vis_data = stream_data = None
+        try:
+            vis_data, stream_data = self._process_audio(
+                song, path, vis, stream, distance
+            )
+        finally:
+            with self._audio_lock:
+                self._loading.discard(song)
+                data = self.audio_data.get(song)
+                if vis_data is not None:
+                    if data is not None and data[0] is None:
+                        data[0] = vis_data
+                    else:  # left the window meanwhile, or already loaded
+                        vis_data.close()
+                if stream_data is not None:
+                    if data is not None and data[1] is None:
+                        data[1] = stream_data
                     else:
-                        if (
-                            self.audio_data[processing_song][0] is None
-                            and self.want_vis
-                            and self.can_visualize
-                        ):
-                            self.audio_data[processing_song][0] = (
-                                self._librosa.amplitude_to_db(
-                                    np.abs(
-                                        self._librosa.stft(
-                                            self._load_audio(
-                                                processing_song_path,
-                                                sr=config.VIS_SAMPLE_RATE,
-                                            )
-                                        )
-                                    ),
-                                    ref=np.max,
-                                )
-                                + 80
-                            )
-                        if (
-                            self.audio_data[processing_song][1] is None
-                            and self.want_stream
-                        ):
-                            self.audio_data[processing_song][1] = np.int16(
-                                self._load_audio(
-                                    processing_song_path,
-                                    sr=config.STREAM_SAMPLE_RATE,
-                                )
-                                * (2**15 - 1)
-                                * 0.5  # reduce volume (avoid clipping)
-                            )  # convert to 16-bit PCM
-            except:  # hacky fix  # pylint: disable=bare-except
-                pass
-
-            sleep(1)
+                        stream_data.close()
 
     def _streaming_loop(self):
+        done = None  # song streamed to the end, until it's seeked or replayed
         while True:
             if (
                 self.want_stream
@@ -835,35 +3389,23 @@ class PlaybackHandler:
                 # is 0 for a while after resuming, and is -1 if playback is
                 # inactive or file is not loaded
                 and self.playback.curr_pos > 0
+                and (self.song != done or self.break_stream_loop)
             ):
-                for fpos in range(
-                    int(self.playback.curr_pos * config.STREAM_SAMPLE_RATE),
-                    self.audio_data[self.song][1].shape[1],
-                    config.STREAM_CHUNK_SIZE,
+                self.break_stream_loop = False
+                done = None
+                silence = memoryview(bytes(4 * config.STREAM_CHUNK_SIZE))
+                for chunk in self.audio_data[self.song][1].chunks(
+                    int(self.playback.curr_pos * config.STREAM_SAMPLE_RATE)
                 ):
-                    try:
-                        # print_to_logfile(
-                        #     self.song_id,
-                        #     fpos / config.STREAM_SAMPLE_RATE,
-                        #     self.playback.curr_pos,
-                        # )  # DEBUG
-                        self.ffmpeg_process.write(
-                            self.audio_data[self.song][1][
-                                :,
-                                fpos : fpos + config.STREAM_CHUNK_SIZE,
-                            ]
-                            .reshape((-1,), order="F")
-                            .tobytes()
-                            if not self.paused
-                            else b"\x00" * 4 * config.STREAM_CHUNK_SIZE
-                        )
-                    except KeyError as e:
-                        print_to_logfile("KeyError in streaming loop:", e)
-                        self.update_stream_metadata()
+                    while self.paused and not self.break_stream_loop:
+                        self.pcm_writer.put(silence)
+                    self.pcm_writer.put(chunk)
 
                     if self.break_stream_loop:
-                        self.break_stream_loop = False
+                        self.pcm_writer.clear()
                         break
+                else:
+                    done = self.song
 
             sleep(0.01)
 
@@ -877,7 +3419,12 @@ class PlaybackHandler:
     def paused(self, value):
         self._paused = value
         if self.want_stream:
-            self.threaded_update_icecast_metadata()
+            self.update_icecast_metadata()
+
+    @property
+    def discord_connected(self):
+        """0 if disconnected, 1 if connected, 2 if connecting."""
+        return self.discord.status
 
     @property
     def volume(self):
@@ -899,6 +3446,15 @@ class PlaybackHandler:
             value = False
         self._want_stream = value
 
+    @property
+    def i(self):
+        return self._i
+
+    @i.setter
+    def i(self, value):
+        self._i = value
+        self._audio_wakeup.set()  # prepare the new song's audio first
+
     @property
     def song(self):
         return self.playlist[self.i]
@@ -933,11 +3489,14 @@ class PlaybackHandler:
 
     @property
     def artwork(self):
-        return (
-            self.song.artwork.raw_thumbnail([1024, 1024])
-            if self.song.artwork
-            else None
-        )
+        if self._artwork is None or self._artwork[0] is not self.song:
+            try:
+                artwork = ARTWORK_CACHE.get(self.song)
+            except Exception as e:
+                print_to_logfile("Failed to load artwork:", e)
+                artwork = None
+            self._artwork = (self.song, artwork)
+        return self._artwork[1]
 
     @property
     def screen_height(self):
@@ -967,7 +3526,9 @@ class PlaybackHandler:
 
     # endregion
 
-    def seek(self, pos):
+    def seek(self, pos, stop_fade=True):
+        if stop_fade:  # don't keep playing the last song over the new spot
+            self.stop_fade()
         if self.playback is not None:
             pos = max(self.clip[0] if self.clip_mode else 0, pos)
             self.playback.seek(pos)
@@ -1008,12 +3569,100 @@ class PlaybackHandler:
         """Set volume w/o changing self.volume."""
         self.playback.set_volume(v / 100)
 
+    def preload(self, song):
+        """
+        Open `song` in a new `Playback` in the background (unless it's already
+        being preloaded), so that `load` can switch to it without waiting,
+        e.g. for a big file on a network mount to be opened and probed.
+        """
+        if self._preload is not None and self._preload[0] is song:
+            return
+
+        def f(result):
+            from just_playback import Playback
+
+            playback = Playback()
+            try:
+                playback.load_file(song.song_path)
+            except Exception as e:  # pylint: disable=broad-except
+                print_to_logfile(f"Failed to preload {song.song_path}:", e)
+                return
+            result.append(playback)
+
+        result = []
+        thread = threading.Thread(target=f, args=(result,), daemon=True)
+        thread.start()
+        self._preload = (song, thread, result)
+
+    def preloaded(self, song):
+        """Whether `song` has been preloaded (see `preload`)."""
+        return (
+            self._preload is not None
+            and self._preload[0] is song
+            and bool(self._preload[2])
+        )
+
+    def load(self):
+        """Load the current song into `playback`: the preloaded `Playback` if
+        the current song was preloaded (waiting for it to finish loading),
+        otherwise a fresh one."""
+        preload, self._preload = self._preload, None
+        if preload is not None and preload[0] is self.song:
+            preload[1].join()
+            if preload[2]:
+                self.playback = preload[2][0]
+                return
+
+        if self.playback is self._fading_out:
+            from just_playback import Playback
+
+            self.playback = Playback()
+        self.playback.load_file(self.song_path)
+
+    def fade_out(self, secs):
+        """Keep playing the current song, fading it out over `secs` secs in the
+        background before stopping it, e.g. to crossfade into the next song
+        (`load` won't reuse its `Playback`). The fade follows `paused` and
+        `volume`, and `stop_fade` cuts it short."""
+        self.stop_fade()
+        playback = self._fading_out = self.playback
+
+        def f():
+            left = secs
+            last = monotonic()
+            paused = False
+            while left > 0 and self._fading_out is playback:
+                if self.paused != paused:
+                    paused = self.paused
+                    if paused:
+                        playback.pause()
+                    else:
+                        playback.resume()
+                now = monotonic()
+                if not paused:
+                    left -= now - last
+                last = now
+                playback.set_volume(self.volume / 100 * max(left, 0) / secs)
+                sleep(1 / config.FPS)
+            playback.stop()
+
+        self._fade_thread = threading.Thread(target=f, daemon=True)
+        self._fade_thread.start()
+
+    def stop_fade(self):
+        """Stop the song fading out (see `fade_out`), if any, right away."""
+        thread, self._fade_thread = self._fade_thread, None
+        self._fading_out = None
+        if thread is not None:
+            thread.join()
+
     def quit(self):
+        self.stop_fade()
         self.playback.stop()
         if self.ffmpeg_process is not None:
             self.ffmpeg_process.terminate()
-        if self.discord_rpc is not None:
-            self.discord_rpc.close()
+        self.discord.close()  # before events, which its on_change wakes
+        self.events.close()
 
     def prompting_delete_char(self):
         if self.prompting[1] > 0:
@@ -1025,85 +3674,41 @@ class PlaybackHandler:
             )
 
     def update_screen(self):
-        self.output(self.playback.curr_pos)
-
-    def connect_to_discord(self):
-        try:
-            from pypresence import Client as DiscordRPCClient
-        except ImportError:
-            print_to_logfile(
-                "pypresence not installed. Discord presence will be disabled."
-            )
-            self.can_update_discord = False
-        discord_rpc = DiscordRPCClient(client_id=config.DISCORD_ID)
-        discord_rpc.start()
-        return discord_rpc
+        """Redraw the whole screen on the next `render_scheduler.tick`."""
+        self._full_redraw = True
+        self.render_scheduler.request()
+        if threading.current_thread() is not threading.main_thread():
+            self.events.wake()
 
     def update_discord_metadata(self):
-        if self.discord_updating:
+        """Show the current song in the Discord rich presence (as soon as
+        Discord allows; see `DiscordPresence`)."""
+        if not self.want_discord:
             return
-        if self.can_update_discord and self.want_discord:
-            self.discord_updating = True
-
-            t = time()
-            if self.discord_last_update + 15 > t:
-                sleep(15 - (t - self.discord_last_update))
-            song_name, artist_name, album_name = "", "", ""
 
+        d = dict(
             # minimum 2 characters (Discord requirement)
-            new_song_name = self.song_title.ljust(2)
-            new_artist_name = "by " + self.song_artist
-            new_album_name = self.song_album.ljust(2)
-
-            if (
-                new_song_name != song_name
-                or new_artist_name != artist_name
-                or new_album_name != album_name
-            ):
-                song_name = new_song_name
-                artist_name = new_artist_name
-                album_name = new_album_name
-
-                d = dict(
-                    details=song_name,
-                    state=artist_name,
-                    large_image=(
-                        f"{config.IMAGE_URL}/{self.username}?_={time()}"
-                        if self.username
-                        else "maestro-icon"
-                    ),
-                    small_image="maestro-icon-small",
-                    large_text=album_name,
-                    buttons=(
-                        [
-                            {
-                                "label": "Listen Along",
-                                "url": f"{config.MAESTRO_SITE}/listen-along/{self.username}",
-                            }
-                        ]
-                        if self.username and self.want_stream
-                        else None
-                    ),
-                )
-                d = {k: v for k, v in d.items() if v is not None}
-
-                try:
-                    self.discord_rpc.set_activity(**d)
-                    self.discord_last_update = time()
-                except Exception as e:  # pylint: disable=bare-except
-                    print_to_logfile("Discord update error:", e)
-                    song_name, artist_name, album_name = "", "", ""
-                    self.discord_connected = 2
-                    try:
-                        self.discord_rpc = self.connect_to_discord()
-                        self.discord_connected = 1
-                        self.discord_updating = False
-                        self.update_discord_metadata()
-                    except Exception as err:
-                        print_to_logfile("Discord connection error:", err)
-                        self.discord_connected = 0
-                finally:
-                    self.discord_updating = False
+            details=self.song_title.ljust(2),
+            state="by " + self.song_artist,
+            large_image=(
+                f"{config.IMAGE_URL}/{self.username}?_={time()}"
+                if self.username
+                else "maestro-icon"
+            ),
+            small_image="maestro-icon-small",
+            large_text=self.song_album.ljust(2),
+            buttons=(
+                [
+                    {
+                        "label": "Listen Along",
+                        "url": f"{config.MAESTRO_SITE}/listen-along/{self.username}",
+                    }
+                ]
+                if self.username and self.want_stream
+                else None
+            ),
+        )
+        self.discord.update({k: v for k, v in d.items() if v is not None})
 
     def update_mac_now_playing_metadata(self):
         from maestro.icon import img as default_artwork
@@ -1128,9 +3733,10 @@ class PlaybackHandler:
             self.update_now_playing = True
 
     def update_icecast_metadata(self):
-        import requests
-
-        return requests.post(
+        """Queue the current song and paused state to be sent to the stream
+        (see `MetadataUplink`)."""
+        self.uplink.put(
+            ("metadata", self.username),
             config.UPDATE_METADATA_URL,
             data={
                 "mount": self.username,
@@ -1141,78 +3747,108 @@ class PlaybackHandler:
                 "paused": int(self.paused),
             },
             auth=(self.username, self.password),
-            timeout=5,
         )
 
-    def icecast_metadata_update_loop(self):
-        success = False
-        last_metadata_update_attempt = 0
-        while not success:
-            t = time()
-            if t - last_metadata_update_attempt > 5:
-                try:
-                    response = self.update_icecast_metadata()
-                    if response.ok:
-                        last_metadata_update_attempt = 0
-                        success = True
-                    else:
-                        raise Exception(
-                            f"Icecast Server error {response.status_code}: {response.text}"
-                        )
-                except Exception as e:  # retry in 5 seconds
-                    print_to_logfile("Update metadata failed:", e)
-                    last_metadata_update_attempt = t
-            sleep(0.01)
-
-    def threaded_update_icecast_metadata(self):
-        threading.Thread(
-            target=self.icecast_metadata_update_loop, daemon=True
-        ).start()
-
     def update_stream_metadata(self):  # artwork + icecast metadata
-        import requests
-
         self.break_stream_loop = True
         if (
             self.discord_connected
             or self.want_stream
             and self.username is not None
         ):
-            if not requests.post(
+            self.uplink.put(
+                ("artwork", self.username),
                 config.UPDATE_ARTWORK_URL,
                 params={"mount": self.username},
                 files={"artwork": self.artwork},
                 auth=(self.username, self.password),
-                timeout=5,
-            ).ok:
-                print_to_logfile("Failed to update artwork.")
+            )
 
         if self.want_stream:
-            self.threaded_update_icecast_metadata()
+            self.update_icecast_metadata()
 
     def update_metadata(self):
         def f():
             self.update_mac_now_playing_metadata()
             self.update_stream_metadata()
+            if self.want_discord:
+                # so Discord shows the new song's artwork
+                self.uplink.flush(config.HTTP_TIMEOUT)
             self.update_discord_metadata()
 
         threading.Thread(target=f, daemon=True).start()
 
     def initialize_discord(self):
+        """Connect to Discord in the background."""
         self.want_discord = True
-        try:
-            self.discord_rpc = self.connect_to_discord()
-            self.discord_connected = 1
-        except Exception as e:  # pylint: disable=broad-except,unused-variable
-            self.discord_connected = 0
-            print_to_logfile("Discord connection error:", e)
-
-    def threaded_initialize_discord(self):
-        threading.Thread(target=self.initialize_discord, daemon=True).start()
+        self.discord.start()
 
     def output(self, pos):
-        from maestro.jit_funcs import render
+        """
+        Draw the screen at playback position `pos`. Everything is redrawn
+        after `update_screen` (e.g. on input), every
+        `config.FULL_REDRAW_INTERVAL` seconds (to show changes made by other
+        threads, like Discord connecting), and while the help or a prompt is
+        showing. Otherwise only the panes that playback progress changes (the
+        progress bar, the visualizer, and the lyrics) are redrawn, and only
+        if what they show changed.
+        """
+        pane_keys = self._pane_keys(pos)
+        if (
+            self._full_redraw
+            or self.show_help
+            or self.prompting is not None
+            or monotonic() - self._last_full_redraw
+            >= config.FULL_REDRAW_INTERVAL
+        ):
+            self._full_redraw = False
+            self._last_full_redraw = monotonic()
+            self._output_screen(pos)
+        else:
+            screen_height = self.screen_height
+            screen_width = self.screen_width - (
+                self.lyrics_width if self.want_lyrics else 0
+            )
+            if pane_keys["progress"] != self._last_pane_keys["progress"]:
+                self._output_progress_bar(
+                    pos - (self.clip[0] if self.clip_mode else 0),
+                    screen_height,
+                    screen_width,
+                )
+            if pane_keys["visualizer"] != self._last_pane_keys["visualizer"]:
+                self._output_visualizer(pos, screen_height, screen_width)
+            if pane_keys["lyrics"] != self._last_pane_keys["lyrics"]:
+                for y in range(screen_height):
+                    self.stdscr.move(y, screen_width)
+                    self.stdscr.clrtoeol()
+                self._output_lyrics(pos, screen_height, screen_width)
+            self.stdscr.noutrefresh()
+            curses.doupdate()
+        self._last_pane_keys = pane_keys
+
+    def _pane_keys(self, pos):
+        """What each pane redrawn by playback progress shows at `pos`; a pane
+        is only redrawn if its key changed."""
+        screen_width = self.screen_width - (
+            self.lyrics_width if self.want_lyrics else 0
+        )
+        rel_pos = pos - (self.clip[0] if self.clip_mode else 0)
+        return {
+            "progress": (
+                int(rel_pos),
+                int(rel_pos * screen_width * 8 // max(self.duration, 1e-3)),
+            ),
+            "visualizer": (
+                round(pos * config.FPS)
+                if self.can_show_visualization
+                else None
+            ),
+            "lyrics": (
+                self._current_lyric(pos) if self.can_show_lyrics else None
+            ),
+        }
 
+    def _output_screen(self, pos):
         screen_height = self.screen_height
         if self.want_lyrics:
             screen_width = self.screen_width - self.lyrics_width
@@ -1285,9 +3921,14 @@ class PlaybackHandler:
             elif self.song not in self.audio_data:
                 visualize_message = "Loading visualization..."
                 visualize_color = 12
-            elif not self.compiled:
-                visualize_message = "Compiling renderer..."
-                visualize_color = 12
+
+        if self.show_render_stats:
+            scheduler = self.render_scheduler
+            visualize_message = (
+                f"{scheduler.fps} fps (target {scheduler.target_fps:.0f}), "
+                f"{scheduler.frame_time * 1000:.1f} ms/frame"
+                + (f"  {visualize_message}" if visualize_message else "")
+            )
 
         if self.want_stream:
             prefix = "  " if self.want_discord else ""
@@ -1339,9 +3980,6 @@ class PlaybackHandler:
         self.stdscr.move(1, 0)
 
         song_display_color = 5 if self.looping_current_song else 3
-        progress_bar_display_color = (
-            17 if (self.clip_mode and self.clip != (0, self.duration)) else 15
-        )
 
         # for aligning song names
         longest_song_id_length = max(
@@ -1516,26 +4154,148 @@ class PlaybackHandler:
                     song_data_length_so_far,
                     curses.color_pair(12) | curses.A_ITALIC,
                 )
-            except:  # pylint: disable=bare-except
-                self.italic = False
-                print_to_logfile("Failed to italicize text in curses.")
-        if not self.italic:
-            song_data_length_so_far = addstr_fit_to_width(
-                self.stdscr,
-                self.song_album,
-                screen_width,
-                song_data_length_so_far,
-                curses.color_pair(12),
+            except:  # pylint: disable=bare-except
+                self.italic = False
+                print_to_logfile("Failed to italicize text in curses.")
+        if not self.italic:
+            song_data_length_so_far = addstr_fit_to_width(
+                self.stdscr,
+                self.song_album,
+                screen_width,
+                song_data_length_so_far,
+                curses.color_pair(12),
+            )
+
+        addstr_fit_to_width(
+            self.stdscr,
+            f" ({self.album_artist})",
+            screen_width,
+            song_data_length_so_far,
+            curses.color_pair(12),
+        )
+
+        self._output_progress_bar(pos, screen_height, screen_width)
+
+        # right align volume bar
+        if not volume_line_length_so_far >= screen_width:
+            self.stdscr.move(
+                screen_height
+                - 3
+                - (
+                    config.VISUALIZER_HEIGHT
+                    if self.can_show_visualization
+                    else 0
+                ),
+                volume_line_length_so_far,
+            )
+            if (
+                screen_width - volume_line_length_so_far
+                >= config.MIN_VOLUME_BAR_WIDTH + 10
+            ):
+                bar = f"{str(int(self.volume)).rjust(3)}/100 |"
+                volume_bar_width = min(
+                    screen_width - volume_line_length_so_far - (len(bar) + 1),
+                    config.MAX_VOLUME_BAR_WIDTH,
+                )
+                block_width = int(volume_bar_width * 8 * self.volume / 100)
+                for _ in range(volume_bar_width):
+                    if block_width > 8:
+                        bar += config.HORIZONTAL_BLOCKS[8]
+                        block_width -= 8
+                    elif block_width > 0:
+                        bar += config.HORIZONTAL_BLOCKS[block_width]
+                        block_width = 0
+                    else:
+                        bar += " "
+                bar += "|"
+                bar = bar.rjust(screen_width - volume_line_length_so_far)
+
+                self.stdscr.addstr(bar, curses.color_pair(16))
+            elif screen_width - volume_line_length_so_far >= 7:
+                self.stdscr.addstr(
+                    f"{str(int(self.volume)).rjust(3)}/100".rjust(
+                        screen_width - volume_line_length_so_far
+                    ),
+                    curses.color_pair(16),
+                )
+
+        if self.clip_mode:
+            pos += self.clip[0]
+        if self.can_show_visualization:
+            self._output_visualizer(pos, screen_height, screen_width)
+        self._output_lyrics(pos, screen_height, screen_width)
+
+        if self.show_help:
+            l = 15
+            r = self.screen_width - l
+            t = 5
+            b = self.screen_height - t
+
+            if l < r and t < b:
+                # draw border
+                self.stdscr.addch(t, l, curses.ACS_ULCORNER)
+                self.stdscr.addch(t, r, curses.ACS_URCORNER)
+                self.stdscr.addch(b, l, curses.ACS_LLCORNER)
+                self.stdscr.addch(b, r, curses.ACS_LRCORNER)
+                for x in range(l + 1, r):
+                    self.stdscr.addch(t, x, curses.ACS_HLINE)
+                    self.stdscr.addch(b, x, curses.ACS_HLINE)
+                for y in range(t + 1, b):
+                    self.stdscr.addch(y, l, curses.ACS_VLINE)
+                    self.stdscr.addch(y, r, curses.ACS_VLINE)
+
+                # draw text
+                self.stdscr.move(t + 1, l + 1)
+                i = max(
+                    0,
+                    min(self.help_pos, len(config.PLAY_CONTROLS) - (b - t - 1)),
+                )
+                while self.stdscr.getyx()[0] < b:
+                    if i < len(config.PLAY_CONTROLS):
+                        key, desc = config.PLAY_CONTROLS[i]
+                        length_so_far = addstr_fit_to_width(
+                            self.stdscr,
+                            key
+                            + " " * (config.INDENT_CONTROL_DESC - len(key))
+                            + " ",
+                            r - l - 1,
+                            0,
+                            curses.color_pair(18) | curses.A_BOLD,
+                        )
+                        length_so_far = addstr_fit_to_width(
+                            self.stdscr,
+                            desc
+                            + " " * (r - l - 1 - length_so_far - len(desc)),
+                            r - l - 1,
+                            length_so_far,
+                            curses.color_pair(18),
+                        )
+                        i += 1
+                        self.stdscr.move(self.stdscr.getyx()[0] + 1, l + 1)
+                    else:
+                        self.stdscr.addstr(" " * (r - l - 1))
+
+        if self.prompting is not None:
+            # pylint: disable=unsubscriptable-object
+            self.stdscr.move(
+                screen_height
+                - (
+                    config.VISUALIZER_HEIGHT
+                    if self.can_show_visualization
+                    else 0
+                )
+                - 4,  # 4 lines for status bar + adding entry
+                adding_song_length
+                + (self.prompting[1] - len(self.prompting[0])),
             )
 
-        addstr_fit_to_width(
-            self.stdscr,
-            f" ({self.album_artist})",
-            screen_width,
-            song_data_length_so_far,
-            curses.color_pair(12),
-        )
+        self.stdscr.noutrefresh()
+        curses.doupdate()
 
+    def _output_progress_bar(self, pos, screen_height, screen_width):
+        progress_bar_display_color = (
+            17 if (self.clip_mode and self.clip != (0, self.duration)) else 15
+        )
         self.stdscr.move(
             screen_height
             - (config.VISUALIZER_HEIGHT if self.can_show_visualization else 0)
@@ -1572,126 +4332,59 @@ class PlaybackHandler:
                     else:
                         bar += " "
 
-                self.stdscr.addstr(
-                    bar, curses.color_pair(progress_bar_display_color)
-                )
-                self.stdscr.insstr(  # hacky fix for curses bug
-                    "|", curses.color_pair(progress_bar_display_color)
+                addstr_to_line_end(
+                    self.stdscr,
+                    bar + "|",
+                    curses.color_pair(progress_bar_display_color),
                 )
             else:
-                self.stdscr.addstr(
-                    " " * (screen_width - length_so_far - 1),
-                    curses.color_pair(16),
-                )
-                self.stdscr.insstr(  # hacky fix for curses bug
-                    " ", curses.color_pair(16)
-                )
-
-        # right align volume bar
-        if not volume_line_length_so_far >= screen_width:
-            self.stdscr.move(
-                screen_height
-                - 3
-                - (
-                    config.VISUALIZER_HEIGHT
-                    if self.can_show_visualization
-                    else 0
-                ),
-                volume_line_length_so_far,
-            )
-            if (
-                screen_width - volume_line_length_so_far
-                >= config.MIN_VOLUME_BAR_WIDTH + 10
-            ):
-                bar = f"{str(int(self.volume)).rjust(3)}/100 |"
-                volume_bar_width = min(
-                    screen_width - volume_line_length_so_far - (len(bar) + 1),
-                    config.MAX_VOLUME_BAR_WIDTH,
-                )
-                block_width = int(volume_bar_width * 8 * self.volume / 100)
-                for _ in range(volume_bar_width):
-                    if block_width > 8:
-                        bar += config.HORIZONTAL_BLOCKS[8]
-                        block_width -= 8
-                    elif block_width > 0:
-                        bar += config.HORIZONTAL_BLOCKS[block_width]
-                        block_width = 0
-                    else:
-                        bar += " "
-                bar += "|"
-                bar = bar.rjust(screen_width - volume_line_length_so_far)
-
-                self.stdscr.addstr(bar, curses.color_pair(16))
-            elif screen_width - volume_line_length_so_far >= 7:
-                self.stdscr.addstr(
-                    f"{str(int(self.volume)).rjust(3)}/100".rjust(
-                        screen_width - volume_line_length_so_far
-                    ),
+                addstr_to_line_end(
+                    self.stdscr,
+                    " " * (screen_width - length_so_far),
                     curses.color_pair(16),
                 )
 
-        if self.can_show_visualization:
-            if self.clip_mode:
-                pos += self.clip[0]
+    def _output_visualizer(self, pos, screen_height, screen_width):
+        from maestro.jit_funcs import render
 
-            self.stdscr.move(
-                screen_height
-                - (
-                    config.VISUALIZER_HEIGHT
-                    if self.can_show_visualization
-                    else 0
-                ),
-                0,
+        self.stdscr.move(screen_height - config.VISUALIZER_HEIGHT, 0)
+        vdata = (
+            self.audio_data[self.song][0]
+            if self.song in self.audio_data
+            else None
+        )
+        # None if it hasn't been computed yet
+        frame = (
+            vdata.bands(
+                round(pos * config.FPS),
+                # stereo: channels side by side, separated by 1-2 columns
+                screen_width if vdata.mono else (screen_width - 1) // 2,
             )
-            if (
-                self.song not in self.audio_data
-                or self.audio_data[self.song][0] is None
-            ):
-                self.stdscr.addstr(
-                    (
-                        (" " * (screen_width - 1) + "\n")
-                        * config.VISUALIZER_HEIGHT
-                    ).rstrip()
-                )
-            elif not self.compiled:
-                if self.compiled is None:
-                    self.compiled = False
-
-                    def thread_func():
-                        vdata = self.audio_data[self.song][0]
-                        render(
-                            screen_width,
-                            vdata,
-                            min(round(pos * config.FPS), vdata.shape[2] - 1),
-                            config.VISUALIZER_HEIGHT,
-                        )
-                        self.compiled = True
-
-                    threading.Thread(target=thread_func, daemon=True).start()
-                self.stdscr.addstr(
-                    (
-                        (" " * (screen_width - 1) + "\n")
-                        * config.VISUALIZER_HEIGHT
-                    ).rstrip()
-                )
-            elif self.compiled:
-                vdata = self.audio_data[self.song][0]
-                rendered_lines = render(
-                    screen_width,
-                    vdata,
-                    min(
-                        round(pos * config.FPS),
-                        # fmt: off
-                        vdata.shape[2] - 1,
-                    ),
-                    config.VISUALIZER_HEIGHT,
-                )
-                for i in range(len(rendered_lines)):
-                    self.stdscr.addstr(rendered_lines[i][:-1])
-                    self.stdscr.insstr(rendered_lines[i][-1])
-                    if i < len(rendered_lines) - 1:
-                        self.stdscr.move(self.stdscr.getyx()[0] + 1, 0)
+            if vdata is not None
+            else None
+        )
+        if frame is None:
+            rendered_lines = [" " * screen_width] * config.VISUALIZER_HEIGHT
+        else:
+            rendered_lines = render(
+                screen_width, frame, config.VISUALIZER_HEIGHT, vdata.mono
+            )
+        for i in range(len(rendered_lines)):
+            addstr_to_line_end(self.stdscr, rendered_lines[i])
+            if i < len(rendered_lines) - 1:
+                self.stdscr.move(self.stdscr.getyx()[0] + 1, 0)
+
+    def _current_lyric(self, pos):
+        """Index of the lyric at `pos`, or None if the lyrics aren't
+        timed."""
+        if not is_timed_lyrics(self.lyrics):
+            return None
+        for i, lyric in enumerate(self.lyrics):
+            if lyric.time > pos:
+                return i - 1
+        return len(self.lyrics) - 1
 
+    def _output_lyrics(self, pos, screen_height, screen_width):
         if self.can_show_lyrics:
             from grapheme import graphemes
 
@@ -1706,15 +4399,8 @@ class PlaybackHandler:
                 ),
             )
 
-            cur_lyric_i = None
-            is_timed = is_timed_lyrics(self.lyrics)
-            if is_timed:
-                for i, lyric in enumerate(self.lyrics):
-                    if lyric.time > pos:
-                        cur_lyric_i = i - 1
-                        break
-                if cur_lyric_i is None:
-                    cur_lyric_i = len(self.lyrics) - 1
+            cur_lyric_i = self._current_lyric(pos)
+            is_timed = cur_lyric_i is not None
             self.lyrics_scroller.pos = (
                 self.lyric_pos or cur_lyric_i or self.lyrics_scroller.pos
             )
@@ -1832,72 +4518,6 @@ class PlaybackHandler:
                 curses.color_pair(4),
             )
 
-        if self.show_help:
-            l = 15
-            r = self.screen_width - l
-            t = 5
-            b = self.screen_height - t
-
-            if l < r and t < b:
-                # draw border
-                self.stdscr.addch(t, l, curses.ACS_ULCORNER)
-                self.stdscr.addch(t, r, curses.ACS_URCORNER)
-                self.stdscr.addch(b, l, curses.ACS_LLCORNER)
-                self.stdscr.addch(b, r, curses.ACS_LRCORNER)
-                for x in range(l + 1, r):
-                    self.stdscr.addch(t, x, curses.ACS_HLINE)
-                    self.stdscr.addch(b, x, curses.ACS_HLINE)
-                for y in range(t + 1, b):
-                    self.stdscr.addch(y, l, curses.ACS_VLINE)
-                    self.stdscr.addch(y, r, curses.ACS_VLINE)
-
-                # draw text
-                self.stdscr.move(t + 1, l + 1)
-                i = max(
-                    0,
-                    min(self.help_pos, len(config.PLAY_CONTROLS) - (b - t - 1)),
-                )
-                while self.stdscr.getyx()[0] < b:
-                    if i < len(config.PLAY_CONTROLS):
-                        key, desc = config.PLAY_CONTROLS[i]
-                        length_so_far = addstr_fit_to_width(
-                            self.stdscr,
-                            key
-                            + " " * (config.INDENT_CONTROL_DESC - len(key))
-                            + " ",
-                            r - l - 1,
-                            0,
-                            curses.color_pair(18) | curses.A_BOLD,
-                        )
-                        length_so_far = addstr_fit_to_width(
-                            self.stdscr,
-                            desc
-                            + " " * (r - l - 1 - length_so_far - len(desc)),
-                            r - l - 1,
-                            length_so_far,
-                            curses.color_pair(18),
-                        )
-                        i += 1
-                        self.stdscr.move(self.stdscr.getyx()[0] + 1, l + 1)
-                    else:
-                        self.stdscr.addstr(" " * (r - l - 1))
-
-        if self.prompting is not None:
-            # pylint: disable=unsubscriptable-object
-            self.stdscr.move(
-                screen_height
-                - (
-                    config.VISUALIZER_HEIGHT
-                    if self.can_show_visualization
-                    else 0
-                )
-                - 4,  # 4 lines for status bar + adding entry
-                adding_song_length
-                + (self.prompting[1] - len(self.prompting[0])),
-            )
-
-        self.stdscr.refresh()
-
 
 def init_curses(stdscr):
     curses.start_color()
@@ -1970,7 +4590,6 @@ CLICK_SONG = SongParamType()
 
 def yt_embed_artwork(yt_dlp_info, crop):
     import music_tag
-    import requests
 
     yt_dlp_info["thumbnails"].sort(key=lambda d: d["preference"])
     best_thumbnail = yt_dlp_info["thumbnails"][-1]  # default thumbnail
@@ -2001,7 +4620,9 @@ def yt_embed_artwork(yt_dlp_info, crop):
         ):
             best_thumbnail = thumbnail
 
-    response = requests.get(best_thumbnail["url"], timeout=5)
+    response = http_session().get(
+        best_thumbnail["url"], timeout=config.HTTP_TIMEOUT
+    )
     image_data = response.content
     if best_thumbnail["width"] != best_thumbnail["height"] and crop:
         from io import BytesIO
@@ -2394,10 +5015,10 @@ def signup(username=None, password=None, login_=True):
         )
         return
 
-    import requests
-
-    response = requests.get(
-        config.USER_EXISTS_URL, params={"user": username}, timeout=5
+    response = http_session().get(
+        config.USER_EXISTS_URL,
+        params={"user": username},
+        timeout=config.HTTP_TIMEOUT,
     )
     if response.status_code == 200:
         click.secho(f"Username {username} already exists.", fg="red")
@@ -2413,8 +5034,10 @@ def signup(username=None, password=None, login_=True):
         click.secho("Passwords do not match.", fg="red")
         return
 
-    response = requests.post(
-        config.SIGNUP_URL, auth=(username, password), timeout=5
+    response = http_session().post(
+        config.SIGNUP_URL,
+        auth=(username, password),
+        timeout=config.HTTP_TIMEOUT,
     )
     if response.status_code == 201:
         click.secho(f"Successfully signed up user '{username}'!", fg="green")
@@ -2453,13 +5076,13 @@ def login(username=None, password=None):
             fg="yellow",
         )
 
-    import requests
-
     if password is None:
         password = getpass("Password:")
 
-    response = requests.post(
-        config.LOGIN_URL, auth=(username, password), timeout=5
+    response = http_session().post(
+        config.LOGIN_URL,
+        auth=(username, password),
+        timeout=config.HTTP_TIMEOUT,
     )
     if response.status_code == 200:
         click.secho(f"Successfully logged in user '{username}'!", fg="green")
@@ -2507,19 +5130,10 @@ def search_song(phrase):
     1: songs that start with the phrase
     1: songs that contain the phrase but do not start with it
     """
-    phrase = phrase.lower()
-
-    results = [], [], []  # is, starts, contains but does not start
-    for song in SONGS:
-        song_title = song.song_title.lower()
-        if song_title == phrase:
-            results[0].append(song)
-        elif song_title.startswith(phrase):
-            results[1].append(song)
-        elif phrase in song_title:
-            results[2].append(song)
-
-    return results
+    return tuple(
+        [SONGS[song_id] for song_id in song_ids]
+        for song_ids in SONG_DATA.title_index.search(phrase)
+    )
 
 
 def print_entry(
@@ -2626,6 +5240,112 @@ def pluralize(count, word, include_count=True):
     return f"{count} " * include_count + word + ("s" if count != 1 else "")
 
 
+def syncedlyrics_search(query, provider=None) -> str | None:
+    """`syncedlyrics.search`, optionally using only `provider`."""
+    import syncedlyrics
+
+    kwargs = {} if provider is None else {"providers": [provider]}
+    try:
+        # pylint: disable=unexpected-keyword-arg
+        return syncedlyrics.search(query, allow_plain_format=True, **kwargs)
+    except TypeError as e:
+        print_to_logfile(
+            f"TypeError with allow_plain_format=True in syncedlyrics.search: {e}"
+        )
+        return syncedlyrics.search(query, **kwargs)
+
+
+class RateLimiter:
+    """Spaces out calls to `wait` (across threads) to at most `rate`/sec."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = monotonic()
+            t = max(now, self._next)
+            self._next = t + self.interval
+        if t > now:
+            sleep(t - now)
+
+
+class LyricsFetcher:
+    """
+    Searches for lyrics for many songs concurrently (on `workers` threads),
+    trying each of `providers` in order. Each provider is rate limited to
+    `rate` requests/second, and failed requests are retried `retries` times
+    with exponential backoff starting at `backoff` seconds.
+
+    `providers` is a list of (name, search function) pairs, where the search
+    function takes a query and returns lyrics or None if there are none; it
+    defaults to `syncedlyrics_search` for each of `config.LYRICS_PROVIDERS`.
+    """
+
+    def __init__(
+        self,
+        providers=None,
+        workers=config.LYRICS_WORKERS,
+        rate=config.LYRICS_PROVIDER_RATE,
+        retries=config.LYRICS_RETRIES,
+        backoff=config.LYRICS_RETRY_BACKOFF,
+    ):
+        if providers is None:
+            providers = [
+                (provider, partial(syncedlyrics_search, provider=provider))
+                for provider in config.LYRICS_PROVIDERS
+            ]
+        self.providers = providers
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._limiters = {name: RateLimiter(rate) for name, _ in providers}
+
+    def search(self, query) -> str | None:
+        """Raises `RuntimeError` if every provider failed."""
+        errors = []
+        for name, search_fn in self.providers:
+            for attempt in range(self.retries + 1):
+                self._limiters[name].wait()
+                try:
+                    lyrics = search_fn(query)
+                except Exception as e:  # pylint: disable=broad-except
+                    print_to_logfile(
+                        f"Lyrics provider {name} failed for {query!r}:", e
+                    )
+                    if attempt < self.retries:
+                        sleep(self.backoff * 2**attempt * (1 + random()))
+                        continue
+                    errors.append(f"{name}: {e}")
+                    break
+                if lyrics:
+                    return lyrics
+                break  # not found, try the next provider
+
+        if errors and len(errors) == len(self.providers):
+            raise RuntimeError("; ".join(errors))
+        return None
+
+    def fetch(self, jobs):
+        """
+        Search for lyrics for each (key, query) in `jobs`. Yields
+        (key, lyrics or None, exception or None) in order of completion.
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {
+                executor.submit(self.search, query): key for key, query in jobs
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:  # pylint: disable=broad-except
+                    yield futures[future], None, e
+
+
 def is_timed_lyrics(lyrics):
     from pylrc.classes import Lyrics
 
@@ -2683,63 +5403,89 @@ def filter_songs(
     match_all,
     combine_artists,
 ):
-    songs = []
-    for song in SONGS:
-        search_criteria = (
-            (
-                (
-                    any(
-                        artist.lower()
-                        in song.artist.lower()
-                        + (
-                            f", {song.album_artist.lower()}"
-                            if combine_artists
-                            else ""
-                        )
-                        for artist in artists
-                    )
-                ),
+    """Returns the matching songs, sorted by song ID."""
+    has_criteria = bool(artists or albums or album_artists)
+    if tags:
+        if match_all:
+            tagged = SONG_DATA.songs_with_all_tags(tags)
+        else:
+            tagged = SONG_DATA.songs_with_any_tag(tags)
+    elif match_all or not has_criteria:
+        tagged = set(SONG_DATA)
+    else:  # songs are matched by the criteria alone
+        tagged = set()
+    excluded = SONG_DATA.songs_with_any_tag(exclude_tags)
+
+    if has_criteria:
+        if match_all:  # only need to check the tagged songs
+            candidates = [SONGS[song_id] for song_id in tagged]
+            song_ids = set()
+        else:
+            candidates = SONGS
+            song_ids = tagged
+
+        for song in candidates:
+            if song.song_id in excluded or song.song_id in song_ids:
+                continue
+            if song_matches(
+                song,
                 artists,
-            ),
-            (
-                (any(album.lower() in song.album.lower() for album in albums)),
                 albums,
-            ),
-            (
-                (
-                    any(
-                        album_artist.lower()
-                        in song.album_artist.lower()
-                        + (
-                            f", {song.artist.lower()}"
-                            if combine_artists
-                            else ""
-                        )
-                        for album_artist in album_artists
-                    )
-                ),
                 album_artists,
-            ),
-        )
-        search_criteria = tuple(
-            c[0] for c in filter(lambda t: t[1], search_criteria)
-        )
+                match_all,
+                combine_artists,
+            ):
+                song_ids.add(song.song_id)
+    else:
+        song_ids = tagged
 
-        if match_all:
-            if not search_criteria:
-                search_criteria = (True,)
+    return [SONGS[song_id] for song_id in sorted(song_ids - excluded)]
 
-            search_criteria = all(search_criteria) and (
-                not tags or (tags <= song.tags)  # subset
-            )
-        elif any(search_criteria):
-            search_criteria = True
-        elif tags:
-            search_criteria = tags & song.tags
-        else:
-            search_criteria = not search_criteria
 
-        if search_criteria and not exclude_tags & song.tags:
-            songs.append(song)
+def song_matches(
+    song: Song, artists, albums, album_artists, match_all, combine_artists
+):
+    """
+    Whether `song` matches any (or all, if `match_all`) of the passed artist,
+    album, and album artist criteria. Empty criteria are ignored; if all are
+    empty, every song matches.
+    """
+    search_criteria = (
+        (
+            (
+                any(
+                    artist.lower()
+                    in song.artist.lower()
+                    + (
+                        f", {song.album_artist.lower()}"
+                        if combine_artists
+                        else ""
+                    )
+                    for artist in artists
+                )
+            ),
+            artists,
+        ),
+        (
+            (any(album.lower() in song.album.lower() for album in albums)),
+            albums,
+        ),
+        (
+            (
+                any(
+                    album_artist.lower()
+                    in song.album_artist.lower()
+                    + (f", {song.artist.lower()}" if combine_artists else "")
+                    for album_artist in album_artists
+                )
+            ),
+            album_artists,
+        ),
+    )
+    search_criteria = tuple(
+        c[0] for c in filter(lambda t: t[1], search_criteria)
+    )
 
-    return songs
+    if match_all:
+        return all(search_criteria)
+    return not search_criteria or any(search_criteria)
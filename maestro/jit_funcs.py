@@ -23,101 +23,57 @@ def lerp(start, stop, t):
     return start + t * (stop - start)
 
 
-@jit(forceobj=True)
-def bin_average(arr: np.ndarray, n, include_remainder=False, func=None):
-    if func is None:
-        func = np.max
+# codepoints of config.VERTICAL_BLOCKS, indexed by block size
+BLOCK_CODEPOINTS = np.array(
+    [ord(block) for _, block in sorted(config.VERTICAL_BLOCKS.items())],
+    dtype="<u4",  # UTF-32-LE code units
+)
 
-    remainder = arr.shape[1] % n
-    if remainder == 0:
-        return func(arr.reshape(arr.shape[0], -1, n), axis=1)
 
-    avg_head = func(arr[:, :-remainder].reshape(arr.shape[0], -1, n), axis=1)
-    if include_remainder:
-        avg_tail = func(
-            arr[:, -remainder:].reshape(arr.shape[0], -1, remainder), axis=1
-        )
-        return np.concatenate((avg_head, avg_tail), axis=1)
-
-    return avg_head
-
-
-@jit(forceobj=True)
 def render(
     num_bins,
-    freqs: np.ndarray,
-    frame,
+    bands: np.ndarray,
     visualizer_height,
-    mono=None,
-    include_remainder=None,
-    func=None,
+    mono=False,
 ):
     """
+    num_bins: width of the visualization
+    bands: one spectrogram frame folded into frequency bands (see
+        `SpectrogramStream.bands`), with shape (2, num_bins) if mono, else
+        (2, (num_bins - 1) // 2); not modified
     mono:
-        True:  forces one-channel visualization
-        False: forces two-channel visualization
-        None:  if freqs[0] == freqs[1], one-channel, else two
-    """
-    if func is None:
-        func = np.max
-
-    if mono is None:
-        mono = np.array_equal(freqs[0], freqs[1])
+        True:  one-channel visualization (average of both channels)
+        False: two-channel visualization
 
-    if not mono:
-        gap_bins = 1 if num_bins % 2 else 2
-        num_bins = (num_bins - 1) // 2
+    Returns the visualization's rows, top to bottom. Vectorized: computes
+    every cell's block size at once, then maps the grid through
+    `BLOCK_CODEPOINTS` and decodes it as one string.
+    """
+    num_block_sizes = len(config.VERTICAL_BLOCKS) - 1
+    if mono:
+        bands = (bands[0].astype(np.float64) + bands[1]) / 2
+        bands = bands[np.newaxis]
+    # bar heights in block sizes (e.g. eighths of a row)
+    heights = np.round(
+        bands / 80 * (visualizer_height * num_block_sizes)
+    ).astype(np.intp)
+    # cell (row h from the top) is the part of the bar above the rows below
+    row_bases = np.arange(visualizer_height - 1, -1, -1) * num_block_sizes
+    grid = np.clip(
+        heights[:, np.newaxis, :] - row_bases[:, np.newaxis],
+        0,
+        num_block_sizes,
+    )  # shape (channels, rows, bands)
+
+    codepoints = np.empty((visualizer_height, num_bins), dtype="<u4")
+    if mono:
+        codepoints[:] = BLOCK_CODEPOINTS[grid[0]]
     else:
-        gap_bins = 0
-        freqs[0, :, frame] = (freqs[0, :, frame] + freqs[1, :, frame]) / 2
-
-    num_vertical_block_sizes = len(config.VERTICAL_BLOCKS) - 1
-    freqs = np.round(
-        bin_average(
-            freqs[:, :, frame],
-            num_bins,
-            (
-                (freqs.shape[-2] % num_bins) > num_bins / 2
-                if include_remainder is None
-                else include_remainder
-            ),
-            func=func,
-        )
-        / 80
-        * visualizer_height
-        * num_vertical_block_sizes
-    )
-
-    arr = np.zeros((int(not mono) + 1, visualizer_height, num_bins))
-    for b in range(num_bins):
-        bin_height = freqs[0, b]
-        h = 0
-        while bin_height > num_vertical_block_sizes:
-            arr[0, h, b] = num_vertical_block_sizes
-            bin_height -= num_vertical_block_sizes
-            h += 1
-        arr[0, h, b] = bin_height
-        if not mono:
-            bin_height = freqs[1, b]
-            h = 0
-            while bin_height > num_vertical_block_sizes:
-                arr[1, h, b] = num_vertical_block_sizes
-                bin_height -= num_vertical_block_sizes
-                h += 1
-            arr[1, h, b] = bin_height
-
-    res = []
-    for h in range(visualizer_height - 1, -1, -1):
-        s = ""
-        for b in range(num_bins):
-            if mono:
-                s += config.VERTICAL_BLOCKS[arr[0, h, b]]
-            else:
-                s += config.VERTICAL_BLOCKS[arr[0, h, num_bins - b - 1]]
-        if not mono:
-            s += " " * gap_bins
-            for b in range(num_bins):
-                s += config.VERTICAL_BLOCKS[arr[1, h, b]]
-        res.append(s)
-
-    return res
\ No newline at end of file
+        # left channel mirrored, so both channels' bass meets in the middle
+        width = grid.shape[2]
+        codepoints[:, :width] = BLOCK_CODEPOINTS[grid[0, :, ::-1]]
+        codepoints[:, width : num_bins - width] = ord(" ")
+        codepoints[:, num_bins - width :] = BLOCK_CODEPOINTS[grid[1]]
+
+    s = codepoints.tobytes().decode("utf-32-le")
+    return [s[i : i + num_bins] for i in range(0, len(s), num_bins)]
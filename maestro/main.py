@@ -14,7 +14,7 @@ from collections import defaultdict
 from queue import Queue
 from random import randint
 from shutil import move, copy, rmtree
-from time import sleep, time
+from time import time
 
 from maestro import config
 from maestro import helpers
@@ -40,6 +40,8 @@ def _play(
     password,
     lyrics,
     translated_lyrics,
+    render_stats,
+    crossfade,
 ):
     helpers.init_curses(stdscr)
 
@@ -86,6 +88,7 @@ def _play(
         (username, password) if username and password else (None, None),
         lyrics,
         translated_lyrics,
+        render_stats,
     )
     player.volume = volume
     if can_mac_now_playing:
@@ -111,11 +114,23 @@ def _play(
         )
         app_helper_process.start()
     if update_discord:
-        player.threaded_initialize_discord()
+        player.initialize_discord()
+
+    def upcoming_song():
+        """The song that plays after the current one if it ends, or None."""
+        if player.looping_current_song:
+            return player.song
+        if player.i + 1 < len(player.playlist):
+            return player.playlist[player.i + 1]
+        if loop:
+            return next_playlist[0]
+        return None
 
     prev_volume = volume
+    next_fade_in = 0  # secs the next song fades in over (crossfading into it)
     while player.i in range(len(player.playlist)):
-        player.playback.load_file(player.song_path)
+        player.load()
+        fade_in, next_fade_in = next_fade_in, 0
 
         if player.song.set_clip in player.song.clips:
             player.clip = player.song.clips[player.song.set_clip]
@@ -134,7 +149,7 @@ def _play(
         player.translated_lyrics = player.song.parsed_translated_lyrics
 
         player.playback.play()
-        player.set_volume(volume)
+        player.set_volume(0 if fade_in else volume)
         player.update_metadata()
 
         # latter is clip-agnostic, former is clip-aware
@@ -142,7 +157,7 @@ def _play(
         if player.clip_mode:
             clip_start, clip_end = player.clip
             player.duration = clip_end - clip_start
-            player.seek(clip_start)
+            player.seek(clip_start, stop_fade=False)  # keep crossfading
 
         start_time = pause_start = time()
 
@@ -156,6 +171,27 @@ def _play(
                 next_song = not player.looping_current_song
                 break
 
+            # open the next song ahead of time, and crossfade into it
+            time_left = (
+                player.clip[1]
+                if player.clip_mode
+                else player.playback.duration
+            ) - player.playback.curr_pos
+            if time_left < config.PRELOAD_TIME:
+                upcoming = upcoming_song()
+                if upcoming is not None:
+                    player.preload(upcoming)
+                    if (
+                        time_left < crossfade
+                        and not player.paused
+                        and player.preloaded(upcoming)
+                    ):
+                        player.fade_out(time_left)
+                        next_fade_in = time_left
+                        next_song = not player.looping_current_song
+                        break
+
+            volume_factor = 1
             # fade in first 2 seconds of clip
             if (
                 player.clip_mode
@@ -163,11 +199,13 @@ def _play(
                 and clip_end - clip_start > 5  # if clip is longer than 5 secs
                 and player.playback.curr_pos < clip_start + 2
             ):
-                player.set_volume(
-                    player.volume * (player.playback.curr_pos - clip_start) / 2
+                volume_factor = (player.playback.curr_pos - clip_start) / 2
+            if fade_in:  # crossfading from the last song
+                volume_factor = min(
+                    volume_factor, (time() - start_time) / fade_in
                 )
-            else:
-                player.set_volume(player.volume)
+            fading = volume_factor < 1
+            player.set_volume(player.volume * volume_factor)
 
             if player.can_mac_now_playing:  # macOS Now Playing event loop
                 try:
@@ -227,12 +265,10 @@ def _play(
 
                     player.update_screen()
             else:
-                c = player.stdscr.getch()  # int
-                next_c = player.stdscr.getch()
-                while next_c != -1:
-                    c, next_c = next_c, player.stdscr.getch()
+                c = player.events.next_key()  # int
 
                 if c != -1:
+                    player.update_screen()
                     try:
                         ch = chr(c)
                         if ch in "\b\x7f":
@@ -407,9 +443,7 @@ def _play(
                                 elif ch in "dD":
                                     if player.want_discord:
                                         player.want_discord = False
-                                        if player.discord_rpc is not None:
-                                            player.discord_rpc.close()
-                                        player.discord_connected = 0
+                                        player.discord.stop()
                                     else:
 
                                         def f():
@@ -701,14 +735,45 @@ def _play(
                 ),
                 1 / config.FPS if player.want_vis else 1,
             )
-            if (
-                abs(player.playback.curr_pos - player.last_timestamp)
+            if player.events.pending:  # handle them before redrawing
+                continue
+            if player.render_scheduler.tick(
+                progressed=abs(player.playback.curr_pos - player.last_timestamp)
                 > frame_duration
             ):
                 player.last_timestamp = player.playback.curr_pos
-                player.update_screen()
 
-            sleep(0.01)  # NOTE: so CPU usage doesn't fly through the roof
+            # sleep until there's input or something to do
+            if player.can_mac_now_playing:
+                timeout = 0  # Now Playing's run loop already waited
+            elif not player.playback.active:
+                timeout = 0  # song just ended, move on to the next one
+            elif player.paused:
+                timeout = config.IDLE_WAKE_INTERVAL
+            else:
+                pos = player.playback.curr_pos
+                timeout = player.render_scheduler.next_frame_in(
+                    player.last_timestamp + frame_duration - pos
+                )
+                time_left = (
+                    player.clip[1]
+                    if player.clip_mode
+                    else player.playback.duration
+                ) - pos
+                for t in (
+                    # song or clip end; playback can take a moment to stop
+                    max(time_left, 0.01),
+                    time_left - config.PRELOAD_TIME,
+                    time_left - crossfade,
+                ):
+                    if t > 0:
+                        timeout = min(timeout, t)
+                if fading:
+                    timeout = min(timeout, 1 / config.FPS)
+            player.events.wait(timeout)
+
+        if not next_fade_in:  # skipped while crossfading from the last song
+            player.stop_fade()
 
         if player.paused:
             time_listened = pause_start - start_time
@@ -717,8 +782,8 @@ def _play(
 
         # region update stats
         def stats_update(s: helpers.Song, t: float):
-            s.listen_times[config.CUR_YEAR] += t
-            s.listen_times["total"] += t
+            s.add_listen_time(t)
+            helpers.SONG_DATA.flush()  # don't lose stats if maestro crashes
 
         threading.Thread(
             target=stats_update, args=(player.song, time_listened), daemon=True
@@ -778,6 +843,234 @@ def _play(
                         break
 
 
+def _flush_metadata():
+    """Save all changed song metadata (see `helpers.DIRTY_SONGS`), reporting
+    songs that failed to save (they stay unsaved)."""
+    for song, e in helpers.DIRTY_SONGS.flush():
+        click.secho(
+            f'Failed to save metadata for "{song.song_title}" '
+            f"(ID {song.song_id}): {e}",
+            fg="red",
+        )
+
+
+def _fetch_lyrics(jobs, name=None, fetcher=None):
+    """
+    Download lyrics for each (song, query) in `jobs` concurrently (see
+    `helpers.LyricsFetcher`), saving them to the song files in batches of
+    `config.LYRICS_WRITE_BATCH`.
+    """
+    if fetcher is None:
+        fetcher = helpers.LyricsFetcher()
+
+    t = time()
+    found = not_found = failed = 0
+    for song, lyrics, error in fetcher.fetch(jobs):
+        if error is not None:
+            failed += 1
+            click.secho(
+                f'Failed to download lyrics for "{song.song_title}": {error}',
+                fg="red",
+            )
+        elif lyrics:
+            found += 1
+            click.secho(
+                f'Downloaded lyrics for "{song.song_title}" (ID {song.song_id})'
+                + (f' using name "{name}"' if name else "")
+                + ".",
+                fg="green",
+            )
+            song.raw_lyrics = lyrics
+            if len(helpers.DIRTY_SONGS) >= config.LYRICS_WRITE_BATCH:
+                _flush_metadata()
+        else:
+            not_found += 1
+            click.secho(
+                f'No lyrics found for "{song.song_title}".', fg="yellow"
+            )
+    _flush_metadata()
+    t = time() - t
+
+    if len(jobs) > 1:
+        click.secho(
+            f"Downloaded lyrics for {helpers.pluralize(found, 'song')} in {t:.1f}s ({len(jobs) / t:.2f} songs/s); {not_found} not found, {failed} failed.",
+            fg="green" if not failed else "yellow",
+        )
+
+
+def _add_songs(
+    paths, tags, move_, metadata_pairs, skip_dupes, lyrics, by_content=False
+):
+    """
+    `add` for multiple files: existing titles are read once, files are
+    copied/moved (and their tags read) on a thread pool, IDs come from a
+    counter, tag writes are committed in batches of `config.IMPORT_WRITE_BATCH`
+    (so only a batch's tags are held in memory), and the song data is
+    committed once at the end. A file whose tags can't be read is removed
+    from the song directory again (moved back, if it was moved).
+
+    If `by_content`, duplicates are songs with the same audio fingerprint
+    (computed on a process pool) instead of the same name.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from itertools import count
+
+    import music_tag
+
+    t = time()
+    titles = {
+        os.path.splitext(filename)[0]
+        for filename in helpers.SONG_DATA.filenames().values()
+    }
+    song_ids = count(max(helpers.SONG_DATA, default=0) + 1)
+
+    fingerprints = {}
+    if by_content:
+        helpers.FINGERPRINT_INDEX.refresh()
+        supported = [
+            path
+            for path in paths
+            if os.path.splitext(path)[1].lower() in config.EXTS
+        ]
+        fingerprints = dict(
+            zip(supported, helpers.fingerprint_files(supported))
+        )
+    new_fingerprints = set()
+
+    jobs = []  # (song ID, source path, destination path)
+    skipped = duplicates = 0
+    for path in paths:
+        song_fname = os.path.split(path)[1]
+        song_title, ext = os.path.splitext(song_fname)
+        ext = ext.lower()
+        if ext not in config.EXTS:
+            click.secho(f"'{ext}' is not supported.", fg="red")
+            continue
+
+        if by_content:
+            fingerprint = fingerprints[path]
+            duplicate = fingerprint is not None and (
+                fingerprint in new_fingerprints
+                or bool(helpers.FINGERPRINT_INDEX.find(fingerprint))
+            )
+            new_fingerprints.add(fingerprint)
+        else:
+            duplicate = song_title in titles
+        if duplicate:
+            if skip_dupes:
+                skipped += 1
+                if move_:
+                    os.remove(path)
+                continue
+            duplicates += 1
+
+        if song_title in titles:
+            while song_title in titles:  # also avoid overwriting files
+                song_title += " copy"
+            song_fname = song_title + ext
+        titles.add(song_title)
+        jobs.append(
+            (
+                next(song_ids),
+                path,
+                os.path.join(config.settings["song_directory"], song_fname),
+            )
+        )
+
+    def import_file(job):
+        _, src, dest = job
+        size = os.path.getsize(src)
+        if move_:
+            move(src, dest)
+        else:
+            copy(src, dest)
+        try:
+            return size, music_tag.load_file(dest)
+        except Exception:
+            # don't leave a file that isn't in the database behind
+            if move_:
+                move(dest, src)
+            else:
+                os.remove(dest)
+            raise
+
+    added = []  # song IDs
+    failed = []  # (source path, exception)
+    n_bytes = 0
+    with ThreadPoolExecutor(config.IMPORT_WORKERS) as executor:
+        with click.progressbar(length=len(jobs), label="Importing") as bar:
+            # in batches, so only a batch's tags are loaded at once
+            for i in range(0, len(jobs), config.IMPORT_WRITE_BATCH):
+                batch = jobs[i : i + config.IMPORT_WRITE_BATCH]
+                futures = [executor.submit(import_file, job) for job in batch]
+                to_index = []  # (song, fingerprint)
+                for job, future in zip(batch, futures):  # in ID order
+                    try:
+                        size, metadata = future.result()
+                    except Exception as e:  # pylint: disable=broad-except
+                        failed.append((job[1], e))
+                        continue
+                    finally:
+                        bar.update(1)
+                    n_bytes += size
+                    song = helpers.SONG_DATA.add_song(
+                        job[2], tags, song_id=job[0], metadata=metadata
+                    )
+                    for key, value in metadata_pairs or ():
+                        song.set_metadata(key, value)
+                    added.append(song.song_id)
+                    if fingerprints.get(job[1]) is not None:
+                        to_index.append((song, fingerprints[job[1]]))
+
+                _flush_metadata()
+                # after the tag writes, which change the files' mtimes
+                for song, fingerprint in to_index:
+                    helpers.FINGERPRINT_INDEX.add(song, fingerprint)
+    helpers.SONG_DATA.flush()
+    for path, e in failed:
+        click.secho(f"Failed to add '{path}': {e}", fg="red")
+    t = time() - t
+
+    if not tags:
+        tags_string = ""
+    elif len(tags) == 1:
+        tags_string = f" with tag '{tags[0]}'"
+    else:
+        tags_string = f" with tags {', '.join([repr(tag) for tag in tags])}"
+    click.secho(
+        f"Added {helpers.pluralize(len(added), 'song')}{tags_string} in {t:.1f}s "
+        f"({len(added) / max(t, 1e-9):.1f} songs/s, "
+        f"{n_bytes / max(t, 1e-9) / 2**20:.1f} MiB/s).",
+        fg="green",
+    )
+    if skipped:
+        click.secho(
+            f"Skipped {helpers.pluralize(skipped, 'song')} with "
+            + ("audio" if by_content else "names")
+            + " already in the database.",
+            fg="yellow",
+        )
+    if duplicates:
+        if by_content:
+            click.secho(
+                f"{helpers.pluralize(duplicates, 'song')} had the same audio as other songs; run 'maestro dedupe' to list them.",
+                fg="yellow",
+            )
+        else:
+            click.secho(
+                f"{helpers.pluralize(duplicates, 'song')} had names already in the database, so 'copy' was appended to them.",
+                fg="yellow",
+            )
+
+    if lyrics:
+        _fetch_lyrics(
+            [
+                (song, f"{song.artist} - {song.song_title}")
+                for song in map(helpers.Song, added)
+            ]
+        )
+
+
 # endregion
 
 
@@ -786,6 +1079,9 @@ def _play(
 def cli(ctx: click.Context):
     """A command line interface for playing music."""
 
+    # save all metadata changes made by the command at once
+    ctx.call_on_close(_flush_metadata)
+
     # ~/.maestro-files
     if not os.path.exists(config.MAESTRO_DIR):
         os.makedirs(config.MAESTRO_DIR)
@@ -809,7 +1105,9 @@ def cli(ctx: click.Context):
                 update_settings_file = True
 
     # ~/.maestro-files/songs.json
-    if not os.path.exists(config.SONGS_INFO_PATH):
+    if not os.path.exists(config.SONGS_INFO_PATH) and not os.path.exists(
+        config.SONGS_DB_PATH
+    ):
         if os.path.exists(config.OLD_SONGS_INFO_PATH):
             if ctx.invoked_subcommand == "migrate":
                 return
@@ -829,10 +1127,9 @@ def cli(ctx: click.Context):
         config.settings["last_version_sync"] = t
         update_settings_file = True
         try:
-            import requests
-
-            response = requests.get(
-                "https://pypi.org/pypi/maestro-music/json", timeout=5
+            response = helpers.http_session().get(
+                "https://pypi.org/pypi/maestro-music/json",
+                timeout=config.HTTP_TIMEOUT,
             )
             latest_version = response.json()["info"]["version"]
             if helpers.versiontuple(latest_version) > helpers.versiontuple(
@@ -947,6 +1244,12 @@ def cli(ctx: click.Context):
     default=False,
     help="Skip adding song names that are already in the database. If not passed, 'copy' is appended to any duplicate names.",
 )
+@click.option(
+    "-C/-nC",
+    "--by-content/--no-by-content",
+    default=False,
+    help="Detect duplicate songs by their audio (ignoring tags and names) instead of by name.",
+)
 @click.option(
     "-L/-nL",
     "--lyrics/--no-lyrics",
@@ -1016,6 +1319,7 @@ def add(
     album,
     album_artist,
     skip_dupes,
+    by_content,
     lyrics,
     audio_quality,
     crop,
@@ -1054,6 +1358,11 @@ def add(
     If the '-nD/--skip-dupes' flag is passed, song names that are already in
     the database are skipped. If not passed, 'copy' is appended to any duplicate
     names.
+
+    If the '-C/--by-content' flag is passed, duplicates are instead songs with
+    the same audio as a song in the database (or another song being added),
+    regardless of name or tags; see also 'maestro dedupe'. Songs with
+    duplicate names still have 'copy' appended.
     """
 
     paths = None
@@ -1260,6 +1569,12 @@ def add(
         metadata_pairs = metadata_pairs or []
         metadata_pairs.extend(abc_opts)
 
+    if len(paths) > 1 or by_content:
+        _add_songs(
+            paths, tags, move_, metadata_pairs, skip_dupes, lyrics, by_content
+        )
+        return
+
     for path in paths:
         ext = os.path.splitext(path)[1].lower()
         if not os.path.isdir(path) and ext not in config.EXTS:
@@ -1303,39 +1618,7 @@ def add(
                     song.set_metadata(key, value)
 
         if lyrics:
-            import syncedlyrics
-
-            try:
-                # pylint: disable=unexpected-keyword-arg
-                lyrics = syncedlyrics.search(
-                    f"{song.artist} - {song_title}", allow_plain_format=True
-                )
-            except TypeError as e:
-                print_to_logfile(
-                    f"TypeError with allow_plain_format=True in syncedlyrics.search: {e}"
-                )
-                try:
-                    lyrics = syncedlyrics.search(song_title)
-                except Exception as e:  # pylint: disable=redefined-outer-name
-                    click.secho(
-                        f'Failed to download lyrics for "{song_title}": {e}',
-                        fg="red",
-                    )
-            except Exception as e:
-                click.secho(
-                    f'Failed to download lyrics for "{song_title}": {e}',
-                    fg="red",
-                )
-            else:
-                if lyrics:
-                    click.secho(
-                        f'Downloaded lyrics for "{song_title}".', fg="green"
-                    )
-                    song.raw_lyrics = lyrics
-                else:
-                    click.secho(
-                        f'No lyrics found for "{song_title}".', fg="yellow"
-                    )
+            _fetch_lyrics([(song, f"{song.artist} - {song_title}")])
 
         if not tags:
             tags_string = ""
@@ -1410,8 +1693,7 @@ def remove(args, force, tag):
                 print("Did not delete.")
                 return
 
-        for song in helpers.SONGS:
-            song.tags -= tags_to_remove
+        helpers.SONG_DATA.remove_tags(tags_to_remove)
 
         click.secho(
             f"Deleted all occurrences of {helpers.pluralize(len(tags_to_remove), 'tag')}.",
@@ -1482,7 +1764,7 @@ def untag(songs, tags, all_, force):
                 == "y"
             ):
                 for song in songs:
-                    song.tags.clear()
+                    song.tags = set()
 
                 click.secho(
                     f"Removed all tags from all {helpers.pluralize(len(songs), 'song')}.",
@@ -1623,6 +1905,20 @@ def untag(songs, tags, all_, force):
     is_flag=True,
     help="Count artists as album artists and vice versa.",
 )
+@click.option(
+    "--render-stats/--no-render-stats",
+    "render_stats",
+    default=False,
+    help="Show the frame rate and time per frame in the status bar (for debugging slow terminals).",
+)
+@click.option(
+    "--crossfade",
+    "crossfade",
+    type=click.FloatRange(0),
+    default=config.CROSSFADE,
+    show_default=True,
+    help="Fade each song into the next over this many seconds (0 for gapless playback without a crossfade).",
+)
 def play(
     tags,
     exclude_tags,
@@ -1643,6 +1939,8 @@ def play(
     lyrics,
     translated_lyrics,
     combine_artists,
+    render_stats,
+    crossfade,
 ):
     """Play your songs. If tags are passed, any song matching any tag will be in
     your queue, unless the '-M/--match-all' flag is passed, in which case
@@ -1788,6 +2086,8 @@ def play(
             password,
             lyrics,
             translated_lyrics and lyrics,
+            render_stats,
+            crossfade,
         )
 
     if songs_not_found:
@@ -1827,10 +2127,7 @@ def rename(original, new_name, renaming_tag):
             fg="green",
         )
     else:
-        for song in helpers.SONGS:
-            if original in song.tags:
-                song.tags.remove(original)
-                song.tags.add(new_name)
+        helpers.SONG_DATA.rename_tag(original, new_name)
 
         click.secho(
             f"Renamed all ocurrences of tag '{original}' to '{new_name}'.",
@@ -1872,15 +2169,14 @@ def search(phrase, searching_for_tags):
             set(),
             set(),
         )  # is, starts, contains but does not start
-        for song in helpers.SONGS:
-            for tag in song.tags:
-                tag_lower = tag.lower()
-                if tag_lower == phrase:
-                    results[0].add(tag)
-                elif tag_lower.startswith(phrase):
-                    results[1].add(tag)
-                elif phrase in tag_lower:
-                    results[2].add(tag)
+        for tag in helpers.SONG_DATA.tags():
+            tag_lower = tag.lower()
+            if tag_lower == phrase:
+                results[0].add(tag)
+            elif tag_lower.startswith(phrase):
+                results[1].add(tag)
+            elif phrase in tag_lower:
+                results[2].add(tag)
 
         if not any(results):
             click.secho("No results found.", fg="red")
@@ -2080,62 +2376,31 @@ def list_(
     if listing_tags:
         search_tags -= exclude_tags
 
-        tags = defaultdict(lambda: [0, 0])
-        for song in helpers.SONGS:
-            search_criteria = (
-                (
-                    (
-                        any(
-                            artist.lower()
-                            in song.artist.lower()
-                            + (
-                                f", {song.album_artist.lower()}"
-                                if combine_artists
-                                else ""
-                            )
-                            for artist in artists
-                        )
-                    ),
+        if artists or albums or album_artists:
+            matching = {
+                song.song_id
+                for song in helpers.SONGS
+                if helpers.song_matches(
+                    song,
                     artists,
-                ),
-                (
-                    (
-                        any(
-                            album.lower() in song.album.lower()
-                            for album in albums
-                        )
-                    ),
                     albums,
-                ),
-                (
-                    (
-                        any(
-                            album_artist.lower()
-                            in song.album_artist.lower()
-                            + (
-                                ", " + song.artist.lower()
-                                if combine_artists
-                                else ""
-                            )
-                            for album_artist in album_artists
-                        )
-                    ),
                     album_artists,
-                ),
-            )
-            search_criteria = tuple(
-                c[0] for c in filter(lambda t: t[1], search_criteria)
-            )
-
-            if match_all:
-                search_criteria = not search_criteria or all(search_criteria)
-            else:
-                search_criteria = not search_criteria or any(search_criteria)
+                    match_all,
+                    combine_artists,
+                )
+            }
+        else:
+            matching = None  # all songs
 
-            for tag in song.tags:
-                if (not search_tags or tag in search_tags) and search_criteria:
-                    tags[tag][0] += song.listen_times.get(year, 0)
-                    tags[tag][1] += song.duration
+        tags = defaultdict(lambda: [0, 0])
+        for tag in search_tags or list(helpers.SONG_DATA.tags()):
+            tagged = helpers.SONG_DATA.songs_with_any_tag((tag,))
+            if matching is not None:
+                tagged &= matching
+            for song_id in tagged:
+                song = helpers.SONGS[song_id]
+                tags[tag][0] += song.listen_times.get(year, 0)
+                tags[tag][1] += song.duration
 
         tags = list(tags.items())
 
@@ -2508,7 +2773,7 @@ def clip_(song: helpers.Song, name, start, end, editor):
         f'clip "{name}" for "{song.song_title}" (ID {song.song_id}): {start} to {end}.',
         fg="green",
     )
-    song.clips[name] = (start, end)
+    song.add_clip(name, start, end)
 
 
 @cli.command()
@@ -2590,11 +2855,11 @@ def unclip(songs: tuple[helpers.Song], names, all_, force):
 
     for song in songs:
         if not names:
-            song.clips.clear()
+            song.clear_clips()
         else:
             for name in names:
                 if name in song.clips:
-                    del song.clips[name]
+                    song.remove_clip(name)
 
     if not names:
         click.secho(
@@ -2944,6 +3209,90 @@ def migrate():
     )
 
 
+@cli.command()
+def dedupe():
+    """
+    List songs with the same audio, regardless of their names or tags.
+
+    Audio fingerprints are cached, so only songs added or changed since the
+    last run are (re)fingerprinted, which can take a while the first time for
+    large libraries.
+    """
+    n = helpers.FINGERPRINT_INDEX.refresh()
+    if n:
+        click.secho(f"Fingerprinted {helpers.pluralize(n, 'song')}.", fg="green")
+
+    clusters = helpers.FINGERPRINT_INDEX.duplicates()
+    if not clusters:
+        click.secho("No duplicate songs found.", fg="green")
+        return
+
+    for cluster in clusters:
+        for song_id in cluster:
+            helpers.print_entry(helpers.SONGS[song_id])
+        click.echo()
+    click.secho(
+        f"Found {helpers.pluralize(len(clusters), 'group')} of duplicate songs ({sum(map(len, clusters))} songs).",
+        fg="yellow",
+    )
+
+
+@cli.command()
+@click.argument("songs", required=False, type=helpers.CLICK_SONG, nargs=-1)
+@click.option(
+    "-B/-nB",
+    "--build-cache/--no-build-cache",
+    "building",
+    default=False,
+    help="Cache the artwork of song(s) (default: all songs).",
+)
+@click.option(
+    "-C/-nC",
+    "--clear-cache/--no-clear-cache",
+    "clearing",
+    default=False,
+    help="Clear the artwork cache.",
+)
+def artwork(songs: tuple[helpers.Song], building, clearing):
+    """
+    Manage the artwork cache. The player caches each song's artwork, resized
+    and converted to JPEG, the first time it plays the song, so it doesn't
+    have to decode and resize the embedded image again; '-B/--build-cache'
+    caches it ahead of time for SONGS, or for all songs if none are passed.
+    Only songs added or retagged since the last run are processed.
+
+    Shows how many songs' artwork is cached if no options are passed.
+    """
+    if building and clearing:
+        click.secho(
+            "Cannot pass both '-B/--build-cache' and '-C/--clear-cache'.",
+            fg="red",
+        )
+        return
+
+    if clearing:
+        helpers.ARTWORK_CACHE.clear()
+        click.secho("Cleared the artwork cache.", fg="green")
+        return
+
+    if building:
+        cached, failed = helpers.ARTWORK_CACHE.build(songs or None)
+        click.secho(
+            f"Cached artwork for {helpers.pluralize(cached, 'song')}.",
+            fg="green",
+        )
+        if failed:
+            click.secho(
+                f"Failed to read the artwork of {helpers.pluralize(failed, 'song')}; see the logs.",
+                fg="red",
+            )
+
+    n, size = helpers.ARTWORK_CACHE.size()
+    click.echo(
+        f"Artwork cached for {n} of {helpers.pluralize(len(helpers.SONGS), 'song')} ({size / 2**20:.1f} MiB)."
+    )
+
+
 @cli.command(name="format-data")
 @click.argument("indent", type=int, default=4)
 def format_data(indent: int):
@@ -2953,6 +3302,14 @@ def format_data(indent: int):
     """
     import safer
 
+    if helpers.SONG_DATA.store.lazy:
+        click.secho(
+            f"Song data is stored in '{config.SONGS_DB_PATH}', not JSON. Run 'maestro convert-data json' first.",
+            fg="red",
+        )
+        return
+
+    helpers.SONG_DATA.compact()  # fold in any journaled changes
     with open(config.SONGS_INFO_PATH, "r", encoding="utf-8") as f:
         data = msgspec.json.decode(f.read())
 
@@ -2965,6 +3322,62 @@ def format_data(indent: int):
     )
 
 
+@cli.command(name="compact-data")
+def compact_data():
+    """
+    Fold the song data journal (recent changes, which maestro appends to
+    instead of rewriting the whole song data file) into the song data file.
+    maestro does this automatically once the journal gets large.
+    """
+    helpers.SONG_DATA.compact()
+    if helpers.SONG_DATA.store.lazy:
+        click.secho(f"Compacted '{config.SONGS_DB_PATH}'.", fg="green")
+    else:
+        click.secho(
+            f"Compacted '{config.SONGS_JOURNAL_PATH}' into '{config.SONGS_INFO_PATH}'.",
+            fg="green",
+        )
+
+
+@cli.command(name="convert-data")
+@click.argument("to", type=click.Choice(["json", "sqlite"]))
+def convert_data(to):
+    """
+    Convert the song data to a different storage format.
+
+    'json' (the default) stores all song data in a single human-readable file
+    that has to be read in full by every command. 'sqlite' stores it in an
+    SQLite database instead, from which commands that only touch a few songs
+    can read just those songs; this is faster for large libraries.
+    """
+    song_data = helpers.SONG_DATA
+    if (to == "sqlite") == song_data.store.lazy:
+        click.secho(f"Song data is already stored as {to}.", fg="yellow")
+        return
+
+    song_data.compact()
+    songs = song_data.store.read()
+    song_data.close()
+    if to == "sqlite":
+        new_store = helpers.SQLiteSongStore(config.SONGS_DB_PATH + ".tmp")
+        new_store.write_all(songs)
+        new_store.close()
+        os.replace(new_store.path, config.SONGS_DB_PATH)
+        os.remove(config.SONGS_INFO_PATH)
+        old_path, new_path = config.SONGS_INFO_PATH, config.SONGS_DB_PATH
+    else:
+        helpers.JSONSongStore().write_all(songs)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(config.SONGS_DB_PATH + suffix):
+                os.remove(config.SONGS_DB_PATH + suffix)
+        old_path, new_path = config.SONGS_DB_PATH, config.SONGS_INFO_PATH
+
+    click.secho(
+        f"Converted {len(songs)} songs from '{old_path}' to '{new_path}'.",
+        fg="green",
+    )
+
+
 @cli.command(name="lyrics")
 @click.argument("songs", required=False, type=helpers.CLICK_SONG, nargs=-1)
 @click.option(
@@ -3169,8 +3582,7 @@ def lyrics_(
                 )
         return
 
-    import syncedlyrics
-
+    jobs = []  # (song, query)
     for song in songs:
         if removing:
             if override:
@@ -3201,45 +3613,18 @@ def lyrics_(
 
         song_title = name or f"{song.artist} - {song.song_title}"
 
-        if song.raw_lyrics:
-            if not force:
-                click.echo(
-                    f'Lyrics already exist for "{song.song_title}" (ID {song.song_id}). Overwrite? [y/n] ',
-                    nl=False,
-                )
-                if input().lower() != "y":
-                    continue
-
-        try:
-            # pylint: disable=unexpected-keyword-arg
-            lyrics = syncedlyrics.search(song_title, allow_plain_format=True)
-        except TypeError as e:
-            print_to_logfile(
-                f"TypeError with allow_plain_format=True in syncedlyrics.search: {e}"
-            )
-            try:
-                lyrics = syncedlyrics.search(song_title)
-            except Exception as f:
-                click.secho(
-                    f'Failed to download lyrics for "{song_title}": {f}',
-                    fg="red",
-                )
-        except Exception as e:
-            click.secho(
-                f'Failed to download lyrics for "{song_title}": {e}',
-                fg="red",
+        if not force and song.raw_lyrics:
+            click.echo(
+                f'Lyrics already exist for "{song.song_title}" (ID {song.song_id}). Overwrite? [y/n] ',
+                nl=False,
             )
-        else:
-            if lyrics:
-                click.secho(
-                    f'Downloaded lyrics for "{song.song_title}" (ID {song.song_id})'
-                    + (f' using name "{name}"' if name else "")
-                    + ".",
-                    fg="green",
-                )
-                song.raw_lyrics = lyrics
-            else:
-                click.secho(f'No lyrics found for "{song_title}".', fg="yellow")
+            if input().lower() != "y":
+                continue
+
+        jobs.append((song, song_title))
+
+    if jobs:
+        _fetch_lyrics(jobs, name)
 
 
 @cli.command(name="translit")
@@ -0,0 +1,105 @@
+"""
+Benchmark preparing a song for visualization and streaming: the old pipeline
+(decoding and resampling the file twice, once for the spectrogram and once
+for PCM) against `maestro.helpers.decode_audio` + `audio_pcm16` +
+`audio_spectrogram` (one decode at the native sample rate). Reports CPU time
+and peak memory (traced numpy allocations) per song, and how far the new
+spectrogram is from the old one.
+
+Usage: python benchmark_audio_decode.py [audio_file ...]
+
+If no files are passed, 3-minute stereo MP3 and FLAC files are generated.
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from time import process_time
+
+import numpy as np
+
+from maestro import config
+from maestro.helpers import (
+    audio_pcm16,
+    audio_spectrogram,
+    decode_audio,
+    resample_audio,
+)
+
+
+def old_pipeline(path):
+    import librosa
+
+    def load(sr):
+        audio = librosa.load(path, mono=False, sr=sr)[0]
+        if audio.ndim == 1:
+            audio = np.repeat([audio], 2, axis=0)
+        return audio
+
+    vis = (
+        librosa.amplitude_to_db(
+            np.abs(librosa.stft(load(config.VIS_SAMPLE_RATE))), ref=np.max
+        )
+        + 80
+    )
+    pcm = np.int16(load(config.STREAM_SAMPLE_RATE) * (2**15 - 1) * 0.5)
+    return vis, pcm
+
+
+def new_pipeline(path):
+    # same steps as PlaybackHandler._process_audio, minus the cache
+    audio, sr = decode_audio(path)
+    pcm = audio_pcm16(audio, sr)
+    audio = resample_audio(audio, sr, config.VIS_SAMPLE_RATE)
+    return audio_spectrogram(audio, config.VIS_SAMPLE_RATE), pcm
+
+
+def measure(pipeline, path):
+    tracemalloc.start()
+    t = process_time()
+    result = pipeline(path)
+    t = process_time() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, t, peak
+
+
+def make_test_files(directory):
+    import soundfile as sf
+
+    sr = 44100
+    rng = np.random.default_rng(0)
+    t = np.arange(180 * sr) / sr
+    freqs = rng.uniform(50, 8000, 20)
+    audio = sum(np.sin(2 * np.pi * f * t + i) for i, f in enumerate(freqs))
+    audio = audio * (0.5 + 0.5 * np.sin(2 * np.pi * 0.5 * t))  # "beats"
+    audio = np.stack([audio, np.roll(audio, 441)]).T / len(freqs)
+    audio += rng.normal(0, 0.01, audio.shape)
+    paths = []
+    for ext in ("mp3", "flac"):
+        path = os.path.join(directory, f"test.{ext}")
+        sf.write(path, audio.astype(np.float32), sr)
+        paths.append(path)
+    return paths
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    paths = sys.argv[1:] or make_test_files(tmp)
+    new_pipeline(paths[0])  # warm up (imports, JIT, FFT plans)
+    old_pipeline(paths[0])
+    for path in paths:
+        (old_vis, old_pcm), old_t, old_peak = measure(old_pipeline, path)
+        (new_vis, new_pcm), new_t, new_peak = measure(new_pipeline, path)
+        new_vis = new_vis.transpose(1, 2, 0)  # frames first -> last
+        frames = min(old_vis.shape[2], new_vis.shape[2])
+        diff = np.abs(old_vis[..., :frames] - new_vis[..., :frames]).mean()
+        print(
+            f"{os.path.basename(path)}: "
+            f"old {old_t:.2f}s CPU, {old_peak / 2**20:.0f} MiB peak | "
+            f"new {new_t:.2f}s CPU, {new_peak / 2**20:.0f} MiB peak "
+            f"({old_t / new_t:.1f}x) | spectrogram shapes {old_vis.shape} vs "
+            f"{new_vis.shape}, mean diff {diff:.2f} dB, "
+            f"PCM {old_pcm.shape} vs {new_pcm.T.shape}"
+        )
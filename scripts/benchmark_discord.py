@@ -0,0 +1,160 @@
+"""
+Benchmark Discord rich presence updates while skipping through songs, with a
+fake RPC client standing in for Discord: the old way (each update in its own
+thread, sleeping until the rate limit allows it, with a boolean as a lock, and
+reconnecting inline on errors) against `maestro.helpers.DiscordPresence`. The
+fake client's first connection attempt fails, and so does one update later
+on, as if Discord had restarted. Reports the updates sent and the shortest gap
+between them (the rate limit is INTERVAL secs), how long after the last skip
+Discord showed the last song, and the longest an update call blocked its
+caller.
+
+Usage: python benchmark_discord.py [skips]
+
+Skips through `skips` songs (default: 20), 100 ms apart, then waits for the
+presence to settle. The rate limit is scaled down from 15 secs to INTERVAL.
+"""
+
+import sys
+import threading
+
+from time import monotonic, sleep
+
+from maestro.helpers import DiscordPresence
+
+
+SKIPS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+SKIP_INTERVAL = 0.1  # secs
+INTERVAL = 1  # secs, Discord's rate limit (15 s) scaled down
+FAIL_UPDATE = 3  # the nth update (from 1) fails
+
+
+class FakeClient:
+    """The parts of `pypresence.Client` that maestro uses, recording the
+    activities shown in `SHOWN`."""
+
+    SHOWN = []  # (time, details)
+    connections = 0
+    updates = 0
+
+    def __init__(self):
+        FakeClient.connections += 1
+        self.first = FakeClient.connections == 1
+
+    def start(self):
+        if self.first:
+            raise ConnectionError("Discord isn't running")
+
+    def set_activity(self, **activity):
+        FakeClient.updates += 1
+        if FakeClient.updates == FAIL_UPDATE:
+            raise BrokenPipeError("Discord restarted")
+        self.SHOWN.append((monotonic(), activity["details"]))
+
+    def close(self):
+        pass
+
+    @classmethod
+    def reset(cls):
+        cls.SHOWN = []
+        cls.connections = cls.updates = 0
+
+
+class OldPresence:
+    """The old `PlaybackHandler.update_discord_metadata`, minus the
+    player."""
+
+    def __init__(self):
+        self.song = None
+        self.updating = False
+        self.last_update = 0
+        try:
+            self.rpc = self.connect()
+        except Exception:  # pylint: disable=broad-except
+            self.rpc = None
+
+    def connect(self):
+        rpc = FakeClient()
+        rpc.start()
+        return rpc
+
+    def update(self):
+        if self.updating:
+            return
+        self.updating = True
+        t = monotonic()
+        if self.last_update + INTERVAL > t:
+            sleep(INTERVAL - (t - self.last_update))
+        try:
+            self.rpc.set_activity(details=self.song)
+            self.last_update = monotonic()
+        except Exception:  # pylint: disable=broad-except
+            try:
+                self.rpc = self.connect()
+                self.updating = False
+                self.update()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        finally:
+            self.updating = False
+
+
+def old_way():
+    presence = OldPresence()
+    for i in range(SKIPS):
+        presence.song = f"song {i}"
+        last_skip = monotonic()
+        threading.Thread(target=presence.update, daemon=True).start()
+        sleep(SKIP_INTERVAL)
+    # e.g. toggling streaming called it on the UI thread
+    t = monotonic()
+    presence.update()
+    blocked = monotonic() - t
+    sleep(2 * INTERVAL)
+    return last_skip, blocked, None
+
+
+def new_way():
+    presence = DiscordPresence(
+        client_factory=FakeClient, interval=INTERVAL, reconnect_delay=0.1
+    )
+    presence.start()
+    blocked = 0
+    for i in range(SKIPS):
+        last_skip = t = monotonic()
+        presence.update({"details": f"song {i}"})
+        blocked = max(blocked, monotonic() - t)
+        sleep(SKIP_INTERVAL)
+    presence.flush()
+    presence.stop()
+    return last_skip, blocked, presence
+
+
+def measure(name, run):
+    FakeClient.reset()
+    last_skip, blocked, presence = run()
+    shown = FakeClient.SHOWN
+    gaps = [b[0] - a[0] for a, b in zip(shown, shown[1:])]
+    final = shown[-1][1] if shown else None
+    last = f"song {SKIPS - 1}"
+    first_last = next((t for t, song in shown if song == last), None)
+    print(
+        f"{name}: {len(shown):2} updates shown, shortest gap "
+        f"{min(gaps, default=0):.2f}s, {last!r} shown "
+        + (
+            f"{first_last - last_skip:.2f}s after the last skip"
+            if first_last is not None
+            else "never"
+        )
+        + f", final {final!r}, caller blocked up to {blocked * 1000:.1f} ms"
+    )
+    if presence is not None:
+        print(
+            f"  {presence.sent} sent, {presence.coalesced} coalesced, "
+            f"{presence.dropped} dropped, {presence.errors} errors"
+        )
+
+
+if __name__ == "__main__":
+    measure("old", old_way)
+    measure("new", new_way)
@@ -0,0 +1,158 @@
+"""
+Measure the gaps between songs in `maestro play`, with a fake playback backend
+whose songs take a while to open (like big files on a network mount): without
+preloading (`config.PRELOAD_TIME = 0`), with preloading, and with preloading
+and a crossfade. The player runs in a pseudo-terminal; reports how long each
+song started after the last one ended (negative: they overlapped).
+
+Usage: python benchmark_gapless.py [load_time]
+
+Plays the first few songs in your library, without actually playing audio;
+opening a song takes `load_time` secs (default: 0.5).
+"""
+
+import curses
+import os
+import pty
+import sys
+import types
+
+from time import monotonic, sleep
+
+import msgspec
+
+from maestro import config, helpers
+from maestro.main import _play
+
+
+SONGS = 4
+DURATION = 3  # secs per song
+CROSSFADE = 1  # secs
+LOAD_TIME = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+
+
+class FakePlayback:
+    """The parts of `just_playback.Playback` that the player uses, logging
+    when each song starts and ends to `EVENTS`."""
+
+    EVENTS = []  # ("start"/"end", time)
+
+    def __init__(self):
+        self.active = False
+        self.playing = False
+        self.duration = 0
+        self._start = None  # when playback would've been at 0
+        self._pos = 0  # while paused
+
+    def load_file(self, path):  # pylint: disable=unused-argument
+        sleep(LOAD_TIME)
+        self.duration = DURATION
+        self.active = self.playing = False
+        self._pos = 0
+
+    def play(self):
+        self._start = monotonic() - self._pos
+        self.active = self.playing = True
+        self.EVENTS.append(("start", monotonic()))
+
+    def pause(self):
+        self._pos = self.curr_pos
+        self.playing = False
+
+    def resume(self):
+        self._start = monotonic() - self._pos
+        self.playing = True
+
+    def seek(self, pos):
+        self._pos = pos
+        if self.playing:
+            self._start = monotonic() - pos
+
+    def stop(self):
+        if self.active:
+            self.EVENTS.append(("end", monotonic()))
+        self.active = self.playing = False
+
+    def set_volume(self, volume):
+        pass
+
+    @property
+    def curr_pos(self):
+        if not self.active:
+            return -1
+        if not self.playing:
+            return self._pos
+        pos = monotonic() - self._start
+        if pos >= self.duration:
+            self.EVENTS.append(("end", self._start + self.duration))
+            self.active = self.playing = False
+            return self.duration
+        return pos
+
+
+def play(result_fd, preload_time, crossfade):
+    config.PRELOAD_TIME = preload_time
+    curses.wrapper(
+        _play,
+        list(helpers.SONGS)[:SONGS],
+        100,  # volume
+        False,  # loop
+        False,  # clip mode
+        0,  # reshuffle
+        False,  # discord
+        False,  # visualize
+        False,  # stream
+        None,  # username
+        None,  # password
+        False,  # lyrics
+        False,  # translated lyrics
+        False,  # render stats
+        crossfade,
+    )
+    os.write(result_fd, msgspec.json.encode(FakePlayback.EVENTS))
+
+
+def measure(preload_time, crossfade):
+    result_r, result_w = os.pipe()
+    pid, fd = pty.fork()
+    if pid == 0:  # child: the player
+        os.close(result_r)
+        os.environ["TERM"] = "xterm-256color"
+        try:
+            play(result_w, preload_time, crossfade)
+        finally:
+            os._exit(0)  # pylint: disable=protected-access
+
+    os.close(result_w)
+    while True:
+        try:
+            if not os.read(fd, 65536):
+                break
+        except OSError:  # child exited
+            break
+    os.waitpid(pid, 0)
+    with os.fdopen(result_r, "rb") as f:
+        events = msgspec.json.decode(f.read())
+
+    starts = sorted(t for kind, t in events if kind == "start")
+    ends = sorted(t for kind, t in events if kind == "end")
+    return [start - end for start, end in zip(starts[1:], ends)]
+
+
+if __name__ == "__main__":
+    config.LOGFILE = os.devnull  # e.g. network errors from metadata updates
+    with open(config.SETTINGS_FILE, "rb") as f:
+        config.settings = msgspec.json.decode(f.read())
+    sys.modules["just_playback"] = types.SimpleNamespace(Playback=FakePlayback)
+
+    for name, preload_time, crossfade in (
+        ("no preloading", 0, 0),
+        ("preloading", config.PRELOAD_TIME, 0),
+        (f"{CROSSFADE}s crossfade", config.PRELOAD_TIME, CROSSFADE),
+    ):
+        gaps = measure(preload_time, crossfade)
+        print(
+            f"{name:>15}: gaps "
+            + ", ".join(f"{gap * 1000:6.0f}" for gap in gaps)
+            + " ms"
+        )
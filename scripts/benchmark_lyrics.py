@@ -0,0 +1,72 @@
+"""
+Benchmark `maestro.helpers.LyricsFetcher` against local stub lyrics providers
+with simulated latency, misses, and transient errors, comparing one worker
+(like the old one-song-at-a-time loop) with the default number of workers.
+
+Usage: python benchmark_lyrics.py [number_of_songs]
+"""
+
+import os
+import random
+import sys
+import threading
+
+from time import sleep, time
+
+from maestro import config
+from maestro.helpers import LyricsFetcher
+
+
+config.LOGFILE = os.devnull  # provider errors are logged
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+LATENCY = 0.05  # secs per request
+
+
+class StubProvider:
+    def __init__(self, name, hit_rate, error_rate):
+        self.name = name
+        self.hit_rate = hit_rate
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rng = random.Random(name)
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        with self._lock:
+            self.requests += 1
+            r = self._rng.random()
+        sleep(LATENCY)
+        if r < self.error_rate:
+            raise ConnectionError("stub provider error")
+        if r < self.error_rate + self.hit_rate:
+            return f"[00:00.00] lyrics for {query}"
+        return None
+
+
+def run(workers):
+    providers = [
+        StubProvider("first", hit_rate=0.6, error_rate=0.05),
+        StubProvider("second", hit_rate=0.5, error_rate=0.05),
+    ]
+    fetcher = LyricsFetcher(
+        [(p.name, p) for p in providers],
+        workers=workers,
+        rate=config.LYRICS_PROVIDER_RATE * 25,  # stubs can take more load
+        backoff=0.01,
+    )
+    t = time()
+    found = failed = 0
+    for _, lyrics, error in fetcher.fetch((i, f"Song {i}") for i in range(N)):
+        found += lyrics is not None
+        failed += error is not None
+    t = time() - t
+    requests = sum(p.requests for p in providers)
+    print(
+        f"{workers:>2} workers: {N / t:7.1f} songs/s ({t:.2f}s), "
+        f"{found} found, {failed} failed, {requests} requests"
+    )
+
+
+run(1)
+run(config.LYRICS_WORKERS)
@@ -0,0 +1,94 @@
+"""
+Benchmark preparing a song's PCM for streaming: decoding and resampling the
+whole song at once (`maestro.helpers.audio_pcm16` + `decode_audio`, like the
+player used to for each of the next few songs) against
+`maestro.helpers.PCMStream`, which decodes it block by block as it's
+streamed. Measures CPU time and peak RSS for songs of different lengths, each
+in its own subprocess so peak RSS isn't shared between cases.
+
+Usage: python benchmark_pcm_stream.py [minutes ...]
+
+Generates 48 kHz stereo FLAC files of the given lengths (default: 1, 5, and
+20 minutes), so that streaming resamples them.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from time import process_time
+
+import numpy as np
+
+
+def make_song(minutes, path):
+    import soundfile as sf
+
+    sr = 48000
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, "w", sr, 2) as f:
+        for second in range(int(minutes * 60)):
+            t = second + np.arange(sr) / sr
+            audio = 0.3 * np.sin(2 * np.pi * 440 * t) * np.sin(np.pi * t)
+            audio = np.stack([audio, np.roll(audio, 48)]).T
+            f.write(audio + rng.normal(0, 0.01, audio.shape))
+
+
+def whole(path):
+    from maestro.helpers import audio_pcm16, decode_audio
+
+    return len(audio_pcm16(*decode_audio(path)))
+
+
+def streamed(path):
+    from maestro.helpers import PCMStream
+
+    stream = PCMStream(path)
+    size = sum(len(chunk) for chunk in stream.chunks(0))
+    return size // 4
+
+
+def measure(loader, path):
+    # warm up (imports, JIT) on a short song so only decoding is measured
+    warm_up_path = os.path.join(os.path.dirname(path), "warm-up.flac")
+    make_song(1 / 60, warm_up_path)
+    loader(warm_up_path)
+
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = process_time()
+    frames = loader(path)
+    t = process_time() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{t} {(peak - base) / 1024} {frames}")  # ru_maxrss is in KiB
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        measure({"whole": whole, "streamed": streamed}[sys.argv[2]], sys.argv[3])
+        sys.exit()
+
+    lengths = [float(m) for m in sys.argv[1:]] or [1, 5, 20]
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in lengths:
+            path = os.path.join(tmp, f"song-{minutes}.flac")
+            make_song(minutes, path)
+            results = {}
+            for loader in ("whole", "streamed"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--measure", loader, path],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.split()
+                results[loader] = float(out[0]), float(out[1]), int(out[2])
+            (old_t, old_m, old_n), (new_t, new_m, new_n) = (
+                results["whole"],
+                results["streamed"],
+            )
+            assert old_n == new_n
+            print(
+                f"{minutes:5g} min: whole {old_t:6.2f}s CPU {old_m:7.1f} MiB | "
+                f"streamed {new_t:6.2f}s CPU {new_m:7.1f} MiB"
+            )
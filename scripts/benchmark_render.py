@@ -0,0 +1,100 @@
+"""
+Benchmark the visualizer renderer, `maestro.jit_funcs.render` (vectorized,
+one lookup-table pass per frame) against the loop-based renderer it replaced
+(numba object mode, one string concatenation per cell), in frames/second at
+several terminal widths, for mono and stereo frames. Also checks that both
+draw the same thing.
+
+Usage: python benchmark_render.py [width ...]
+"""
+
+import sys
+
+from time import perf_counter
+
+import numpy as np
+
+from maestro import config
+from maestro.jit_funcs import jit, render
+
+
+# the loop-based renderer that render replaced
+@jit(forceobj=True)
+def old_render(
+    num_bins,
+    bands: np.ndarray,
+    visualizer_height,
+    mono=False,
+):
+    # copy, since bands may be read-only
+    bands = bands.astype(np.float64)
+    if not mono:
+        gap_bins = 1 if num_bins % 2 else 2
+        num_bins = (num_bins - 1) // 2
+    else:
+        gap_bins = 0
+        bands[0] = (bands[0] + bands[1]) / 2
+
+    num_vertical_block_sizes = len(config.VERTICAL_BLOCKS) - 1
+    freqs = np.round(
+        bands / 80 * visualizer_height * num_vertical_block_sizes
+    )
+
+    arr = np.zeros((int(not mono) + 1, visualizer_height, num_bins))
+    for b in range(num_bins):
+        bin_height = freqs[0, b]
+        h = 0
+        while bin_height > num_vertical_block_sizes:
+            arr[0, h, b] = num_vertical_block_sizes
+            bin_height -= num_vertical_block_sizes
+            h += 1
+        arr[0, h, b] = bin_height
+        if not mono:
+            bin_height = freqs[1, b]
+            h = 0
+            while bin_height > num_vertical_block_sizes:
+                arr[1, h, b] = num_vertical_block_sizes
+                bin_height -= num_vertical_block_sizes
+                h += 1
+            arr[1, h, b] = bin_height
+
+    res = []
+    for h in range(visualizer_height - 1, -1, -1):
+        s = ""
+        for b in range(num_bins):
+            if mono:
+                s += config.VERTICAL_BLOCKS[arr[0, h, b]]
+            else:
+                s += config.VERTICAL_BLOCKS[arr[0, h, num_bins - b - 1]]
+        if not mono:
+            s += " " * gap_bins
+            for b in range(num_bins):
+                s += config.VERTICAL_BLOCKS[arr[1, h, b]]
+        res.append(s)
+
+    return res
+
+def fps(func, frames, width, mono):
+    func(width, frames[0], config.VISUALIZER_HEIGHT, mono)  # warm up / JIT
+    t = perf_counter()
+    for frame in frames:
+        func(width, frame, config.VISUALIZER_HEIGHT, mono)
+    return len(frames) / (perf_counter() - t)
+
+
+widths = [int(w) for w in sys.argv[1:]] or [80, 200, 400]
+rng = np.random.default_rng(0)
+for width in widths:
+    for mono in (True, False):
+        num_bands = width if mono else (width - 1) // 2
+        frames = rng.integers(0, 81, (300, 2, num_bands), dtype=np.uint8)
+        for frame in frames[:20]:
+            assert render(
+                width, frame, config.VISUALIZER_HEIGHT, mono
+            ) == old_render(width, frame, config.VISUALIZER_HEIGHT, mono)
+        old = fps(old_render, frames, width, mono)
+        new = fps(render, frames, width, mono)
+        print(
+            f"{width:>3} columns, {'mono  ' if mono else 'stereo'}: "
+            f"old {old:8.0f} fps | new {new:8.0f} fps ({new / old:.0f}x)"
+        )
@@ -0,0 +1,140 @@
+"""
+Benchmark how much `maestro.helpers.PlaybackHandler` writes to the terminal
+while playing with the visualizer and lyrics on. The player runs in a
+pseudo-terminal and redraws at `config.FPS` for a few seconds, either
+repainting the whole screen every frame (like it used to) or only the panes
+that playback progress changed. Reports bytes written to the terminal per
+second and per frame, and CPU time per frame.
+
+Usage: python benchmark_screen.py [song_id]
+
+Plays the song with the given ID from your library (default: the first one),
+with synthetic timed lyrics, without actually playing audio.
+"""
+
+import curses
+import fcntl
+import os
+import pty
+import struct
+import sys
+import termios
+
+from time import monotonic, process_time, sleep
+
+import msgspec
+import pylrc
+
+from maestro import config, helpers
+
+
+SECONDS = 5
+ROWS, COLS = 40, 160
+START, END = b"<<benchmark-start>>", b"<<benchmark-end>>"
+
+
+class FakePlayback:
+    """The parts of `just_playback.Playback` that the screen uses."""
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.active = True
+        self._start = monotonic()
+
+    @property
+    def curr_pos(self):
+        return (monotonic() - self._start) % self.duration
+
+
+def play(stdscr, song, full, result_fd):
+    helpers.init_curses(stdscr)
+    player = helpers.PlaybackHandler(
+        stdscr, [song], False, True, False, (None, None), True, False
+    )
+    duration = song.duration
+    player.playback, player.duration = FakePlayback(duration), duration
+    player.lyrics = pylrc.parse(
+        "\n".join(
+            f"[{int(t) // 60:02d}:{t % 60:05.2f}]Line {i} of the lyrics"
+            for i, t in enumerate(range(0, int(duration), 2))
+        )
+    )
+    player.lyrics_scroller = helpers.Scroller(
+        len(player.lyrics), player.screen_height - 1
+    )
+
+    # wait for the whole spectrogram, so computing it doesn't count as CPU
+    # time spent drawing
+    while song not in player.audio_data or player.audio_data[song][0] is None:
+        sleep(0.05)
+    spectrogram = player.audio_data[song][0]
+    while spectrogram.frame(len(spectrogram) - 1) is None:
+        sleep(0.05)
+    player.update_screen()
+    player.render_scheduler.tick()
+
+    os.write(sys.stdout.fileno(), START)
+    frames = 0
+    cpu = process_time()
+    end = monotonic() + SECONDS
+    while monotonic() < end:
+        if full:
+            player.update_screen()
+        frames += player.render_scheduler.tick(progressed=True)
+        sleep(1 / config.FPS)
+    cpu = process_time() - cpu
+    os.write(sys.stdout.fileno(), END)
+    os.write(result_fd, msgspec.json.encode([frames, cpu]))
+
+
+def measure(song, full):
+    result_r, result_w = os.pipe()
+    pid, fd = pty.fork()
+    if pid == 0:  # child: the player
+        os.close(result_r)
+        fcntl.ioctl(
+            sys.stdin.fileno(),
+            termios.TIOCSWINSZ,
+            struct.pack("HHHH", ROWS, COLS, 0, 0),
+        )
+        os.environ["TERM"] = "xterm-256color"
+        try:
+            curses.wrapper(play, song, full, result_w)
+        finally:
+            os._exit(0)  # pylint: disable=protected-access
+
+    os.close(result_w)
+    output = b""
+    while True:
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError:  # child exited
+            break
+        if not chunk:
+            break
+        output += chunk
+    os.waitpid(pid, 0)
+    with os.fdopen(result_r, "rb") as f:
+        frames, cpu = msgspec.json.decode(f.read())
+    written = len(output.split(START, 1)[1].split(END, 1)[0])
+    return written, frames, cpu
+
+
+if __name__ == "__main__":
+    config.LOGFILE = os.devnull  # e.g. network errors from metadata updates
+    with open(config.SETTINGS_FILE, "rb") as f:
+        config.settings = msgspec.json.decode(f.read())
+    if len(sys.argv) > 1:
+        song = helpers.SONGS[int(sys.argv[1])]
+    else:
+        song = next(iter(helpers.SONGS))
+
+    for full in (True, False):
+        written, frames, cpu = measure(song, full)
+        print(
+            f"{'whole screen' if full else 'dirty panes':>12}: "
+            f"{written / SECONDS / 1024:7.1f} KiB/s, "
+            f"{written / frames:7.0f} B/frame, "
+            f"{cpu / frames * 1000:5.2f} ms CPU/frame "
+            f"({frames / SECONDS:.0f} fps)"
+        )
@@ -0,0 +1,75 @@
+"""
+Benchmark `maestro.helpers.TitleIndex` (used by 'maestro search' and song
+arguments) against a linear scan over a synthetic library of song titles.
+
+Usage: python benchmark_search.py [number_of_titles]
+"""
+
+import random
+import string
+import sys
+
+from time import perf_counter
+
+from maestro.helpers import TitleIndex
+
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+QUERIES = 1000
+
+random.seed(0)
+WORDS = [
+    "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9)))
+    for _ in range(5000)
+]
+titles = {
+    i: " ".join(random.choices(WORDS, k=random.randint(1, 5))).title()
+    for i in range(1, N + 1)
+}
+queries = []
+for _ in range(QUERIES):
+    title = titles[random.randint(1, N)].lower()
+    start = random.randint(0, len(title) - 3)
+    queries.append(title[start : start + random.randint(3, 12)])
+
+
+def linear_search(phrase):
+    phrase = phrase.lower()
+    results = [], [], []
+    for song_id, title in titles.items():
+        title = title.lower()
+        if title == phrase:
+            results[0].append(song_id)
+        elif title.startswith(phrase):
+            results[1].append(song_id)
+        elif phrase in title:
+            results[2].append(song_id)
+    return results
+
+
+t = perf_counter()
+index = TitleIndex(titles)
+index.build()  # otherwise built on the second search
+print(f"built index of {N} titles in {perf_counter() - t:.3f}s")
+
+for q in queries[:50]:  # sanity check: same results as the linear scan
+    assert index.search(q) == linear_search(q), q
+
+t = perf_counter()
+for q in queries[:50]:
+    linear_search(q)
+linear = (perf_counter() - t) / 50
+print(f"linear scan:  {linear * 1000:.3f} ms/query")
+
+times = []
+for q in queries:
+    t = perf_counter()
+    index.search(q)
+    times.append(perf_counter() - t)
+times.sort()
+indexed = sum(times) / QUERIES
+print(
+    f"title index:  {indexed * 1000:.3f} ms/query ({linear / indexed:.0f}x), "
+    f"median {times[QUERIES // 2] * 1000:.3f} ms, "
+    f"p95 {times[int(QUERIES * 0.95)] * 1000:.3f} ms"
+)
@@ -0,0 +1,98 @@
+"""
+Benchmark loading songs.json with the typed `maestro.helpers.SONGS_DECODER`
+against the old untyped loader (decode to dicts, then normalize each record),
+measuring load time and peak RSS for synthetic libraries. Each measurement runs
+in its own subprocess so peak RSS isn't shared between cases.
+
+Usage: python benchmark_song_data.py [number_of_songs ...]
+"""
+
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+
+from time import perf_counter
+
+
+def make_library(n, path):
+    random.seed(0)
+    tags = [f"tag{i}" for i in range(50)]
+    songs = {}
+    for i in range(1, n + 1):
+        songs[i] = {
+            "filename": f"Song {i}.mp3",
+            "tags": random.sample(tags, random.randint(0, 5)),
+            "clips": (
+                {"default": [10.0, 40.0]} if random.random() < 0.2 else {}
+            ),
+            "stats": {"2024": random.random() * 1000, "total": 1000.0},
+            "set-clip": "default",
+        }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(songs, f)
+
+
+def old_load(s):
+    import msgspec
+
+    songs = {}
+    for k, v in msgspec.json.decode(s).items():
+        v["tags"] = set(v.get("tags", ()))
+        v["stats"] = {
+            int(year) if year.isdigit() else year: t
+            for year, t in v["stats"].items()
+        }
+        v.setdefault("set-clip", "default")
+        songs[int(k)] = v
+    return songs
+
+
+def new_load(s):
+    from maestro.helpers import SONGS_DECODER
+
+    return SONGS_DECODER.decode(s)
+
+
+def measure(loader, path):
+    with open(path, "rb") as f:
+        s = f.read()
+    # import outside the timed region so only decoding is measured
+    loader(b"{}")
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = perf_counter()
+    songs = loader(s)
+    elapsed = perf_counter() - t
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert len(songs) > 0
+    print(f"{elapsed} {(peak - base) / 1024}")  # ru_maxrss is in KiB on Linux
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        measure({"old": old_load, "new": new_load}[sys.argv[2]], sys.argv[3])
+        sys.exit()
+
+    sizes = [int(n) for n in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"songs-{n}.json")
+            make_library(n, path)
+            results = {}
+            for loader in ("old", "new"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--measure", loader, path],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.split()
+                results[loader] = float(out[0]), float(out[1])
+            (old_t, old_m), (new_t, new_m) = results["old"], results["new"]
+            print(
+                f"{n:>7} songs: old {old_t * 1000:8.1f} ms {old_m:7.1f} MiB | "
+                f"typed {new_t * 1000:8.1f} ms {new_m:7.1f} MiB "
+                f"({old_t / new_t:.1f}x faster)"
+            )
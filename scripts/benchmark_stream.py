@@ -0,0 +1,138 @@
+"""
+Benchmark streaming a song's PCM to FFmpeg, with a local pipe reader standing
+in for FFmpeg: the old loop (copying 256-frame slices of planar PCM with
+`.tobytes()` and relying on FFmpeg's `-re` to read them in real time) against
+`maestro.helpers.PCMWriter` writing zero-copy slices of interleaved PCM, paced
+by its own clock. Reports writes per second, CPU time per second of audio, and
+the writer's jitter and underrun counters, and checks that the reader got
+exactly the song's PCM.
+
+Usage: python benchmark_stream.py [seconds]
+
+Streams a synthetic song for the given number of seconds (default: 5) each
+way. Halfway through, the new writer's producer stalls for longer than the
+queue lasts, which should show up as one underrun.
+"""
+
+import os
+import sys
+import threading
+
+from time import monotonic, process_time, sleep
+
+import numpy as np
+
+from maestro import config
+from maestro.helpers import PCMWriter, PCM16_SCALE, audio_pcm16
+
+
+OLD_CHUNK_SIZE = 256  # frames, what the old loop wrote at a time
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+BYTES_PER_SEC = config.STREAM_SAMPLE_RATE * 4
+
+
+class PipeReader:
+    """Reads everything written to a pipe, optionally at most in real time
+    (like FFmpeg with `-re`)."""
+
+    def __init__(self, real_time):
+        r, w = os.pipe()
+        self.pipe = os.fdopen(w, "wb")  # like subprocess.Popen's stdin
+        self.received = bytearray()
+        self._thread = threading.Thread(
+            target=self._read, args=(r, real_time), daemon=True
+        )
+        self._thread.start()
+
+    def _read(self, fd, real_time):
+        start = monotonic()
+        while True:
+            chunk = os.read(fd, 4096 if real_time else 65536)
+            if not chunk:
+                break
+            self.received += chunk
+            if real_time:
+                ahead = len(self.received) / BYTES_PER_SEC - (
+                    monotonic() - start
+                )
+                if ahead > 0:
+                    sleep(ahead)
+        os.close(fd)
+
+    def close(self):
+        self.pipe.close()
+        self._thread.join()
+
+
+def old_stream(planar, n):
+    reader = PipeReader(real_time=True)
+    writes = 0
+    for fpos in range(0, n, OLD_CHUNK_SIZE):
+        reader.pipe.write(
+            planar[:, fpos : fpos + OLD_CHUNK_SIZE]
+            .reshape((-1,), order="F")
+            .tobytes()
+        )
+        writes += 1
+    reader.close()
+    return reader.received, writes, None
+
+
+def new_stream(pcm, n):
+    reader = PipeReader(real_time=False)
+
+    def write(chunk):
+        reader.pipe.write(chunk)
+        reader.pipe.flush()
+
+    writer = PCMWriter(write)
+    data = memoryview(pcm[:n]).cast("B")
+    chunk_size = config.STREAM_CHUNK_SIZE * 4
+    for start in range(0, len(data), chunk_size):
+        if start == len(data) // 2 // chunk_size * chunk_size:  # stall
+            sleep(
+                config.STREAM_QUEUE_SIZE
+                * config.STREAM_CHUNK_SIZE
+                / config.STREAM_SAMPLE_RATE
+                + 0.5
+            )
+        writer.put(data[start : start + chunk_size])
+    while writer.bytes_written < len(data):
+        sleep(0.01)
+    reader.close()
+    return reader.received, writer.writes, writer
+
+
+def measure(stream, pcm, n):
+    t, cpu = monotonic(), process_time()
+    received, writes, writer = stream(pcm, n)
+    t, cpu = monotonic() - t, process_time() - cpu
+    print(
+        f"{stream.__name__}: {writes / t:6.1f} writes/s, "
+        f"{cpu / (n / config.STREAM_SAMPLE_RATE) * 1000:5.1f} ms CPU/s of "
+        "audio",
+        end="",
+    )
+    if writer is not None:
+        print(
+            f", jitter {writer.mean_jitter * 1000:.2f} ms mean / "
+            f"{writer.max_jitter * 1000:.2f} ms max, "
+            f"{writer.underruns} underrun(s)",
+            end="",
+        )
+    print()
+    return bytes(received)
+
+
+if __name__ == "__main__":
+    config.LOGFILE = os.devnull
+    n = int(SECONDS * config.STREAM_SAMPLE_RATE)
+    rng = np.random.default_rng(0)
+    audio = rng.uniform(-1, 1, (2, n)).astype(np.float32)
+    pcm = audio_pcm16(audio, config.STREAM_SAMPLE_RATE)
+    planar = np.int16(audio * PCM16_SCALE)
+
+    expected = pcm.tobytes()
+    assert measure(old_stream, planar, n) == expected
+    assert measure(new_stream, pcm, n) == expected
+    print("both streams intact")
@@ -0,0 +1,183 @@
+"""
+Benchmark sending stream metadata and artwork on track changes against a local
+HTTP stub server standing in for maestro's: the old way (`requests.post` for
+the artwork, then a new thread per update that posts the metadata, polling
+every 10 ms and retrying every 5 s until it succeeds) against
+`maestro.helpers.MetadataUplink`, which coalesces updates on one thread and
+reuses keep-alive connections. The stub takes LATENCY secs to respond, like a
+remote server, and fails the first few metadata requests with 503. Reports
+the requests and connections the server got, how long the last update took
+to arrive, the CPU time used, and whether the server ended up with the last
+song's metadata.
+
+Usage: python benchmark_uplink.py [track_changes] [failures]
+
+Skips through `track_changes` songs (default: 10), 20 ms apart, while the
+stub fails the first `failures` metadata requests (default: 2).
+"""
+
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, process_time, sleep
+from urllib.parse import parse_qs
+
+from maestro.helpers import MetadataUplink
+
+
+TRACK_CHANGES = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+FAILURES = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+INTERVAL = 0.02  # secs between track changes
+LATENCY = 0.1  # secs the stub takes to respond
+ARTWORK = bytes(300 * 1024)  # about a 1024 px JPEG
+AUTH = ("user", "password")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.lock = threading.Lock()
+        self.reset()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.connections = 0
+            self.failures_left = FAILURES
+            self.song = None  # song in the last metadata update received
+            self.updated = None  # when it was received
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}/{path}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        sleep(LATENCY)
+        status = 200
+        with self.server.lock:
+            self.server.requests += 1
+            if self.path.startswith("/update_metadata"):
+                if self.server.failures_left > 0:
+                    self.server.failures_left -= 1
+                    status = 503
+                else:
+                    self.server.song = parse_qs(body.decode())["song"][0]
+                    self.server.updated = monotonic()
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def metadata(song):
+    return {"mount": AUTH[0], "song": song, "paused": 0}
+
+
+def old_way(server):
+    import requests
+
+    threads = []
+
+    def metadata_loop(song):  # the old icecast_metadata_update_loop
+        success = False
+        last_attempt = 0
+        while not success:
+            if monotonic() - last_attempt > 5:
+                try:
+                    response = requests.post(
+                        server.url("update_metadata"),
+                        data=metadata(song),
+                        auth=AUTH,
+                        timeout=5,
+                    )
+                    if response.ok:
+                        success = True
+                    else:
+                        raise RuntimeError(response.status_code)
+                except Exception:  # pylint: disable=broad-except
+                    last_attempt = monotonic()
+            sleep(0.01)
+
+    def update(song):  # the old update_stream_metadata
+        requests.post(
+            server.url("update_artwork"),
+            params={"mount": AUTH[0]},
+            files={"artwork": ARTWORK},
+            auth=AUTH,
+            timeout=5,
+        )
+        thread = threading.Thread(target=metadata_loop, args=(song,))
+        thread.start()
+        threads.append(thread)
+
+    for i in range(TRACK_CHANGES):
+        thread = threading.Thread(target=update, args=(f"song {i}",))
+        thread.start()
+        threads.append(thread)
+        sleep(INTERVAL)
+    for thread in threads[:]:  # update threads add metadata threads
+        thread.join()
+    for thread in threads:
+        thread.join()
+
+
+def new_way(server):
+    uplink = MetadataUplink()
+    for i in range(TRACK_CHANGES):
+        uplink.put(
+            ("artwork", AUTH[0]),
+            server.url("update_artwork"),
+            params={"mount": AUTH[0]},
+            files={"artwork": ARTWORK},
+            auth=AUTH,
+        )
+        uplink.put(
+            ("metadata", AUTH[0]),
+            server.url("update_metadata"),
+            data=metadata(f"song {i}"),
+            auth=AUTH,
+        )
+        sleep(INTERVAL)
+    uplink.flush()
+    return uplink
+
+
+def measure(name, send, server):
+    server.reset()
+    t, cpu = monotonic(), process_time()
+    uplink = send(server)
+    cpu = process_time() - cpu
+    last_change = t + (TRACK_CHANGES - 1) * INTERVAL
+    print(
+        f"{name}: {server.requests:3} requests, "
+        f"{server.connections:3} connections, last update arrived "
+        f"{server.updated - last_change:5.2f}s after the last track change, "
+        f"{cpu:5.2f}s CPU, server has "
+        f"{server.song!r} ({'OK' if server.song == f'song {TRACK_CHANGES - 1}' else 'stale'})"
+    )
+    if uplink is not None:
+        print(
+            f"  {uplink.sent} sent, {uplink.failed} failed, "
+            f"{uplink.coalesced} coalesced"
+        )
+
+
+if __name__ == "__main__":
+    stub = StubServer()
+    measure("old", old_way, stub)
+    measure("new", new_way, stub)